@@ -0,0 +1,133 @@
+"""
+Throughput and latency percentiles for each MCP tool, measured through the real
+FastAPI app (in-process ASGI transport) against the fake Qlik tenant.
+
+    python -m benchmarks.bench_tools --requests 200 --concurrency 8 --latency-ms 5 --output before.json
+    # ... change ...
+    python -m benchmarks.bench_tools --requests 200 --concurrency 8 --latency-ms 5 --baseline before.json
+
+The shared cache is off by default so every call reaches the (fake) Engine;
+pass --cache to measure the cached path.
+"""
+import argparse
+import asyncio
+import os
+import platform
+import tempfile
+import time
+from typing import Any, Dict, List, Tuple
+
+import httpx
+
+from benchmarks.common import fake_qlik_server, load_json, print_table, summarize, write_json
+from benchmarks.fake_qlik import app_item_id, app_resource_id
+
+BENCH_TOKEN = "bench-token-0123456789"
+
+
+def scenarios(page_size: int, max_rows: int) -> Dict[str, Tuple[str, Dict[str, Any]]]:
+    app_id = app_resource_id(0)
+    return {
+        "qlik_get_apps": ("qlik_get_apps", {"limit": 20}),
+        "qlik_get_app_sheets": ("qlik_get_app_sheets", {"appId": app_id}),
+        "qlik_get_app_sheets[itemId]": ("qlik_get_app_sheets", {"appId": app_item_id(0)}),
+        "qlik_get_sheet_charts": ("qlik_get_sheet_charts", {"appId": app_id, "sheetId": "sheet-0"}),
+        "qlik_get_chart_data": ("qlik_get_chart_data", {"appId": app_id, "objectId": "sheet-0-chart-0", "pageSize": page_size}),
+        "qlik_get_chart_data[maxRows]": ("qlik_get_chart_data", {
+            "appId": app_id, "objectId": "sheet-0-chart-1", "pageSize": page_size, "maxRows": max_rows, "includeMeta": True,
+        }),
+    }
+
+
+async def run_scenario(client: httpx.AsyncClient, tool: str, arguments: Dict[str, Any],
+                       requests: int, concurrency: int, warmup: int) -> Dict[str, Any]:
+    latencies: List[float] = []
+    errors = 0
+    counter = 0
+
+    async def call(request_id: int) -> bool:
+        body = {"jsonrpc": "2.0", "id": request_id, "method": "tools/call", "params": {"name": tool, "arguments": arguments}}
+        response = await client.post("/mcp", json=body, headers={"X-API-KEY": BENCH_TOKEN})
+        if response.status_code != 200:
+            return False
+        payload = response.json()
+        return "error" not in payload and not (payload.get("result") or {}).get("isError")
+
+    for i in range(warmup):
+        await call(-i - 1)
+
+    async def worker():
+        nonlocal errors, counter
+        while counter < requests:
+            counter += 1
+            started = time.perf_counter()
+            ok = await call(counter)
+            if ok:
+                latencies.append(time.perf_counter() - started)
+            else:
+                errors += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return summarize(latencies, errors, time.perf_counter() - started)
+
+
+async def run(args: argparse.Namespace, tenant_url: str) -> Dict[str, Any]:
+    os.environ["QLIK_CLOUD_TENANT_URL"] = tenant_url
+    os.environ.setdefault("LOG_LEVEL", "WARNING")
+    os.environ["MCP_CACHE_ENABLED"] = "true" if args.cache else "false"
+    os.environ.setdefault("MCP_CACHE_DB_PATH", os.path.join(tempfile.mkdtemp(prefix="mcp-bench-"), "cache.db"))
+    # Importado só depois do ambiente configurado: os clients leem as variáveis no __init__
+    from src.main import app
+
+    selected = scenarios(args.page_size, args.max_rows)
+    if args.only:
+        selected = {name: s for name, s in selected.items() if any(o in name for o in args.only)}
+    results: Dict[str, Any] = {}
+    transport = httpx.ASGITransport(app=app)
+    # O ASGITransport não dispara o lifespan (que cria o MCPHandler)
+    async with app.router.lifespan_context(app), \
+            httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=120.0) as client:
+        for name, (tool, arguments) in selected.items():
+            results[name] = await run_scenario(client, tool, arguments, args.requests, args.concurrency, args.warmup)
+            print(f"  {name}: {results[name]['throughput_rps']} req/s, p95 {results[name]['p95_ms']} ms", flush=True)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark each MCP tool against a fake Qlik tenant")
+    parser.add_argument("--requests", type=int, default=100, help="measured calls per scenario")
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--warmup", type=int, default=3)
+    parser.add_argument("--latency-ms", type=float, default=2.0, help="fake Engine/REST latency per request")
+    parser.add_argument("--rows", type=int, default=1000, help="rows in each fake hypercube")
+    parser.add_argument("--page-size", type=int, default=500)
+    parser.add_argument("--max-rows", type=int, default=200)
+    parser.add_argument("--cache", action="store_true", help="enable the shared cache")
+    parser.add_argument("--only", nargs="*", help="run only scenarios whose name contains one of these")
+    parser.add_argument("--tenant-url", help="use an already running fake (or real) tenant instead of starting one")
+    parser.add_argument("--output", help="write results as JSON (use as --baseline later)")
+    parser.add_argument("--baseline", help="JSON from a previous run to compare against")
+    args = parser.parse_args()
+
+    fake_args = ["--latency-ms", str(args.latency_ms), "--rows", str(args.rows)]
+    print(f"Benchmark: {args.requests} requests x concurrency {args.concurrency}, "
+          f"Engine latency {args.latency_ms} ms, {args.rows} rows, cache {'on' if args.cache else 'off'}")
+    if args.tenant_url:
+        results = asyncio.run(run(args, args.tenant_url))
+    else:
+        with fake_qlik_server(fake_args) as url:
+            results = asyncio.run(run(args, url))
+
+    baseline = load_json(args.baseline)
+    print()
+    print_table(results, (baseline or {}).get("scenarios"))
+    write_json(args.output, {
+        "settings": {k: v for k, v in vars(args).items() if k not in ("output", "baseline")},
+        "python": platform.python_version(),
+        "scenarios": results,
+    })
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+"""Helpers shared by the benchmark scripts: fake tenant process, percentiles, reports."""
+import contextlib
+import json
+import math
+import os
+import socket
+import subprocess
+import sys
+import time
+from typing import Any, Dict, Iterator, List, Optional, Sequence
+
+import httpx
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+@contextlib.contextmanager
+def fake_qlik_server(extra_args: Sequence[str] = (), startup_timeout: float = 15.0) -> Iterator[str]:
+    """Run benchmarks.fake_qlik in a subprocess (own CPU, no GIL sharing) and yield its base URL."""
+    port = free_port()
+    cmd = [sys.executable, "-m", "benchmarks.fake_qlik", "--port", str(port), *extra_args]
+    process = subprocess.Popen(cmd, cwd=ROOT_DIR)
+    url = f"http://127.0.0.1:{port}"
+    try:
+        deadline = time.monotonic() + startup_timeout
+        while True:
+            try:
+                if httpx.get(f"{url}/health", timeout=1.0).status_code == 200:
+                    break
+            except httpx.HTTPError:
+                pass
+            if process.poll() is not None or time.monotonic() > deadline:
+                raise RuntimeError(f"fake Qlik server did not start: {' '.join(cmd)}")
+            time.sleep(0.1)
+        yield url
+    finally:
+        process.terminate()
+        try:
+            process.wait(timeout=5)
+        except subprocess.TimeoutExpired:
+            process.kill()
+
+
+def percentile(sorted_values: List[float], pct: float) -> float:
+    """Nearest-rank percentile of an already sorted list (0 when empty)."""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, math.ceil(pct / 100 * len(sorted_values)))
+    return sorted_values[rank - 1]
+
+
+def summarize(latencies: List[float], errors: int, elapsed: float) -> Dict[str, Any]:
+    """Latencies in seconds -> throughput and percentiles in ms."""
+    values = sorted(latencies)
+    total = len(values) + errors
+    return {
+        "requests": total,
+        "errors": errors,
+        "error_rate": round(errors / total, 4) if total else 0.0,
+        "throughput_rps": round(total / elapsed, 2) if elapsed > 0 else 0.0,
+        "mean_ms": round(sum(values) / len(values) * 1000, 2) if values else 0.0,
+        "p50_ms": round(percentile(values, 50) * 1000, 2),
+        "p95_ms": round(percentile(values, 95) * 1000, 2),
+        "p99_ms": round(percentile(values, 99) * 1000, 2),
+        "max_ms": round(values[-1] * 1000, 2) if values else 0.0,
+    }
+
+
+def print_table(rows: Dict[str, Dict[str, Any]], baseline: Optional[Dict[str, Dict[str, Any]]] = None):
+    columns = ["requests", "errors", "throughput_rps", "p50_ms", "p95_ms", "p99_ms", "max_ms"]
+    name_width = max([len(n) for n in rows] + [10])
+    print(f"{'scenario':<{name_width}}  " + "  ".join(f"{c:>14}" for c in columns))
+    for name, stats in rows.items():
+        cells = []
+        for c in columns:
+            cell = f"{stats.get(c, 0)}"
+            base = (baseline or {}).get(name, {}).get(c)
+            if base and c.endswith(("_ms", "_rps")):
+                cell += f" ({(stats[c] - base) / base * 100:+.0f}%)"
+            cells.append(f"{cell:>14}")
+        print(f"{name:<{name_width}}  " + "  ".join(cells))
+
+
+def load_json(path: Optional[str]) -> Optional[Dict[str, Any]]:
+    if not path:
+        return None
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def write_json(path: Optional[str], data: Dict[str, Any]):
+    if not path:
+        return
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(data, f, indent=2)
@@ -0,0 +1,337 @@
+"""
+Local stand-in for a Qlik Cloud tenant, used by the benchmarks.
+
+Serves the Engine API WebSocket (/app/{app_id}/, also with /identity/{identity}) speaking the subset of QIX the
+server uses (OpenDoc, CreateSessionObject, GetObject, GetLayout, GetProperties,
+GetAppLayout, GetHyperCubeData, GetHyperCubePivotData, GetHyperCubeStackData,
+GetListObjectData, SearchListObjectFor, AbortListObjectSearch) and
+the REST items API (/api/v1/items, /api/v1/users/me). Chart ids ending in "-pivot" / "-stacked" are
+pivot (qMode P, Dim0 on the left, Dim1 on top) / stacked (qMode K, each Dim0 row holding
+stack_values values of every inner dimension) objects.
+POST /_admin/reload/{app_id} simulates a reload (bumps the app's reload time).
+Everything is generated deterministically from the settings below, so runs
+are comparable.
+
+    python -m benchmarks.fake_qlik --port 9900 --latency-ms 5 --rows 5000
+
+Then point the server at it with QLIK_CLOUD_TENANT_URL=http://127.0.0.1:9900.
+"""
+import argparse
+import asyncio
+import json
+import os
+import time
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional
+
+import uvicorn
+from fastapi import FastAPI, HTTPException, WebSocket, WebSocketDisconnect
+
+
+@dataclass
+class FakeQlikSettings:
+    latency_ms: float = 0.0       # latência por request QIX/REST (simula o Engine)
+    apps: int = 20
+    sheets: int = 5               # sheets por app
+    charts: int = 6               # charts por sheet
+    rows: int = 1000              # linhas de cada hypercube
+    dimensions: int = 2
+    measures: int = 2
+    reload_time: str = "2024-01-01T00:00:00.000Z"
+    pivot_columns: int = 3        # valores de Dim1 no topo dos pivots
+    stack_values: int = 3         # valores de cada dimensão interna por linha dos empilhados
+
+    @classmethod
+    def from_env(cls) -> "FakeQlikSettings":
+        def num(name: str, default: float) -> float:
+            return float(os.getenv(name, default))
+        return cls(
+            latency_ms=num("FAKE_QLIK_LATENCY_MS", cls.latency_ms),
+            apps=int(num("FAKE_QLIK_APPS", cls.apps)),
+            sheets=int(num("FAKE_QLIK_SHEETS", cls.sheets)),
+            charts=int(num("FAKE_QLIK_CHARTS", cls.charts)),
+            rows=int(num("FAKE_QLIK_ROWS", cls.rows)),
+            dimensions=int(num("FAKE_QLIK_DIMENSIONS", cls.dimensions)),
+            measures=int(num("FAKE_QLIK_MEASURES", cls.measures)),
+        )
+
+
+# Títulos dos charts (para buscas no índice de objetos)
+CHART_TITLES = ["Valores por fornecedor", "Vendas por mês", "Estoque por produto", "Preço médio por região", "Margem por cliente", "Pedidos em aberto"]
+
+
+def app_resource_id(index: int) -> str:
+    return f"00000000-0000-4000-8000-{index:012d}"
+
+
+def app_item_id(index: int) -> str:
+    return f"{index:024x}"
+
+
+class FakeEngineSession:
+    """One WebSocket session: handles map to the objects opened on it."""
+    DOC_HANDLE = 1
+
+    def __init__(self, app_id: str, settings: FakeQlikSettings, reload_times: Optional[Dict[str, str]] = None):
+        self.app_id = app_id
+        self.settings = settings
+        self.reload_times = reload_times if reload_times is not None else {}
+        self.handles: Dict[int, Dict[str, Any]] = {}
+        self._next_handle = 2
+
+    def _new_handle(self, obj: Dict[str, Any]) -> int:
+        handle = self._next_handle
+        self._next_handle += 1
+        self.handles[handle] = obj
+        return handle
+
+    def handle(self, method: str, params: Any, handle: int) -> Dict[str, Any]:
+        obj = self.handles.get(handle, {})
+        if method == "OpenDoc":
+            return {"qReturn": {"qType": "Doc", "qHandle": self.DOC_HANDLE, "qGenericId": self.app_id}}
+        if method == "GetAppLayout":
+            return {"qLayout": {"qTitle": self.app_id, "qLastReloadTime": self.reload_times.get(self.app_id, self.settings.reload_time)}}
+        if method == "CreateSessionObject":
+            definition = params[0] if isinstance(params, list) and params else {}
+            kind = "list" if "qListObjectDef" in definition else "session"
+            new_handle = self._new_handle({"kind": kind, "def": definition})
+            return {"qReturn": {"qType": "GenericObject", "qHandle": new_handle}}
+        if method == "GetObject":
+            object_id = params[0] if isinstance(params, list) and params else params.get("qId")
+            kind = "chart" if "-chart-" in str(object_id) else "sheet"
+            new_handle = self._new_handle({"kind": kind, "id": object_id})
+            return {"qReturn": {"qType": "GenericObject", "qHandle": new_handle, "qGenericId": object_id}}
+        if method == "GetProperties":
+            return {"qProp": self._properties(obj)}
+        if method == "GetLayout":
+            return {"qLayout": self._layout(obj)}
+        if method == "GetHyperCubeData":
+            pages = params[1] if isinstance(params, list) and len(params) > 1 else params.get("qPages", [])
+            return {"qDataPages": [self._page(p) for p in pages]}
+        if method == "GetListObjectData":
+            values = self._field_values(obj)
+            matrix = []
+            for p in params[1]:
+                top = int(p.get("qTop", 0))
+                matrix += [[{"qText": v, "qNum": "NaN", "qElemNumber": top + i, "qState": "O"}]
+                           for i, v in enumerate(values[top:top + int(p.get("qHeight", 0))])]
+            return {"qDataPages": [{"qMatrix": matrix}]}
+        if method == "SearchListObjectFor":
+            # Modo de busca: o list object passa a ter só os valores encontrados
+            obj["search"] = params[1]
+            return {"qSuccess": True}
+        if method == "AbortListObjectSearch":
+            obj.pop("search", None)
+            return {}
+        if method == "GetHyperCubePivotData":
+            return {"qDataPages": [self._pivot_page(p) for p in params[1]]}
+        if method == "GetHyperCubeStackData":
+            return {"qDataPages": [self._stack_page(p, int(params[2]) if len(params) > 2 else 0) for p in params[1]]}
+        raise KeyError(method)
+
+    def _sheet_ids(self) -> List[str]:
+        return [f"sheet-{i}" for i in range(self.settings.sheets)]
+
+    def _field_values(self, obj: Dict[str, Any]) -> Optional[List[str]]:
+        """Values of a list object's field (DimN has D{N}-0 .. D{N}-{rows-1}), only the matches while searching; None if there is no such field."""
+        field = obj["def"]["qListObjectDef"]["qDef"]["qFieldDefs"][0]
+        if not field.startswith("Dim") or not field[3:].isdigit() or int(field[3:]) >= self.settings.dimensions:
+            return None
+        values = sorted(f"D{field[3:]}-{row}" for row in range(self.settings.rows))
+        term = (obj.get("search") or "").lower()
+        return [v for v in values if term in v.lower()] if term else values
+
+    def _properties(self, obj: Dict[str, Any]) -> Dict[str, Any]:
+        if obj.get("kind") == "sheet":
+            cells = [{"name": f"{obj['id']}-chart-{i}", "type": "table"} for i in range(self.settings.charts)]
+            return {"qInfo": {"qId": obj["id"], "qType": "sheet"}, "cells": cells}
+        return {"qInfo": {"qId": obj.get("id"), "qType": "table"}, "qHyperCubeDef": {}}
+
+    def _layout(self, obj: Dict[str, Any]) -> Dict[str, Any]:
+        if obj.get("kind") == "list":
+            values = self._field_values(obj)
+            if values is None:
+                return {"qListObject": {"qDimensionInfo": {"qError": {"qErrorCode": 7}}, "qSize": {"qcx": 0, "qcy": 0}}}
+            return {"qListObject": {"qDimensionInfo": {"qCardinal": len(values)}, "qSize": {"qcx": 1, "qcy": len(values)}}}
+        if obj.get("kind") == "session":
+            items = [{"qInfo": {"qId": s, "qType": "sheet"}, "qMeta": {"title": f"Sheet {s}"}, "qData": {"id": s}} for s in self._sheet_ids()]
+            return {"qAppObjectList": {"qItems": items}}
+        if obj.get("kind") == "sheet":
+            children = [{"qInfo": {"qId": f"{obj['id']}-chart-{i}"}} for i in range(self.settings.charts)]
+            return {"qInfo": {"qId": obj["id"]}, "qChildList": {"qItems": children}}
+        s = self.settings
+        hypercube = {
+            "qMode": "S",
+            "qSize": {"qcx": s.dimensions + s.measures, "qcy": s.rows},
+            "qDimensionInfo": [{"qFallbackTitle": f"Dim{i}", "qCardinal": s.rows} for i in range(s.dimensions)],
+            "qMeasureInfo": [{"qFallbackTitle": f"Measure{i}", "qMin": 0, "qMax": s.rows * (i + 1)} for i in range(s.measures)],
+            "qGrandTotalRow": [{"qText": str(s.rows * (i + 1)), "qNum": s.rows * (i + 1)} for i in range(s.measures)],
+        }
+        object_id = str(obj.get("id"))
+        if object_id.endswith("-pivot"):
+            hypercube.update(qMode="P", qNoOfLeftDims=1, qSize={"qcx": s.pivot_columns * s.measures, "qcy": s.rows})
+        elif object_id.endswith("-stacked"):
+            hypercube.update(qMode="K")
+        chart = int(object_id.split("-chart-")[-1].split("-")[0]) if "-chart-" in object_id else 0
+        return {
+            "qInfo": {"qId": obj.get("id"), "qType": "table"},
+            "visualization": {"P": "pivot-table", "K": "barchart"}.get(hypercube["qMode"], "table"),
+            "title": CHART_TITLES[chart % len(CHART_TITLES)],
+            "qSelectionInfo": {},
+            "qHyperCube": hypercube,
+        }
+
+    def _page(self, page: Dict[str, Any]) -> Dict[str, Any]:
+        s = self.settings
+        top = int(page.get("qTop", 0))
+        bottom = min(top + int(page.get("qHeight", 0)), s.rows)
+        matrix = []
+        for row in range(top, bottom):
+            cells = [{"qText": f"D{d}-{row}", "qNum": "NaN", "qElemNumber": row, "qState": "O"} for d in range(s.dimensions)]
+            cells += [{"qText": f"{row * (m + 1):.2f}", "qNum": row * (m + 1), "qElemNumber": 0, "qState": "L"} for m in range(s.measures)]
+            matrix.append(cells)
+        return {
+            "qMatrix": matrix,
+            "qArea": {"qLeft": 0, "qTop": top, "qWidth": s.dimensions + s.measures, "qHeight": bottom - top},
+        }
+
+
+    def _pivot_page(self, page: Dict[str, Any]) -> Dict[str, Any]:
+        s = self.settings
+        top = int(page.get("qTop", 0))
+        bottom = min(top + int(page.get("qHeight", 0)), s.rows)
+        columns = [
+            {"qText": f"D1-{c}", "qElemNo": c, "qValue": "NaN", "qType": "N",
+             "qSubNodes": [{"qText": f"Measure{m}", "qElemNo": m, "qType": "P"} for m in range(s.measures)]}
+            for c in range(s.pivot_columns)
+        ]
+        left = [{"qText": f"D0-{row}", "qElemNo": row, "qValue": "NaN", "qType": "N", "qCanExpand": True} for row in range(top, bottom)]
+        data = [
+            [{"qText": f"{row * (m + 1) + c:.2f}", "qNum": row * (m + 1) + c, "qType": "V"}
+             for c in range(s.pivot_columns) for m in range(s.measures)]
+            for row in range(top, bottom)
+        ]
+        width = s.pivot_columns * s.measures
+        return {"qLeft": left, "qTop": columns, "qData": data, "qArea": {"qLeft": 0, "qTop": top, "qWidth": width, "qHeight": bottom - top}}
+
+    def _stack_page(self, page: Dict[str, Any], max_cells: int = 0) -> Dict[str, Any]:
+        s = self.settings
+        top = int(page.get("qTop", 0))
+        bottom = min(top + int(page.get("qHeight", 0)), s.rows)
+        if max_cells:
+            # Como o Engine: qMaxNbrCells limita as células da página, que volta com menos linhas de fora
+            row_cells = s.stack_values ** max(0, s.dimensions - 1) * (s.dimensions + s.measures)
+            bottom = min(bottom, top + max(1, max_cells // row_cells))
+
+        def node(d: int, row: int, path: str = "", value: int = 0) -> Dict[str, Any]:
+            # Linha de fora = um valor de Dim0; cada dimensão interna abre stack_values nós (D1-{row}-{i})
+            if d + 1 < s.dimensions:
+                children = [node(d + 1, row, f"{path}-{i}", i) for i in range(s.stack_values)]
+            else:
+                children = [
+                    {"qText": f"{row * (m + 1) + value:.2f}", "qValue": row * (m + 1) + value, "qType": "V"}
+                    for m in range(s.measures)
+                ]
+            return {"qText": f"D{d}-{row}{path}", "qElemNo": row, "qValue": "NaN", "qType": "N", "qSubNodes": children}
+
+        root = {"qType": "R", "qSubNodes": [node(0, row) for row in range(top, bottom)]}
+        return {"qData": [root], "qArea": {"qLeft": 0, "qTop": top, "qWidth": s.dimensions + s.measures, "qHeight": bottom - top}}
+
+
+def create_app(settings: Optional[FakeQlikSettings] = None) -> FastAPI:
+    settings = settings or FakeQlikSettings.from_env()
+    app = FastAPI(title="Fake Qlik Cloud")
+    # resourceId -> qLastReloadTime dos apps "recarregados" via POST /_admin/reload/{app_id}
+    reload_times: Dict[str, str] = {}
+
+    async def delay():
+        if settings.latency_ms > 0:
+            await asyncio.sleep(settings.latency_ms / 1000)
+
+    def item(index: int) -> Dict[str, Any]:
+        reload_time = reload_times.get(app_resource_id(index), settings.reload_time)
+        return {
+            "id": app_item_id(index),
+            "resourceId": app_resource_id(index),
+            "resourceType": "app",
+            "name": f"Bench App {index}",
+            "updatedAt": reload_time,
+            "resourceAttributes": {"lastReloadTime": reload_time},
+        }
+
+    @app.get("/health")
+    async def health():
+        return {"status": "ok"}
+
+    @app.get("/api/v1/items")
+    async def list_items(limit: int = 10, name: Optional[str] = None, resourceId: Optional[str] = None):
+        await delay()
+        data = [item(i) for i in range(settings.apps)]
+        if resourceId:
+            data = [d for d in data if d["resourceId"] == resourceId]
+        if name:
+            data = [d for d in data if name.lower() in d["name"].lower()]
+        return {"data": data[:limit], "links": {}}
+
+    @app.get("/api/v1/items/{item_id}")
+    async def get_item(item_id: str):
+        await delay()
+        for i in range(settings.apps):
+            if app_item_id(i) == item_id:
+                return item(i)
+        raise HTTPException(status_code=404, detail="item not found")
+
+    @app.get("/api/v1/users/me")
+    async def users_me():
+        await delay()
+        return {"id": "bench-user", "tenantId": "bench-tenant", "name": "Bench User"}
+
+    @app.post("/_admin/reload/{app_id}")
+    async def reload_app(app_id: str):
+        """Simulate a reload: bumps the app's qLastReloadTime / lastReloadTime."""
+        reload_times[app_id] = time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime()) + f".{time.time_ns() % 1_000_000_000 // 1_000_000:03d}Z"
+        return {"qLastReloadTime": reload_times[app_id]}
+
+    @app.websocket("/app/{app_id}/")
+    @app.websocket("/app/{app_id}/identity/{identity}")
+    async def engine(websocket: WebSocket, app_id: str, identity: str = ""):
+        await websocket.accept()
+        session = FakeEngineSession(app_id, settings, reload_times)
+        try:
+            while True:
+                request = json.loads(await websocket.receive_text())
+                await delay()
+                response: Dict[str, Any] = {"jsonrpc": "2.0", "id": request.get("id")}
+                try:
+                    response["result"] = session.handle(request.get("method"), request.get("params"), request.get("handle", -1))
+                except KeyError:
+                    response["error"] = {"code": -32601, "message": f"Method not found: {request.get('method')}"}
+                await websocket.send_text(json.dumps(response, separators=(",", ":")))
+        except WebSocketDisconnect:
+            pass
+
+    return app
+
+
+def main():
+    defaults = FakeQlikSettings.from_env()
+    parser = argparse.ArgumentParser(description="Fake Qlik Cloud tenant (Engine WebSocket + REST items)")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9900)
+    parser.add_argument("--latency-ms", type=float, default=defaults.latency_ms)
+    parser.add_argument("--apps", type=int, default=defaults.apps)
+    parser.add_argument("--sheets", type=int, default=defaults.sheets)
+    parser.add_argument("--charts", type=int, default=defaults.charts)
+    parser.add_argument("--rows", type=int, default=defaults.rows)
+    parser.add_argument("--dimensions", type=int, default=defaults.dimensions)
+    parser.add_argument("--measures", type=int, default=defaults.measures)
+    args = parser.parse_args()
+    settings = FakeQlikSettings(
+        latency_ms=args.latency_ms, apps=args.apps, sheets=args.sheets, charts=args.charts,
+        rows=args.rows, dimensions=args.dimensions, measures=args.measures,
+    )
+    uvicorn.run(create_app(settings), host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,303 @@
+"""
+In-process stand-in for a Redis server (RESP2 over TCP), for testing and
+benchmarking MCP_STORAGE_BACKEND=redis without a real Redis.
+
+Implements only the commands the storage backends use: PING, AUTH, SELECT,
+GET, SET (PX/EX/NX), DEL, EXISTS, PEXPIRE/EXPIRE (NX/GT), PTTL, SADD, SMEMBERS,
+HSET, HMGET, HGETALL, ZADD (NX/XX), ZREM, ZRANGEBYSCORE (LIMIT), FLUSHALL, INFO,
+and EVAL of the scripts the backends send (emulated in Python, no Lua).
+--redis-version 6.2.14 makes it reply like an older server (no PEXPIRE NX/GT).
+
+    python -m benchmarks.fake_redis --port 6390
+    MCP_STORAGE_BACKEND=redis MCP_REDIS_URL=redis://127.0.0.1:6390/0 python run.py
+
+Or in-process:
+
+    async with FakeRedisServer() as url:
+        ...
+"""
+import argparse
+import asyncio
+import bisect
+import time
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+from src.storage.redis_client import COMPARE_AND_DELETE_SCRIPT
+
+
+class _Error(Exception):
+    pass
+
+
+class FakeRedis:
+    """The keyspace: key -> (type, value); expirations in time.monotonic()."""
+
+    def __init__(self, version: str = "7.2.4"):
+        self.version = version
+        self.data: Dict[str, Tuple[str, Any]] = {}
+        self.expires: Dict[str, float] = {}
+
+    def _alive(self, key: str) -> Optional[Tuple[str, Any]]:
+        expires_at = self.expires.get(key)
+        if expires_at is not None and time.monotonic() >= expires_at:
+            self.data.pop(key, None)
+            self.expires.pop(key, None)
+        return self.data.get(key)
+
+    def _typed(self, key: str, kind: str, create: bool = False) -> Any:
+        entry = self._alive(key)
+        if entry is None:
+            if not create:
+                return None
+            value: Any = {"set": set, "hash": dict, "zset": dict}[kind]()
+            self.data[key] = (kind, value)
+            return value
+        if entry[0] != kind:
+            raise _Error("WRONGTYPE Operation against a key holding the wrong kind of value")
+        return entry[1]
+
+    def execute(self, args: List[str]) -> Any:
+        name = args[0].upper()
+        handler = getattr(self, f"cmd_{name.lower()}", None)
+        if handler is None:
+            raise _Error(f"ERR unknown command '{name}'")
+        return handler(*args[1:])
+
+    def cmd_eval(self, script, numkeys, *args):
+        keys, argv = args[:int(numkeys)], args[int(numkeys):]
+        if script == COMPARE_AND_DELETE_SCRIPT:
+            return self.cmd_del(keys[0]) if self.cmd_get(keys[0]) == argv[0] else 0
+        raise _Error("ERR unsupported script (the fake Redis only emulates the storage backends' scripts)")
+
+    def cmd_ping(self, *args):
+        return "PONG"
+
+    def cmd_auth(self, *args):
+        return "OK"
+
+    def cmd_select(self, db):
+        return "OK"
+
+    def cmd_info(self, *sections):
+        return f"# Server\r\nredis_version:{self.version}\r\n"
+
+    def cmd_flushall(self, *args):
+        self.data.clear()
+        self.expires.clear()
+        return "OK"
+
+    def cmd_get(self, key):
+        entry = self._alive(key)
+        if entry is None:
+            return None
+        if entry[0] != "string":
+            raise _Error("WRONGTYPE Operation against a key holding the wrong kind of value")
+        return entry[1]
+
+    def cmd_set(self, key, value, *options):
+        opts = [o.upper() for o in options]
+        if "NX" in opts and self._alive(key) is not None:
+            return None
+        self.data[key] = ("string", value)
+        self.expires.pop(key, None)
+        for unit, scale in (("PX", 1000), ("EX", 1)):
+            if unit in opts:
+                self.expires[key] = time.monotonic() + float(options[opts.index(unit) + 1]) / scale
+        return "OK"
+
+    def cmd_del(self, *keys):
+        removed = 0
+        for key in keys:
+            if self._alive(key) is not None:
+                removed += 1
+            self.data.pop(key, None)
+            self.expires.pop(key, None)
+        return removed
+
+    def cmd_exists(self, *keys):
+        return sum(1 for key in keys if self._alive(key) is not None)
+
+    def cmd_pexpire(self, key, ms, *options):
+        if options and int(self.version.split(".", 1)[0]) < 7:
+            raise _Error("ERR wrong number of arguments for 'pexpire' command")
+        if self._alive(key) is None:
+            return 0
+        new = time.monotonic() + float(ms) / 1000
+        current = self.expires.get(key)
+        opts = {o.upper() for o in options}
+        if "NX" in opts and current is not None:
+            return 0
+        # Sem TTL conta como infinito: GT nunca se aplica
+        if "GT" in opts and (current is None or new <= current):
+            return 0
+        self.expires[key] = new
+        return 1
+
+    def cmd_pttl(self, key):
+        if self._alive(key) is None:
+            return -2
+        expires_at = self.expires.get(key)
+        return -1 if expires_at is None else max(0, int((expires_at - time.monotonic()) * 1000))
+
+    def cmd_expire(self, key, seconds, *options):
+        return self.cmd_pexpire(key, float(seconds) * 1000, *options)
+
+    def cmd_sadd(self, key, *members):
+        value = self._typed(key, "set", create=True)
+        before = len(value)
+        value.update(members)
+        return len(value) - before
+
+    def cmd_smembers(self, key):
+        return sorted(self._typed(key, "set") or ())
+
+    def cmd_hset(self, key, *pairs):
+        value = self._typed(key, "hash", create=True)
+        added = 0
+        for field, v in zip(pairs[::2], pairs[1::2]):
+            added += field not in value
+            value[field] = v
+        return added
+
+    def cmd_hmget(self, key, *fields):
+        value = self._typed(key, "hash") or {}
+        return [value.get(f) for f in fields]
+
+    def cmd_hgetall(self, key):
+        value = self._typed(key, "hash") or {}
+        return [x for pair in value.items() for x in pair]
+
+    def cmd_zadd(self, key, *args):
+        flags = set()
+        while args and args[0].upper() in ("NX", "XX"):
+            flags.add(args[0].upper())
+            args = args[1:]
+        value = self._typed(key, "zset", create=True)
+        added = 0
+        for score, member in zip(args[::2], args[1::2]):
+            if ("NX" in flags and member in value) or ("XX" in flags and member not in value):
+                continue
+            added += member not in value
+            value[member] = float(score)
+        return added
+
+    def cmd_zrem(self, key, *members):
+        value = self._typed(key, "zset") or {}
+        return sum(1 for m in members if value.pop(m, None) is not None)
+
+    def cmd_zrangebyscore(self, key, low, high, *options):
+        value = self._typed(key, "zset") or {}
+
+        def bound(text: str) -> float:
+            return {"-inf": float("-inf"), "+inf": float("inf"), "inf": float("inf")}.get(text.lower(), None) or float(text)
+
+        lo, hi = bound(low), bound(high)
+        ordered = sorted((score, member) for member, score in value.items())
+        start = bisect.bisect_left(ordered, (lo, ""))
+        result = [m for s, m in ordered[start:] if s <= hi]
+        opts = [o.upper() for o in options]
+        if "LIMIT" in opts:
+            i = opts.index("LIMIT")
+            offset, count = int(options[i + 1]), int(options[i + 2])
+            result = result[offset:] if count < 0 else result[offset:offset + count]
+        return result
+
+
+def _encode(value: Any) -> bytes:
+    if value is None:
+        return b"$-1\r\n"
+    if isinstance(value, _Error):
+        return b"-%s\r\n" % str(value).encode()
+    if isinstance(value, bool):
+        value = int(value)
+    if isinstance(value, int):
+        return b":%d\r\n" % value
+    if isinstance(value, list):
+        return b"*%d\r\n" % len(value) + b"".join(_encode(v) for v in value)
+    if value in ("OK", "PONG"):
+        return b"+%s\r\n" % value.encode()
+    data = str(value).encode("utf-8")
+    return b"$%d\r\n%s\r\n" % (len(data), data)
+
+
+class FakeRedisServer:
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, version: str = "7.2.4"):
+        self.host = host
+        self.port = port
+        self.store = FakeRedis(version)
+        self.commands = 0
+        self._server: Optional[asyncio.AbstractServer] = None
+        self._handlers: Set[asyncio.Task] = set()
+
+    @property
+    def url(self) -> str:
+        return f"redis://{self.host}:{self.port}/0"
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        task = asyncio.current_task()
+        self._handlers.add(task)
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                if not line.startswith(b"*"):
+                    raise ConnectionError("inline commands are not supported")
+                args = []
+                for _ in range(int(line[1:-2])):
+                    length = int((await reader.readline())[1:-2])
+                    args.append((await reader.readexactly(length + 2))[:-2].decode("utf-8"))
+                self.commands += 1
+                try:
+                    reply = self.store.execute(args)
+                except _Error as e:
+                    reply = e
+                except (TypeError, ValueError, IndexError):
+                    reply = _Error(f"ERR wrong arguments for '{args[0]}' command")
+                writer.write(_encode(reply))
+                # Respostas de um pipeline saem juntas quando não há mais comandos no buffer
+                if not reader._buffer:  # noqa: SLF001
+                    await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError, asyncio.CancelledError):
+            pass
+        finally:
+            self._handlers.discard(task)
+            writer.close()
+
+    async def start(self) -> str:
+        self._server = await asyncio.start_server(self._handle, self.host, self.port)
+        self.port = self._server.sockets[0].getsockname()[1]
+        return self.url
+
+    async def stop(self):
+        if self._server is not None:
+            self._server.close()
+            for task in list(self._handlers):
+                task.cancel()
+            await asyncio.gather(*self._handlers, return_exceptions=True)
+            await self._server.wait_closed()
+
+    async def __aenter__(self) -> str:
+        return await self.start()
+
+    async def __aexit__(self, *exc):
+        await self.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="In-process Redis stand-in (RESP2)")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=6390)
+    parser.add_argument("--redis-version", default="7.2.4", help="Version reported by INFO (< 7 rejects PEXPIRE NX/GT)")
+    args = parser.parse_args()
+
+    async def serve():
+        server = FakeRedisServer(args.host, args.port, version=args.redis_version)
+        print(f"Fake Redis listening on {await server.start()}", flush=True)
+        await asyncio.Event().wait()
+
+    asyncio.run(serve())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,322 @@
+"""
+Load test / traffic replay for POST /mcp.
+
+Reads a JSONL of tools/call requests, either captured by the server
+(MCP_TRAFFIC_CAPTURE_FILE: {"ts", "user", "body"}) or hand-written
+({"t": <offset seconds>, "body": {...}}, or a bare JSON-RPC request per line),
+and sends it to a running server:
+
+- replay (default): original inter-arrival times, scaled by --speed
+- --rate N: open loop, N requests/s regardless of response times
+- --speed 0 (and no --rate): closed loop, --concurrency N requests in flight (default 16)
+
+--users N spreads the traffic over N distinct tokens (N concurrent chat users;
+recorded users are mapped onto them). Reports p50/p95/p99 and error rates per
+tool, plus CPU and RSS of the server process tree read from /proc.
+
+    # Server + fake tenant started by the harness (Linux):
+    python -m benchmarks.replay benchmarks/traffic/sample.jsonl --start-server --workers 2 --users 20 --rate 50 --loops 5
+
+    # Existing server (pass its pid to get resource usage):
+    python -m benchmarks.replay traffic.jsonl --url http://127.0.0.1:8082 --server-pid 1234 --token "$QLIK_TOKEN"
+"""
+import argparse
+import asyncio
+import contextlib
+import copy
+import json
+import os
+import signal
+import subprocess
+import sys
+import time
+from collections import defaultdict
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+import httpx
+
+from benchmarks.common import ROOT_DIR, fake_qlik_server, free_port, load_json, print_table, summarize, write_json
+
+
+def load_traffic(path: str) -> List[Tuple[float, Optional[str], Dict[str, Any]]]:
+    """(offset seconds from the first request, recorded user, body) per tools/call request."""
+    entries = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            record = json.loads(line)
+            body = record.get("body", record) if "method" not in record else record
+            if not isinstance(body, dict) or body.get("method") != "tools/call":
+                continue
+            when = record.get("t", record.get("ts"))
+            entries.append((float(when) if when is not None else None, record.get("user"), body))
+    if not entries:
+        raise SystemExit(f"No tools/call requests in {path}")
+    if any(when is None for when, _, _ in entries):
+        return [(0.0, user, body) for _, user, body in entries]
+    first = min(when for when, _, _ in entries)
+    return sorted(((when - first, user, body) for when, user, body in entries), key=lambda e: e[0])
+
+
+class ProcessTreeSampler:
+    """CPU seconds and RSS of a process and its children (uvicorn workers), from /proc."""
+
+    def __init__(self, pid: int, interval: float = 0.5):
+        self.pid = pid
+        self.interval = interval
+        self.clock_ticks = os.sysconf("SC_CLK_TCK")
+        self.page_size = os.sysconf("SC_PAGE_SIZE")
+        self.rss_samples: List[int] = []
+        self._task: Optional[asyncio.Task] = None
+        self._cpu_start = 0.0
+        self._wall_start = 0.0
+        self.cpu_seconds = 0.0
+        self.wall_seconds = 0.0
+
+    def _tree(self) -> List[int]:
+        children: Dict[int, List[int]] = defaultdict(list)
+        for entry in os.listdir("/proc"):
+            if not entry.isdigit():
+                continue
+            try:
+                with open(f"/proc/{entry}/stat") as f:
+                    fields = f.read().rsplit(")", 1)[1].split()
+                children[int(fields[1])].append(int(entry))
+            except (OSError, IndexError, ValueError):
+                continue
+        pids, pending = [], [self.pid]
+        while pending:
+            pid = pending.pop()
+            pids.append(pid)
+            pending.extend(children.get(pid, []))
+        return pids
+
+    def _read(self) -> Tuple[float, int]:
+        cpu, rss = 0.0, 0
+        for pid in self._tree():
+            try:
+                with open(f"/proc/{pid}/stat") as f:
+                    fields = f.read().rsplit(")", 1)[1].split()
+                # utime, stime (campos 14 e 15; índices 11 e 12 depois do "comm") e rss (campo 24)
+                cpu += (int(fields[11]) + int(fields[12])) / self.clock_ticks
+                rss += int(fields[21]) * self.page_size
+            except (OSError, IndexError, ValueError):
+                continue
+        return cpu, rss
+
+    async def _run(self):
+        while True:
+            self.rss_samples.append(self._read()[1])
+            await asyncio.sleep(self.interval)
+
+    def start(self):
+        self._cpu_start = self._read()[0]
+        self._wall_start = time.perf_counter()
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> Dict[str, Any]:
+        if self._task:
+            self._task.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await self._task
+        cpu, rss = self._read()
+        self.rss_samples.append(rss)
+        self.cpu_seconds = cpu - self._cpu_start
+        self.wall_seconds = time.perf_counter() - self._wall_start
+        return {
+            "cpu_seconds": round(self.cpu_seconds, 2),
+            "cpu_percent": round(self.cpu_seconds / self.wall_seconds * 100, 1) if self.wall_seconds else 0.0,
+            "rss_peak_mb": round(max(self.rss_samples) / 1e6, 1),
+            "rss_end_mb": round(rss / 1e6, 1),
+        }
+
+
+def classify(response: Optional[httpx.Response], error: Optional[BaseException]) -> Optional[str]:
+    """None when the call succeeded, otherwise a short error class."""
+    if error is not None:
+        return "timeout" if isinstance(error, httpx.TimeoutException) else "transport"
+    if response.status_code != 200:
+        return f"http_{response.status_code}"
+    try:
+        payload = response.json()
+    except ValueError:
+        return "invalid_json"
+    if "error" in payload:
+        return f"jsonrpc_{payload['error'].get('code')}"
+    if (payload.get("result") or {}).get("isError"):
+        return "tool_error"
+    return None
+
+
+async def replay(args: argparse.Namespace, url: str, sampler: Optional[ProcessTreeSampler]) -> Dict[str, Any]:
+    traffic = load_traffic(args.traffic)
+    recorded_users = sorted({user for _, user, _ in traffic if user}) or [None]
+    user_slots = {user: i for i, user in enumerate(recorded_users)}
+    tokens = [args.token] if args.token and args.users <= 1 else [f"{args.token or 'replay-user'}-{i:04d}-token" for i in range(max(1, args.users))]
+
+    latencies: Dict[str, List[float]] = defaultdict(list)
+    errors: Dict[str, Dict[str, int]] = defaultdict(lambda: defaultdict(int))
+    semaphore = asyncio.Semaphore(args.concurrency)
+    span = traffic[-1][0] + 1e-6
+    request_id = 0
+
+    async def send(client: httpx.AsyncClient, body: Dict[str, Any], token: str):
+        tool = (body.get("params") or {}).get("name") or "unknown"
+        response, error = None, None
+        started = time.perf_counter()
+        try:
+            response = await client.post("/mcp", json=body, headers={"X-API-KEY": token})
+        except httpx.HTTPError as e:
+            error = e
+        elapsed = time.perf_counter() - started
+        error_class = classify(response, error)
+        if error_class:
+            errors[tool][error_class] += 1
+        else:
+            latencies[tool].append(elapsed)
+
+    def schedule() -> Iterator[Tuple[float, Dict[str, Any], str]]:
+        nonlocal request_id
+        for loop in range(args.loops):
+            for index, (offset, user, body) in enumerate(traffic):
+                request_id += 1
+                if args.rate > 0:
+                    at = (loop * len(traffic) + index) / args.rate
+                else:
+                    at = (loop * span + offset) / args.speed
+                # Usuários gravados viram tokens distintos (deslocados a cada loop para usar todos os --users);
+                # sem usuário gravado, round-robin
+                if len(recorded_users) > 1:
+                    slot = user_slots.get(user, 0) + loop * len(recorded_users)
+                else:
+                    slot = request_id
+                item = copy.deepcopy(body)
+                item["id"] = request_id
+                yield at, item, tokens[slot % len(tokens)]
+
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+    async with httpx.AsyncClient(base_url=url, timeout=args.timeout, limits=limits) as client:
+        if sampler:
+            sampler.start()
+        started = time.perf_counter()
+        tasks = []
+        closed_loop = args.rate <= 0 and args.speed <= 0
+        for at, body, token in schedule():
+            if closed_loop:
+                await semaphore.acquire()
+                task = asyncio.create_task(send(client, body, token))
+                task.add_done_callback(lambda _: semaphore.release())
+            else:
+                delay = at - (time.perf_counter() - started)
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                task = asyncio.create_task(send(client, body, token))
+            tasks.append(task)
+        await asyncio.gather(*tasks)
+        elapsed = time.perf_counter() - started
+        resources = await sampler.stop() if sampler else None
+
+    tools = sorted(set(latencies) | set(errors))
+    per_tool = {tool: summarize(latencies[tool], sum(errors.get(tool, {}).values()), elapsed) for tool in tools}
+    overall = summarize([v for tool in tools for v in latencies[tool]], sum(sum(e.values()) for e in errors.values()), elapsed)
+    return {
+        "overall": overall,
+        "tools": per_tool,
+        "errors": {tool: dict(classes) for tool, classes in errors.items()},
+        "resources": resources,
+        "elapsed_seconds": round(elapsed, 2),
+        "users": len(tokens),
+    }
+
+
+@contextlib.contextmanager
+def local_server(tenant_url: str, workers: int) -> Iterator[Tuple[str, int]]:
+    """Start the MCP server with uvicorn (pointed at the fake tenant); yield (url, pid)."""
+    port = free_port()
+    env = dict(os.environ, QLIK_CLOUD_TENANT_URL=tenant_url, LOG_LEVEL=os.getenv("LOG_LEVEL", "WARNING"))
+    cmd = [sys.executable, "-m", "uvicorn", "src.main:app", "--host", "127.0.0.1", "--port", str(port),
+           "--workers", str(workers), "--log-level", "warning"]
+    # Grupo de processos próprio: o encerramento alcança também os workers
+    process = subprocess.Popen(cmd, cwd=ROOT_DIR, env=env, start_new_session=True)
+    url = f"http://127.0.0.1:{port}"
+    try:
+        deadline = time.monotonic() + 30
+        while True:
+            try:
+                if httpx.get(f"{url}/health", timeout=1.0).status_code == 200:
+                    break
+            except httpx.HTTPError:
+                pass
+            if process.poll() is not None or time.monotonic() > deadline:
+                raise RuntimeError("MCP server did not start")
+            time.sleep(0.2)
+        yield url, process.pid
+    finally:
+        with contextlib.suppress(ProcessLookupError):
+            os.killpg(process.pid, signal.SIGTERM)
+        try:
+            process.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            with contextlib.suppress(ProcessLookupError):
+                os.killpg(process.pid, signal.SIGKILL)
+
+
+def report(result: Dict[str, Any], baseline: Optional[Dict[str, Any]]):
+    print()
+    rows = {"ALL": result["overall"], **result["tools"]}
+    base_rows = None
+    if baseline:
+        base_rows = {"ALL": baseline["overall"], **baseline["tools"]}
+    print_table(rows, base_rows)
+    if result["errors"]:
+        print("\nErrors:")
+        for tool, classes in result["errors"].items():
+            print(f"  {tool}: " + ", ".join(f"{c}={n}" for c, n in sorted(classes.items())))
+    if result["resources"]:
+        r = result["resources"]
+        print(f"\nServer: cpu {r['cpu_seconds']}s ({r['cpu_percent']}% of one core), "
+              f"RSS peak {r['rss_peak_mb']} MB, end {r['rss_end_mb']} MB")
+    print(f"{result['users']} users, {result['elapsed_seconds']}s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay JSON-RPC tools/call traffic against /mcp")
+    parser.add_argument("traffic", help="JSONL of tools/call requests")
+    parser.add_argument("--url", help="running server (default: start one with --start-server)")
+    parser.add_argument("--server-pid", type=int, help="pid of the running server, for CPU/RSS sampling")
+    parser.add_argument("--start-server", action="store_true", help="start the fake tenant and the MCP server")
+    parser.add_argument("--workers", type=int, default=1, help="uvicorn workers with --start-server")
+    parser.add_argument("--latency-ms", type=float, default=5.0, help="fake Engine latency with --start-server")
+    parser.add_argument("--rows", type=int, default=1000, help="fake hypercube rows with --start-server")
+    parser.add_argument("--speed", type=float, default=1.0, help="replay speed factor (0 = closed loop)")
+    parser.add_argument("--rate", type=float, default=0.0, help="open-loop requests per second (overrides timing)")
+    parser.add_argument("--concurrency", type=int, default=16, help="max in-flight requests in closed loop / connections")
+    parser.add_argument("--users", type=int, default=1, help="distinct tokens to spread the traffic over")
+    parser.add_argument("--token", help="token (or token prefix with --users > 1)")
+    parser.add_argument("--loops", type=int, default=1, help="replay the file this many times")
+    parser.add_argument("--timeout", type=float, default=120.0)
+    parser.add_argument("--output", help="write results as JSON")
+    parser.add_argument("--baseline", help="JSON from a previous run to compare against")
+    args = parser.parse_args()
+
+    async def run_against(url: str, pid: Optional[int]) -> Dict[str, Any]:
+        sampler = ProcessTreeSampler(pid) if pid and os.path.isdir("/proc") else None
+        return await replay(args, url, sampler)
+
+    if args.start_server:
+        with fake_qlik_server(["--latency-ms", str(args.latency_ms), "--rows", str(args.rows)]) as tenant_url:
+            with local_server(tenant_url, args.workers) as (url, pid):
+                result = asyncio.run(run_against(url, pid))
+    elif args.url:
+        result = asyncio.run(run_against(args.url, args.server_pid))
+    else:
+        parser.error("pass --url or --start-server")
+
+    report(result, load_json(args.baseline))
+    write_json(args.output, result)
+
+
+if __name__ == "__main__":
+    main()
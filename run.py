@@ -1,6 +1,9 @@
 """
 Inicia o Qlik MCP Server. Execute sempre na raiz do projeto:
   python run.py
+
+Multi-worker: MCP_WORKERS=4 python run.py (vários processos na mesma porta,
+compartilhando o cache SQLite em MCP_CACHE_DB_PATH).
 """
 import os
 import sys
@@ -13,10 +16,15 @@ def main():
     import uvicorn
     from dotenv import load_dotenv
     load_dotenv(os.path.join(root, ".env"))
-    from src.main import app
     port = int(os.getenv("MCP_SERVER_PORT", "8082"))
     host = os.getenv("MCP_SERVER_HOST", "0.0.0.0")
-    uvicorn.run(app, host=host, port=port, log_level="info")
+    workers = int(os.getenv("MCP_WORKERS", "1"))
+    if workers > 1:
+        # Com workers o uvicorn precisa da app como import string (cada processo importa a sua)
+        uvicorn.run("src.main:app", host=host, port=port, log_level="info", workers=workers)
+    else:
+        from src.main import app
+        uvicorn.run(app, host=host, port=port, log_level="info")
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,154 @@
+import asyncio
+import json
+import logging
+import os
+import time
+from typing import Any, Dict, FrozenSet, List, NamedTuple, Optional
+
+import httpx
+import jwt
+
+logger = logging.getLogger(__name__)
+
+
+class JWKSError(Exception):
+    """The JWKS could not be fetched or parsed."""
+
+
+# Algoritmos aceitos por tipo de chave quando o JWK não fixa "alg"
+_KTY_ALGORITHMS = {
+    "RSA": frozenset({"RS256", "RS384", "RS512", "PS256", "PS384", "PS512"}),
+    "OKP": frozenset({"EdDSA"}),
+}
+_EC_CURVE_ALGORITHMS = {"P-256": "ES256", "P-384": "ES384", "P-521": "ES512", "secp256k1": "ES256K"}
+
+
+def key_algorithms(jwk: Dict[str, Any]) -> FrozenSet[str]:
+    """Algorithms a JWK may verify: its "alg" if set, otherwise the ones its kty/crv supports."""
+    if jwk.get("alg"):
+        return frozenset({jwk["alg"]})
+    if jwk.get("kty") == "EC":
+        algorithm = _EC_CURVE_ALGORITHMS.get(jwk.get("crv"))
+        return frozenset({algorithm}) if algorithm else frozenset()
+    return _KTY_ALGORITHMS.get(jwk.get("kty"), frozenset())
+
+
+class SigningKey(NamedTuple):
+    key: jwt.PyJWK
+    algorithms: FrozenSet[str]
+
+
+class JWKSCache:
+    """
+    Public keys of the token issuer, fetched from a JWKS URL and kept in memory.
+
+    Keys are looked up by kid, together with the algorithms they may verify
+    (the token header's alg must be one of them). A kid not in the cache triggers one refetch
+    (at most every JWT_JWKS_MIN_REFRESH_SECONDS, shared by concurrent callers),
+    which picks up keys rotated in by the issuer; a background task also
+    refreshes the set every JWT_JWKS_REFRESH_SECONDS so retired keys go away.
+    """
+
+    def __init__(self, url: str, refresh_interval: Optional[float] = None, min_refresh_interval: Optional[float] = None):
+        self.url = url
+        self.refresh_interval = refresh_interval if refresh_interval is not None else float(os.getenv("JWT_JWKS_REFRESH_SECONDS", "3600"))
+        self.min_refresh_interval = min_refresh_interval if min_refresh_interval is not None else float(os.getenv("JWT_JWKS_MIN_REFRESH_SECONDS", "30"))
+        self._keys: Dict[str, SigningKey] = {}
+        self._fetched_at = 0.0
+        self._refreshing: Optional[asyncio.Task] = None
+        self._rotation_task: Optional[asyncio.Task] = None
+        self._http: Optional[httpx.AsyncClient] = None
+
+    @property
+    def kids(self) -> List[str]:
+        return list(self._keys)
+
+    async def get_key(self, kid: Optional[str]) -> Optional[SigningKey]:
+        self._ensure_rotation()
+        key = self._lookup(kid)
+        if key is not None:
+            return key
+        # kid desconhecido (ou cache vazio): rebusca, limitado para não martelar o issuer com tokens forjados
+        if not self._keys or time.monotonic() - self._fetched_at >= self.min_refresh_interval:
+            await self.refresh()
+        return self._lookup(kid)
+
+    def _lookup(self, kid: Optional[str]) -> Optional[SigningKey]:
+        if kid is not None:
+            return self._keys.get(kid)
+        # Token sem kid: só é aceitável quando o JWKS tem uma única chave
+        return next(iter(self._keys.values())) if len(self._keys) == 1 else None
+
+    async def refresh(self):
+        """Refetch the key set; concurrent callers share the same fetch."""
+        if self._refreshing is None or self._refreshing.done():
+            self._refreshing = asyncio.ensure_future(self._fetch())
+        await asyncio.shield(self._refreshing)
+
+    async def _fetch(self):
+        try:
+            response = await self._client().get(self.url)
+            response.raise_for_status()
+            keys = self._parse(response.json())
+        except (httpx.HTTPError, ValueError) as e:
+            # Mantém as chaves atuais; a próxima tentativa respeita o intervalo mínimo
+            self._fetched_at = time.monotonic()
+            raise JWKSError(f"Failed to fetch JWKS from {self.url}: {e}") from None
+        self._keys = keys
+        self._fetched_at = time.monotonic()
+        logger.info("JWKS refreshed from %s: %d keys", self.url, len(keys))
+
+    def _parse(self, data: Any) -> Dict[str, SigningKey]:
+        # Corpo fora do formato ({"keys": [...]}) conta como falha de fetch (ValueError)
+        if not isinstance(data, dict) or not isinstance(data.get("keys") or [], list):
+            raise ValueError("response is not a JWK set")
+        keys: Dict[str, SigningKey] = {}
+        for index, jwk in enumerate(data.get("keys") or []):
+            if not isinstance(jwk, dict) or jwk.get("use", "sig") != "sig":
+                continue
+            algorithms = key_algorithms(jwk)
+            if not algorithms:
+                logger.warning("Skipping JWKS key %s: unsupported key type %s", jwk.get("kid"), jwk.get("kty"))
+                continue
+            try:
+                key = jwt.PyJWK(jwk)
+            except jwt.PyJWKError as e:
+                logger.warning("Skipping unusable JWKS key %s: %s", jwk.get("kid"), e)
+                continue
+            keys[str(jwk.get("kid") or f"_{index}")] = SigningKey(key, algorithms)
+        if not keys:
+            raise ValueError("no usable signing keys")
+        return keys
+
+    def _ensure_rotation(self):
+        if self.refresh_interval > 0 and (self._rotation_task is None or self._rotation_task.done()):
+            self._rotation_task = asyncio.ensure_future(self._rotate())
+
+    async def _rotate(self):
+        while True:
+            await asyncio.sleep(self.refresh_interval)
+            try:
+                await self.refresh()
+            except JWKSError as e:
+                logger.warning("%s", e)
+
+    def _client(self) -> httpx.AsyncClient:
+        if self._http is None or self._http.is_closed:
+            self._http = httpx.AsyncClient(timeout=5.0)
+        return self._http
+
+    async def close(self):
+        if self._rotation_task is not None:
+            self._rotation_task.cancel()
+            self._rotation_task = None
+        if self._http is not None:
+            await self._http.aclose()
+            self._http = None
+
+
+def decode_header(token: str) -> Dict[str, Any]:
+    """Unverified JOSE header of a JWT ({} when malformed)."""
+    try:
+        return jwt.get_unverified_header(token)
+    except (jwt.DecodeError, json.JSONDecodeError):
+        return {}
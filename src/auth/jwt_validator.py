@@ -1,69 +1,224 @@
+import asyncio
+import hashlib
+import time
 import jwt
 import httpx
 import os
 import logging
-from typing import Optional, Dict, Any
+from collections import OrderedDict
+from typing import Optional, Dict, Any, Tuple
 from jwt.exceptions import InvalidTokenError, DecodeError
+from src.auth.jwks import JWKSCache, JWKSError, decode_header
+from src.observability.metrics import CACHE_REQUESTS
 
 logger = logging.getLogger(__name__)
 
+
+class _BackendUnavailable(Exception):
+    """Backend validation could not give an answer (network error, 5xx): never cached."""
+
+
 class JWTValidator:
+    """
+    Validates chat-backend JWTs locally or through the backend endpoint.
+
+    Local verification: RS256/ES256 (JWT_ALGORITHMS) against the issuer's JWKS
+    (JWT_JWKS_URL), or HS256 with the shared secret. A token signed with an
+    asymmetric algorithm is decided locally whenever the JWKS is reachable; the
+    backend endpoint is only a fallback.
+
+    Results are cached per token hash (bounded LRU, JWT_CACHE_MAX_ENTRIES):
+    valid tokens until their exp (at most JWT_CACHE_TTL_SECONDS when the token
+    has no exp), rejected tokens for JWT_NEGATIVE_CACHE_SECONDS. Concurrent
+    validations of the same token share one in-flight call.
+    """
+
     def __init__(self):
         # Aceita ambos os nomes de variável (compatibilidade)
         # Prioriza JWT_SECRET_KEY (mesmo nome do backend) ou AI_POCS_JWT_SECRET
         self.jwt_secret = os.getenv("JWT_SECRET_KEY") or os.getenv("AI_POCS_JWT_SECRET")
         self.backend_url = os.getenv("AI_POCS_BACKEND_URL", "http://localhost:3001")
         self.validation_endpoint = os.getenv("AI_POCS_JWT_VALIDATION_ENDPOINT", "/api/auth/validate")
-    
+        self.cache_max_entries = int(os.getenv("JWT_CACHE_MAX_ENTRIES", "10000"))
+        self.cache_ttl = float(os.getenv("JWT_CACHE_TTL_SECONDS", "300"))
+        self.negative_cache_ttl = float(os.getenv("JWT_NEGATIVE_CACHE_SECONDS", "10"))
+        jwks_url = (os.getenv("JWT_JWKS_URL") or "").strip()
+        self.jwks = JWKSCache(jwks_url) if jwks_url else None
+        self.asymmetric_algorithms = [
+            a.strip() for a in os.getenv("JWT_ALGORITHMS", "RS256,ES256").split(",") if a.strip() and not a.strip().startswith("HS")
+        ]
+        self.issuer = os.getenv("JWT_ISSUER") or None
+        self.audience = os.getenv("JWT_AUDIENCE") or None
+        # token hash -> (claims ou None se inválido, expira em epoch seconds)
+        self._cache: "OrderedDict[str, Tuple[Optional[Dict[str, Any]], float]]" = OrderedDict()
+        self._inflight: Dict[str, "asyncio.Future[Optional[Dict[str, Any]]]"] = {}
+        self._http: Optional[httpx.AsyncClient] = None
+
+    def _token_hash(self, token: str) -> str:
+        return hashlib.sha256(token.encode("utf-8")).hexdigest()
+
+    def _cache_get(self, key: str) -> Tuple[bool, Optional[Dict[str, Any]]]:
+        entry = self._cache.get(key)
+        if entry is None:
+            return False, None
+        claims, expires_at = entry
+        if time.time() >= expires_at:
+            del self._cache[key]
+            return False, None
+        self._cache.move_to_end(key)
+        return True, claims
+
+    def _cache_put(self, key: str, token: str, claims: Optional[Dict[str, Any]]):
+        now = time.time()
+        if claims is None:
+            if self.negative_cache_ttl <= 0:
+                return
+            expires_at = now + self.negative_cache_ttl
+        else:
+            exp = claims.get("exp") or self._unverified_exp(token)
+            expires_at = float(exp) if exp else now + self.cache_ttl
+            if expires_at <= now:
+                return
+        self._cache[key] = (claims, expires_at)
+        self._cache.move_to_end(key)
+        while len(self._cache) > self.cache_max_entries:
+            self._cache.popitem(last=False)
+
+    def _unverified_exp(self, token: str) -> Optional[float]:
+        """exp of a token validated by the backend (the backend already checked the signature)."""
+        try:
+            return jwt.decode(token, options={"verify_signature": False}).get("exp")
+        except Exception:
+            return None
+
     async def validate_token(self, token: str) -> Optional[Dict[str, Any]]:
-        logger.debug(f"Validating JWT token (length: {len(token)}, has_secret: {bool(self.jwt_secret)})")
-        
+        key = self._token_hash(token)
+        hit, claims = self._cache_get(key)
+        CACHE_REQUESTS.inc(cache="jwt", result="hit" if hit else "miss")
+        if hit:
+            return claims
+
+        # Single-flight: validações concorrentes do mesmo token esperam a mesma chamada
+        inflight = self._inflight.get(key)
+        if inflight is not None:
+            return await asyncio.shield(inflight)
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        try:
+            try:
+                claims = await self._validate_uncached(token)
+                self._cache_put(key, token, claims)
+            except _BackendUnavailable:
+                claims = None
+            future.set_result(claims)
+            return claims
+        except BaseException as e:
+            future.set_exception(e)
+            # evita "Future exception was never retrieved" quando ninguém mais esperava
+            future.exception()
+            raise
+        finally:
+            self._inflight.pop(key, None)
+
+    async def _validate_uncached(self, token: str) -> Optional[Dict[str, Any]]:
+        logger.debug("Validating JWT token (length: %d, has_secret: %s)", len(token), bool(self.jwt_secret))
+
+        header = decode_header(token)
+        if self.jwks is not None and header.get("alg") in self.asymmetric_algorithms:
+            try:
+                return await self._validate_with_jwks(token, header)
+            except JWKSError as e:
+                # JWKS indisponível: segue para o fallback do backend
+                logger.warning("%s", e)
+
         # Primeiro tenta validação local (mais rápido)
         if self.jwt_secret:
             try:
                 decoded = jwt.decode(token, self.jwt_secret, algorithms=["HS256"])
-                logger.debug(f"✅ JWT validated locally - user_id: {decoded.get('sub')}")
+                logger.debug("✅ JWT validated locally - user_id: %s", decoded.get('sub'))
                 return decoded
             except (InvalidTokenError, DecodeError) as e:
-                logger.debug(f"❌ Local JWT validation failed: {str(e)}")
-        
+                logger.debug("❌ Local JWT validation failed: %s", e)
+
         # Fallback: validação via endpoint do backend
-        logger.debug(f"Attempting JWT validation via backend: {self.backend_url}{self.validation_endpoint}")
+        logger.debug("Attempting JWT validation via backend: %s%s", self.backend_url, self.validation_endpoint)
         try:
-            async with httpx.AsyncClient() as client:
-                # O endpoint espera o token no header Authorization
-                response = await client.post(
-                    f"{self.backend_url}{self.validation_endpoint}",
-                    headers={"Authorization": f"Bearer {token}"},
-                    timeout=5.0
-                )
-                logger.debug(f"Backend validation response: {response.status_code}")
-                if response.status_code == 200:
-                    data = response.json()
-                    # O endpoint retorna TokenValidationResponse com user info
-                    if data.get("valid") and data.get("user"):
-                        user = data.get("user", {})
-                        # Reconstrói o payload do JWT a partir dos dados do user
-                        decoded = {
-                            "sub": user.get("id") or user.get("user_id"),
-                            "email": user.get("email"),
-                            "upn": user.get("upn"),
-                            "name": user.get("name")
-                        }
-                        logger.debug(f"✅ JWT validated via backend - user_id: {decoded.get('sub')}")
-                        return decoded
-                    else:
-                        logger.warning(f"Backend validation returned invalid: {data}")
+            # O endpoint espera o token no header Authorization
+            response = await self._client().post(
+                f"{self.backend_url}{self.validation_endpoint}",
+                headers={"Authorization": f"Bearer {token}"},
+                timeout=5.0
+            )
         except Exception as e:
-            logger.warning(f"JWT validation via endpoint failed: {str(e)}")
-            import traceback
-            logger.debug(traceback.format_exc())
-        
+            logger.warning("JWT validation via endpoint failed: %s", e)
+            raise _BackendUnavailable() from None
+        logger.debug("Backend validation response: %s", response.status_code)
+        if response.status_code >= 500:
+            logger.warning("JWT validation via endpoint failed: backend returned %s", response.status_code)
+            raise _BackendUnavailable()
+        if response.status_code == 200:
+            try:
+                data = response.json()
+            except ValueError:
+                data = {}
+            # O endpoint retorna TokenValidationResponse com user info
+            if data.get("valid") and data.get("user"):
+                user = data.get("user", {})
+                # Reconstrói o payload do JWT a partir dos dados do user
+                decoded = {
+                    "sub": user.get("id") or user.get("user_id"),
+                    "email": user.get("email"),
+                    "upn": user.get("upn"),
+                    "name": user.get("name")
+                }
+                logger.debug("✅ JWT validated via backend - user_id: %s", decoded.get('sub'))
+                return decoded
+            else:
+                logger.warning("Backend validation returned invalid: %s", data)
+
         logger.warning("❌ JWT validation failed - all methods exhausted")
         return None
-    
+
+    async def _validate_with_jwks(self, token: str, header: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        signing_key = await self.jwks.get_key(header.get("kid"))
+        if signing_key is None:
+            logger.debug("❌ JWT kid %s not in JWKS", header.get("kid"))
+            return None
+        # O alg do header só vale se for um dos da chave (ex.: ES256 com kid RSA é rejeitado)
+        algorithm = header.get("alg")
+        if algorithm not in signing_key.algorithms:
+            logger.debug("❌ JWT alg %s does not match JWKS key %s (%s)", algorithm, header.get("kid"), ", ".join(sorted(signing_key.algorithms)))
+            return None
+        try:
+            decoded = jwt.decode(
+                token,
+                signing_key.key.key,
+                algorithms=[algorithm],
+                issuer=self.issuer,
+                audience=self.audience,
+                options={"verify_aud": self.audience is not None},
+            )
+        except InvalidTokenError as e:
+            logger.debug("❌ JWKS JWT validation failed: %s", e)
+            return None
+        logger.debug("✅ JWT validated with JWKS - user_id: %s", decoded.get('sub'))
+        return decoded
+
+    def _client(self) -> httpx.AsyncClient:
+        # Um client reaproveitado (keep-alive) em vez de um novo por validação
+        if self._http is None or self._http.is_closed:
+            self._http = httpx.AsyncClient(timeout=5.0)
+        return self._http
+
+    async def close(self):
+        if self.jwks is not None:
+            await self.jwks.close()
+        if self._http is not None:
+            await self._http.aclose()
+            self._http = None
+
     def extract_user_id(self, decoded_token: Dict[str, Any]) -> Optional[str]:
         return decoded_token.get("sub") or decoded_token.get("user_id") or decoded_token.get("email")
-    
+
     def extract_email(self, decoded_token: Dict[str, Any]) -> Optional[str]:
         return decoded_token.get("email") or decoded_token.get("upn")
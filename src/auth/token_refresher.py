@@ -0,0 +1,188 @@
+import asyncio
+import logging
+import os
+import time
+from datetime import datetime
+from typing import Dict, Optional
+
+import httpx
+
+from src.storage.token_store import TokenStore
+
+logger = logging.getLogger(__name__)
+
+
+class TokenRefreshError(Exception):
+    """The Qlik token endpoint refused or failed to refresh a user's token."""
+
+
+class TokenRefresher:
+    """
+    Refreshes users' Qlik OAuth access tokens before they expire.
+
+    A background loop runs every TOKEN_REFRESH_INTERVAL_SECONDS, asks the
+    TokenStore for tokens expiring within TOKEN_REFRESH_AHEAD_SECONDS and
+    refreshes them at {tenant}/oauth/token (grant_type=refresh_token), so
+    requests find a valid token instead of paying for the refresh (or failing
+    with QEP-104). Every worker (and every node with Redis) runs the scheduler,
+    so a refresh first takes the user's lease in the TokenStore: only the
+    holder calls the token endpoint, the others wait and pick up the token it
+    saved. Without it, workers would spend the same refresh token concurrently
+    and all but one would get invalid_grant (some IdPs then revoke the whole
+    token family). Within a process refreshes are also single-flight. A user
+    whose refresh is rejected is deferred in the TokenStore for
+    TOKEN_REFRESH_FAILURE_BACKOFF_SECONDS, so no worker picks it up meanwhile
+    and it does not take the place of live users in the scan batch.
+
+    Enabled when QLIK_CLOUD_CLIENT_ID and QLIK_CLOUD_CLIENT_SECRET are set
+    (TOKEN_REFRESH_ENABLED=false turns it off).
+    """
+
+    def __init__(self, token_store: TokenStore):
+        self.token_store = token_store
+        self.tenant_url = os.getenv("QLIK_CLOUD_TENANT_URL", "").rstrip("/")
+        self.client_id = (os.getenv("QLIK_CLOUD_CLIENT_ID") or "").strip()
+        self.client_secret = (os.getenv("QLIK_CLOUD_CLIENT_SECRET") or "").strip()
+        self.ahead = float(os.getenv("TOKEN_REFRESH_AHEAD_SECONDS", "300"))
+        self.interval = float(os.getenv("TOKEN_REFRESH_INTERVAL_SECONDS", "60"))
+        self.concurrency = int(os.getenv("TOKEN_REFRESH_CONCURRENCY", "4"))
+        self.batch_size = int(os.getenv("TOKEN_REFRESH_BATCH_SIZE", "200"))
+        self.failure_backoff = float(os.getenv("TOKEN_REFRESH_FAILURE_BACKOFF_SECONDS", "600"))
+        # Validade do lease entre processos (> timeout do token endpoint) e intervalo de espera de quem não o tem
+        self.lease_ttl = float(os.getenv("TOKEN_REFRESH_LEASE_SECONDS", "30"))
+        self.lease_poll = 0.5
+        self.enabled = (
+            bool(self.tenant_url and self.client_id and self.client_secret)
+            and os.getenv("TOKEN_REFRESH_ENABLED", "true").strip().lower() not in ("0", "false", "no", "off")
+        )
+        self._inflight: Dict[str, asyncio.Task] = {}
+        self._task: Optional[asyncio.Task] = None
+        self._http: Optional[httpx.AsyncClient] = None
+
+    def start(self):
+        if self.enabled and self._task is None:
+            self._task = asyncio.ensure_future(self._run())
+            logger.info("Token refresh scheduler started (ahead=%ss, interval=%ss)", self.ahead, self.interval)
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self._http is not None:
+            await self._http.aclose()
+            self._http = None
+
+    async def _run(self):
+        while True:
+            try:
+                refreshed = await self.refresh_expiring()
+                if refreshed:
+                    logger.info("Proactively refreshed %d Qlik tokens", refreshed)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning("Token refresh scan failed: %s", e)
+            await asyncio.sleep(self.interval)
+
+    async def refresh_expiring(self) -> int:
+        """One scan: refresh every token expiring within the look-ahead window. Returns how many succeeded."""
+        deadline = datetime.utcnow().timestamp() + self.ahead
+        user_ids = await self.token_store.get_expiring(deadline, limit=self.batch_size)
+        if not user_ids:
+            return 0
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def refresh_one(user_id: str) -> bool:
+            async with semaphore:
+                try:
+                    await self.refresh(user_id)
+                    return True
+                except TokenRefreshError as e:
+                    logger.warning("Proactive refresh failed for user %s: %s", user_id, e)
+                    return False
+
+        results = await asyncio.gather(*(refresh_one(u) for u in user_ids))
+        return sum(results)
+
+    async def refresh(self, user_id: str) -> str:
+        """Refresh one user's access token (single-flight per user); returns the new access token."""
+        task = self._inflight.get(user_id)
+        if task is None:
+            task = asyncio.ensure_future(self._refresh(user_id))
+            self._inflight[user_id] = task
+            task.add_done_callback(lambda _: self._inflight.pop(user_id, None))
+        return await asyncio.shield(task)
+
+    def _fresh_access_token(self, tokens: Optional[Dict]) -> Optional[str]:
+        """The stored access token if it is outside the look-ahead window (someone already refreshed it)."""
+        if not tokens or not tokens.get("access_token") or not tokens.get("expires_at"):
+            return None
+        if tokens["expires_at"] - self.ahead <= datetime.utcnow().timestamp():
+            return None
+        return tokens["access_token"]
+
+    async def _refresh(self, user_id: str) -> str:
+        give_up = time.monotonic() + self.lease_ttl
+        while True:
+            lease = await self.token_store.acquire_refresh_lease(user_id, self.lease_ttl)
+            # Relê sem o cache em memória: outro worker pode ter acabado de renovar (e rotacionar o refresh token)
+            tokens = await self.token_store.get_tokens(user_id, cached=False)
+            access_token = self._fresh_access_token(tokens)
+            if lease is not None:
+                break
+            if access_token:
+                return access_token
+            if time.monotonic() >= give_up:
+                raise TokenRefreshError("refresh in progress in another worker")
+            await asyncio.sleep(self.lease_poll)
+        try:
+            if access_token:
+                return access_token
+            return await self._request(user_id, tokens)
+        finally:
+            await self.token_store.release_refresh_lease(user_id, lease)
+
+    async def _request(self, user_id: str, tokens: Optional[Dict]) -> str:
+        if not tokens or not tokens.get("refresh_token"):
+            raise TokenRefreshError("no refresh token stored")
+        try:
+            response = await self._client().post(
+                f"{self.tenant_url}/oauth/token",
+                data={
+                    "grant_type": "refresh_token",
+                    "refresh_token": tokens["refresh_token"],
+                    "client_id": self.client_id,
+                    "client_secret": self.client_secret,
+                },
+                headers={"Content-Type": "application/x-www-form-urlencoded"},
+                timeout=10.0,
+            )
+        except httpx.HTTPError as e:
+            raise TokenRefreshError(f"token endpoint unreachable: {e}") from None
+        if response.status_code != 200:
+            if response.status_code in (400, 401, 403):
+                # Refresh token revogado/expirado: o usuário precisa reconectar; não insistir a cada scan
+                await self.token_store.defer_refresh(user_id, self.failure_backoff)
+            raise TokenRefreshError(f"token endpoint returned {response.status_code}")
+        data = response.json()
+        access_token = data.get("access_token")
+        if not access_token:
+            raise TokenRefreshError("token endpoint response has no access_token")
+        expires_in = int(data.get("expires_in") or 3600)
+        new_refresh_token = data.get("refresh_token")
+        if new_refresh_token and new_refresh_token != tokens["refresh_token"]:
+            # Rotação de refresh token: grava o par novo
+            await self.token_store.save_tokens(user_id, new_refresh_token, access_token, expires_in)
+        else:
+            await self.token_store.update_access_token(user_id, access_token, expires_in)
+        logger.debug("Refreshed Qlik access token for user %s (expires in %ss)", user_id, expires_in)
+        return access_token
+
+    def _client(self) -> httpx.AsyncClient:
+        if self._http is None or self._http.is_closed:
+            self._http = httpx.AsyncClient(timeout=10.0)
+        return self._http
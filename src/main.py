@@ -1,8 +1,14 @@
 from fastapi import FastAPI, Request, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, Response, StreamingResponse
 from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Awaitable, Dict, List, Optional
+import asyncio
+import json
+import time
 import uvicorn
 import os
+import secrets
 import logging
 from dotenv import load_dotenv
 
@@ -10,16 +16,34 @@ _project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 load_dotenv(os.path.join(_project_root, ".env"))
 
 from src.mcp.handler import MCPHandler
+from src.mcp.context import RequestContext, ProgressSink
+from src.storage.shared_cache import get_shared_cache
+from src.storage.redis_client import storage_backend
+from src.observability.logs import setup_logging, shutdown_logging
+from src.observability.metrics import REGISTRY
+from src.observability.tracing import tracer
+from src.observability.profiling import profiler as request_profiler
+from src.observability.traffic import traffic_recorder
+from src.qlik.cassette import get_cassette
+from src.auth.token_refresher import TokenRefresher
+from src.qlik.freshness import get_freshness_tracker
+from src.qlik.inventory import get_inventory_crawler
+from src.storage.token_store import create_token_store
+
+# Logging estruturado (LOG_FORMAT=json), via QueueHandler/listener e com amostragem (LOG_SAMPLING)
+setup_logging()
+logger = logging.getLogger(__name__)
 
 # Verificar se variáveis críticas estão configuradas (apenas para log)
 if not os.getenv("QLIK_CLOUD_API_KEY"):
-    logging.warning("QLIK_CLOUD_API_KEY not found in environment. Server will require API key in request headers.")
+    logger.warning("QLIK_CLOUD_API_KEY not found in environment. Server will require API key in request headers.")
 
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
-)
-logger = logging.getLogger(__name__)
+# Máximo de chamadas de um batch JSON-RPC executadas ao mesmo tempo
+MCP_BATCH_MAX_CONCURRENCY = int(os.getenv("MCP_BATCH_MAX_CONCURRENCY", "4"))
+# Intervalo do comentário keep-alive no stream SSE (evita timeout de proxies em chamadas longas)
+MCP_SSE_KEEPALIVE_SECONDS = float(os.getenv("MCP_SSE_KEEPALIVE_SECONDS", "15"))
+# Prazo padrão por request em ms (0 = sem prazo); sobrescrito por X-MCP-Timeout-Ms ou params._meta.timeoutMs
+MCP_REQUEST_TIMEOUT_MS = os.getenv("MCP_REQUEST_TIMEOUT_MS", "0")
 
 handler = None
 
@@ -31,10 +55,31 @@ async def lifespan(app: FastAPI):
         handler = MCPHandler()
         logger.info("MCP Handler initialized successfully")
     except Exception as e:
-        logger.error(f"Failed to initialize MCP Handler: {str(e)}", exc_info=True)
+        logger.error("Failed to initialize MCP Handler: %s", e, exc_info=True)
         raise
+    # Refresh proativo dos tokens OAuth gravados (só com QLIK_CLOUD_CLIENT_ID/SECRET configurados)
+    token_refresher = TokenRefresher(create_token_store())
+    token_refresher.start()
+    # Polling do reload dos apps em uso: invalida os caches só quando o app mudou
+    freshness = get_freshness_tracker()
+    freshness.start()
+    # Inventário de sheets/objetos dos apps de cada usuário (índice do qlik_find_objects)
+    inventory = get_inventory_crawler()
+    inventory.start()
     yield
     logger.info("Shutting down MCP Handler...")
+    await freshness.stop()
+    await inventory.stop()
+    await inventory.index.close()
+    await token_refresher.stop()
+    await token_refresher.token_store.close()
+    await get_shared_cache().close()
+    tracer.shutdown()
+    traffic_recorder.shutdown()
+    cassette = get_cassette()
+    if cassette is not None:
+        cassette.close()
+    shutdown_logging()
 
 app = FastAPI(title="Qlik Cloud MCP Server", lifespan=lifespan)
 
@@ -53,7 +98,7 @@ async def mcp_get():
         status_code=405,
         content={
             "error": "Method Not Allowed",
-            "message": "Use POST with JSON-RPC body. Example: {\"jsonrpc\":\"2.0\",\"id\":1,\"method\":\"initialize\"}",
+            "message": "Use POST with JSON-RPC body (single object or batch array). Example: {\"jsonrpc\":\"2.0\",\"id\":1,\"method\":\"initialize\"}",
             "path": "/mcp",
             "allowed_methods": ["POST"]
         }
@@ -76,7 +121,7 @@ async def mcp_endpoint(request: Request):
     try:
         body = await request.json()
     except Exception as e:
-        logger.error(f"Invalid JSON in request: {str(e)}")
+        logger.error("Invalid JSON in request: %s", e)
         return {
             "jsonrpc": "2.0",
             "id": None,
@@ -86,12 +131,197 @@ async def mcp_endpoint(request: Request):
             }
         }
     
+    # Captura de tráfego para replay (MCP_TRAFFIC_CAPTURE_FILE); o usuário é gravado só como fingerprint do token
+    if traffic_recorder.enabled:
+        traffic_recorder.record(body, _raw_token(request))
+
+    # Streamable HTTP: cliente aceita SSE -> progresso (notifications/progress) + resultado final no stream
+    # (StreamingResponse já cancela o stream quando o cliente desconecta)
+    if _accepts_event_stream(request) and isinstance(body, dict) and body.get("method") == "tools/call":
+        return _stream_single(body, request)
+
+    # Profiling sob demanda (header privilegiado X-MCP-Profile ou MCP_PROFILE_ALWAYS)
+    if request_profiler.wants(request.headers.get("x-mcp-profile")):
+        async with request_profiler.profile(_profile_label(body)) as profile_info:
+            result = await _dispatch(body, request)
+            # Serialização da resposta dentro da janela do profile
+            response = result if isinstance(result, Response) else JSONResponse(content=result)
+        if profile_info:
+            response.headers["X-MCP-Profile-Id"] = profile_info.get("profile_id", "")
+        return response
+    return await _dispatch(body, request)
+
+
+async def _dispatch(body: Any, request: Request) -> Any:
+    # JSON-RPC batch: array de requests executados concorrentemente, respostas na mesma ordem
+    if isinstance(body, list):
+        return await _run_until_disconnect(_handle_batch(body, request), request)
+    return await _run_until_disconnect(_handle_single(body, request), request)
+
+
+def _raw_token(request: Request) -> Optional[str]:
+    auth_header = (request.headers.get("authorization") or "").strip()
+    if auth_header.lower().startswith("bearer "):
+        return auth_header[7:].strip() or None
+    return (request.headers.get("x-qlik-access-token") or request.headers.get("x-api-key") or "").strip() or None
+
+
+def _profile_label(body: Any) -> str:
+    if isinstance(body, list):
+        return f"batch-{len(body)}"
+    if not isinstance(body, dict):
+        return "invalid"
+    params = body.get("params") if isinstance(body.get("params"), dict) else {}
+    return str(params.get("name") or body.get("method") or "unknown")
+
+
+async def _wait_for_disconnect(request: Request):
+    # O body já foi lido; a próxima mensagem ASGI só chega quando o cliente fecha a conexão
+    while True:
+        message = await request.receive()
+        if message.get("type") == "http.disconnect":
+            return
+
+
+async def _run_until_disconnect(coro: Awaitable[Any], request: Request) -> Any:
+    """Run the JSON-RPC dispatch, cancelling it (down to the Engine calls) if the client goes away."""
+    task = asyncio.ensure_future(coro)
+    watcher = asyncio.ensure_future(_wait_for_disconnect(request))
+    try:
+        done, _ = await asyncio.wait({task, watcher}, return_when=asyncio.FIRST_COMPLETED)
+    finally:
+        watcher.cancel()
+    if task in done:
+        return task.result()
+    logger.info("Client disconnected before the response was ready; cancelling request")
+    task.cancel()
+    try:
+        await task
+    except asyncio.CancelledError:
+        pass
+    return Response(status_code=499)
+
+
+def _build_context(
+    body: Dict[str, Any],
+    request: Request,
+    progress_sink: Optional[ProgressSink] = None,
+    started: Optional[float] = None,
+) -> RequestContext:
+    params = body.get("params") if isinstance(body.get("params"), dict) else {}
+    meta = params.get("_meta") if isinstance(params.get("_meta"), dict) else {}
+    context = RequestContext()
+    if progress_sink is not None:
+        context.progress_token = meta.get("progressToken", body.get("id"))
+        context.progress_sink = progress_sink
+    # Orçamento de tempo: params._meta.timeoutMs > header X-MCP-Timeout-Ms > MCP_REQUEST_TIMEOUT_MS
+    raw_timeout = meta.get("timeoutMs") or request.headers.get("x-mcp-timeout-ms") or MCP_REQUEST_TIMEOUT_MS
+    try:
+        timeout_ms = float(raw_timeout)
+    except (TypeError, ValueError):
+        logger.warning("Ignoring invalid request timeout: %r", raw_timeout)
+        timeout_ms = 0
+    if timeout_ms > 0:
+        # O orçamento conta a partir da chegada do request HTTP (started), não de quando o item começa a rodar
+        context.deadline = (started if started is not None else time.monotonic()) + timeout_ms / 1000.0
+    context.traceparent = request.headers.get("traceparent")
+    return context
+
+
+def _accepts_event_stream(request: Request) -> bool:
+    return "text/event-stream" in (request.headers.get("accept") or "").lower()
+
+
+def _sse_event(message: Any) -> str:
+    return f"event: message\ndata: {json.dumps(message, separators=(',', ':'))}\n\n"
+
+
+def _stream_single(body: Dict[str, Any], request: Request) -> StreamingResponse:
+    """
+    MCP streamable HTTP transport: the tools/call runs in a task while progress
+    notifications are forwarded as SSE events; the JSON-RPC response is the last event.
+    """
+    queue: asyncio.Queue = asyncio.Queue()
+    context = _build_context(body, request, progress_sink=queue.put)
+
+    async def events() -> AsyncIterator[str]:
+        task = asyncio.create_task(_handle_single(body, request, context))
+        try:
+            while not task.done():
+                getter = asyncio.ensure_future(queue.get())
+                done, _ = await asyncio.wait(
+                    {task, getter}, timeout=MCP_SSE_KEEPALIVE_SECONDS, return_when=asyncio.FIRST_COMPLETED
+                )
+                if getter in done:
+                    yield _sse_event(getter.result())
+                    continue
+                getter.cancel()
+                if not done:
+                    yield ": keep-alive\n\n"
+            while not queue.empty():
+                yield _sse_event(queue.get_nowait())
+            yield _sse_event(task.result())
+        finally:
+            if not task.done():
+                task.cancel()
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+async def _handle_batch(batch: List[Any], request: Request) -> Any:
+    if not batch:
+        return {
+            "jsonrpc": "2.0",
+            "id": None,
+            "error": {
+                "code": -32600,
+                "message": "Invalid Request: empty batch"
+            }
+        }
+    started = time.monotonic()
+    semaphore = asyncio.Semaphore(max(1, MCP_BATCH_MAX_CONCURRENCY))
+    logger.info("Processing JSON-RPC batch of %d requests (max concurrency %d)", len(batch), MCP_BATCH_MAX_CONCURRENCY)
+
+    async def run_one(item: Any) -> Dict[str, Any]:
+        # Prazo fixado antes da fila do semáforo: itens que esperam não ganham orçamento novo
+        context = _build_context(item, request, started=started) if isinstance(item, dict) else None
+        async with semaphore:
+            return await _handle_single(item, request, context)
+
+    responses = await asyncio.gather(*(run_one(item) for item in batch))
+    # Notificações (sem "id") não têm resposta; se só havia notificações, o corpo fica vazio
+    responses = [r for item, r in zip(batch, responses) if not _is_notification(item)]
+    return responses if responses else Response(status_code=204)
+
+
+def _is_notification(item: Any) -> bool:
+    return isinstance(item, dict) and "id" not in item and isinstance(item.get("method"), str) and bool(item["method"])
+
+
+async def _handle_single(body: Any, request: Request, context: Optional[RequestContext] = None) -> Dict[str, Any]:
+    if not isinstance(body, dict):
+        return {
+            "jsonrpc": "2.0",
+            "id": None,
+            "error": {
+                "code": -32600,
+                "message": "Invalid Request: expected a JSON-RPC object"
+            }
+        }
+
+    if context is None:
+        context = _build_context(body, request)
+
     method = body.get("method")
     request_id = body.get("id")
     
     # Verificar se o método está presente
     if not method:
-        logger.warning(f"Request missing 'method' field. Body keys: {list(body.keys())}")
+        logger.warning("Request missing 'method' field. Body keys: %s", list(body.keys()))
         return {
             "jsonrpc": "2.0",
             "id": request_id,
@@ -105,15 +335,15 @@ async def mcp_endpoint(request: Request):
     auth_val = (request.headers.get("authorization") or "").strip()
     x_qlik_val = (request.headers.get("x-qlik-access-token") or "").strip()
     x_api_val = (request.headers.get("x-api-key") or "").strip()
-    if method == "tools/call":
-        logger.info(
+    if method == "tools/call" and logger.isEnabledFor(logging.DEBUG):
+        logger.debug(
             "Headers check: Authorization present=%s, X-Qlik-Access-Token present=%s, X-API-KEY present=%s",
             bool(auth_val), bool(x_qlik_val), bool(x_api_val),
         )
         if not (auth_val or x_qlik_val or x_api_val):
             raw_headers = request.scope.get("headers") or []
             raw_names = [h[0].decode("latin-1") for h in raw_headers]
-            logger.info("ASGI scope headers (names): %s", raw_names)
+            logger.debug("ASGI scope headers (names): %s", raw_names)
     qlik_token = None
     token_source = None
     if auth_val.lower().startswith("bearer "):
@@ -126,21 +356,21 @@ async def mcp_endpoint(request: Request):
         qlik_token = x_api_val
         token_source = "X-API-KEY"
     api_key = qlik_token if (qlik_token and qlik_token.strip()) else None
-    header_names = list(request.headers.keys())
 
     if api_key:
         api_key = api_key.strip()
-        api_key_preview = f"{api_key[:8]}...{api_key[-4:]}" if len(api_key) > 12 else "***"
-        logger.info(f"Qlik token from {token_source}: {api_key_preview} (length: {len(api_key)} chars)")
+        if logger.isEnabledFor(logging.DEBUG):
+            api_key_preview = f"{api_key[:8]}...{api_key[-4:]}" if len(api_key) > 12 else "***"
+            logger.debug("Qlik token from %s: %s (length: %d chars)", token_source, api_key_preview, len(api_key))
     
     # Métodos de descoberta não precisam de API key
     discovery_methods = ["initialize", "tools/list"]
     requires_auth = method not in discovery_methods
     
     if not api_key and requires_auth:
-        logger.info(
-            f"No Qlik token in request for method {method}. Incoming headers (names): %s. Trying .env fallback.",
-            header_names,
+        logger.debug(
+            "No Qlik token in request for method %s. Incoming headers (names): %s. Trying .env fallback.",
+            method, list(request.headers.keys()),
         )
         from src.qlik.auth import QlikAuth
         qlik_auth = QlikAuth()
@@ -148,14 +378,13 @@ async def mcp_endpoint(request: Request):
         if env_api_key:
             api_key = env_api_key
             token_source = "environment (.env)"
-            api_key_preview = f"{api_key[:8]}...{api_key[-4:]}" if len(api_key) > 12 else "***"
-            logger.info(f"✓ Using Qlik token from {token_source}: {api_key_preview} (length: {len(api_key)} chars)")
+            logger.debug("Using Qlik token from %s (length: %d chars)", token_source, len(api_key))
         else:
             logger.warning(
                 "✗ No Qlik token in headers and QLIK_CLOUD_API_KEY not set. "
                 "Expected one of: Authorization (Bearer), X-Qlik-Access-Token, X-API-KEY. "
                 "Received header names: %s",
-                header_names,
+                list(request.headers.keys()),
             )
             env_raw = os.getenv("QLIK_CLOUD_API_KEY")
             if env_raw is not None:
@@ -167,6 +396,7 @@ async def mcp_endpoint(request: Request):
         from src.qlik.auth import QlikAuth
         qlik_auth_check = QlikAuth()
         env_key_exists = qlik_auth_check.get_api_key() is not None
+        header_names = list(request.headers.keys())
         if env_key_exists:
             logger.warning(
                 "Missing Qlik token for method %s. Token exists in .env but was not used (no token in request). Request header names: %s",
@@ -188,15 +418,17 @@ async def mcp_endpoint(request: Request):
         }
     
     try:
-        logger.info(f"Processing MCP method: {method}")
+        logger.info("Processing MCP method: %s", method, extra={"category": "request"})
         # Passar API key para o handler (pode ser do header ou do .env)
         # Se api_key for None ou string vazia, passar None (o handler tentará usar do .env como fallback)
-        result = await handler.handle_request(body, api_key=api_key if (api_key and api_key.strip()) else None)
+        result = await handler.handle_request(
+            body,
+            api_key=api_key if (api_key and api_key.strip()) else None,
+            context=context,
+        )
         return result
     except Exception as e:
-        logger.error(f"Error handling MCP request: {str(e)}")
-        import traceback
-        logger.error(traceback.format_exc())
+        logger.error("Error handling MCP request: %s", e, exc_info=True)
         return {
             "jsonrpc": "2.0",
             "id": request_id,
@@ -215,7 +447,8 @@ async def root():
         "service": "Qlik Cloud MCP Server",
         "routes": {
             "GET /health": "Health check",
-            "POST /mcp": "JSON-RPC (initialize, tools/list, tools/call)"
+            "GET /metrics": "Prometheus metrics",
+            "POST /mcp": "JSON-RPC (initialize, tools/list, tools/call); accepts batch arrays and SSE (Accept: text/event-stream)"
         },
         "docs": "/docs"
     }
@@ -224,8 +457,25 @@ async def root():
 async def health():
     return {"status": "ok"}
 
+@app.get("/metrics")
+async def metrics():
+    # Métricas por processo: com MCP_WORKERS > 1 cada scrape atinge um worker (use o label de instância/pid no Prometheus)
+    return Response(content=REGISTRY.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
 if __name__ == "__main__":
     port = int(os.getenv("MCP_SERVER_PORT", "8082"))
     host = os.getenv("MCP_SERVER_HOST", "0.0.0.0")
-    logger.info(f"Starting Qlik Cloud MCP Server on {host}:{port}")
-    uvicorn.run(app, host=host, port=port, log_level="info")
+    workers = int(os.getenv("MCP_WORKERS", "1"))
+    if not os.getenv("MCP_CURSOR_SECRET"):
+        if storage_backend() == "redis":
+            # Vários nós: um segredo gerado aqui não chegaria aos outros e os cursores falhariam entre nós
+            raise SystemExit("MCP_CURSOR_SECRET must be set when MCP_STORAGE_BACKEND=redis (same value on every node)")
+        if workers > 1:
+            # Os workers herdam o ambiente: todos assinam os cursores com o mesmo segredo
+            os.environ["MCP_CURSOR_SECRET"] = secrets.token_hex(32)
+            logger.info("MCP_CURSOR_SECRET not set; generated one shared by the %d workers", workers)
+    logger.info("Starting Qlik Cloud MCP Server on %s:%s (workers=%d)", host, port, workers)
+    if workers > 1:
+        uvicorn.run("src.main:app", host=host, port=port, log_level="info", workers=workers)
+    else:
+        uvicorn.run(app, host=host, port=port, log_level="info")
@@ -0,0 +1,62 @@
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Dict, Iterator, Optional
+
+ProgressSink = Callable[[Dict[str, Any]], Awaitable[None]]
+
+
+@dataclass
+class RequestContext:
+    """
+    Per-request state shared by the MCP handler and the tools.
+
+    Set by the transport (src/main.py) and exposed to tools through a context
+    variable, so tool signatures (BaseTool.execute) stay unchanged.
+    """
+    progress_token: Optional[Any] = None
+    progress_sink: Optional[ProgressSink] = None
+    # Instante (time.monotonic) em que o cliente deixa de esperar pela resposta
+    deadline: Optional[float] = None
+    # W3C traceparent recebido no /mcp (propagado para os spans do handler)
+    traceparent: Optional[str] = None
+
+    def remaining(self) -> Optional[float]:
+        """Seconds left until the deadline (None when the request has no time budget)."""
+        if self.deadline is None:
+            return None
+        return self.deadline - time.monotonic()
+
+    async def report_progress(self, progress: float, total: Optional[float] = None, message: Optional[str] = None):
+        """Emit an MCP notifications/progress message (no-op when the client did not ask for progress)."""
+        if self.progress_sink is None or self.progress_token is None:
+            return
+        params: Dict[str, Any] = {"progressToken": self.progress_token, "progress": progress}
+        if total is not None:
+            params["total"] = total
+        if message:
+            params["message"] = message
+        await self.progress_sink({
+            "jsonrpc": "2.0",
+            "method": "notifications/progress",
+            "params": params
+        })
+
+
+_current_context: ContextVar[Optional[RequestContext]] = ContextVar("mcp_request_context", default=None)
+
+
+def get_request_context() -> RequestContext:
+    """Return the context of the request being handled (an empty one outside a request)."""
+    return _current_context.get() or RequestContext()
+
+
+@contextmanager
+def use_request_context(context: Optional[RequestContext]) -> Iterator[RequestContext]:
+    context = context or RequestContext()
+    token = _current_context.set(context)
+    try:
+        yield context
+    finally:
+        _current_context.reset(token)
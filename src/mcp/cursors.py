@@ -0,0 +1,65 @@
+import base64
+import hashlib
+import hmac
+import json
+import os
+import secrets
+import time
+from typing import Any, Dict, Optional
+from src.qlik.auth import token_fingerprint
+
+# Segredo HMAC dos cursores. Com MCP_WORKERS > 1 sem MCP_CURSOR_SECRET, src.main gera um e os
+# workers o herdam; com vários nós (Redis) o servidor exige MCP_CURSOR_SECRET igual em todos.
+_CURSOR_SECRET = (os.getenv("MCP_CURSOR_SECRET") or secrets.token_hex(32)).encode("utf-8")
+CURSOR_TTL_SECONDS = int(os.getenv("MCP_CURSOR_TTL_SECONDS", "900"))
+
+
+class CursorError(ValueError):
+    """Raised when a continuation cursor is malformed, tampered with, expired or not valid for the caller."""
+
+
+def _b64encode(raw: bytes) -> str:
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def _b64decode(value: str) -> bytes:
+    return base64.urlsafe_b64decode(value + "=" * (-len(value) % 4))
+
+
+def _sign(payload: str) -> str:
+    return _b64encode(hmac.new(_CURSOR_SECRET, payload.encode("ascii"), hashlib.sha256).digest()[:18])
+
+
+def encode_cursor(payload: Dict[str, Any], api_key: Optional[str], ttl: Optional[int] = None) -> str:
+    """
+    Build an opaque, signed continuation cursor. The payload is bound to the caller's
+    token and carries its own expiry, so cursors need no server-side storage.
+    """
+    data = dict(payload)
+    data["u"] = token_fingerprint(api_key)
+    data["exp"] = int(time.time()) + (ttl if ttl is not None else CURSOR_TTL_SECONDS)
+    body = _b64encode(json.dumps(data, separators=(",", ":"), sort_keys=True).encode("utf-8"))
+    return f"{body}.{_sign(body)}"
+
+
+def decode_cursor(cursor: str, api_key: Optional[str]) -> Dict[str, Any]:
+    try:
+        body, signature = cursor.strip().split(".", 1)
+    except (AttributeError, ValueError):
+        raise CursorError("Invalid cursor. Pass the 'cursor' value returned by the previous call unchanged.") from None
+    try:
+        valid = hmac.compare_digest(signature.encode("ascii"), _sign(body).encode("ascii"))
+    except UnicodeEncodeError:
+        # Cursor com caracteres não-ASCII nunca foi emitido por nós
+        valid = False
+    if not valid:
+        raise CursorError("Invalid cursor. Pass the 'cursor' value returned by the previous call unchanged.")
+    try:
+        data = json.loads(_b64decode(body))
+    except (ValueError, TypeError):
+        raise CursorError("Invalid cursor. Pass the 'cursor' value returned by the previous call unchanged.") from None
+    if data.get("exp", 0) < time.time():
+        raise CursorError("Cursor expired. Call again without 'cursor' to restart paging.")
+    if data.get("u") != token_fingerprint(api_key):
+        raise CursorError("Cursor was issued for a different Qlik token. Call again without 'cursor'.")
+    return data
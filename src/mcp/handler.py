@@ -1,13 +1,25 @@
+import asyncio
 import json
 import os
+import time
 from typing import Dict, Any, Optional
 from src.qlik.auth import QlikAuth
-from src.qlik.engine import QlikEngineAuthError, QEP104_MESSAGE
+from src.qlik.engine import QlikEngineAuthError, QlikStateChangedError, QEP104_MESSAGE
+from src.mcp.cursors import CursorError
+from src.observability.tracing import tracer
+from src.observability.metrics import (
+    TOOL_CALLS, TOOL_DURATION, TOOL_ERRORS, TOOL_RESPONSE_BYTES, TOOL_QIX_ROUND_TRIPS, qix_round_trip_counter
+)
+from src.mcp.context import RequestContext, use_request_context
 from src.mcp.tools import (
     QlikGetAppsTool,
     QlikGetAppSheetsTool,
     QlikGetSheetChartsTool,
-    QlikGetChartDataTool
+    QlikGetChartDataTool,
+    QlikExportChartDataTool,
+    QlikQueryCachedDataTool,
+    QlikFindObjectsTool,
+    QlikSearchFieldValuesTool
 )
 
 class MCPHandler:
@@ -16,11 +28,21 @@ class MCPHandler:
     
     This handler only exposes GET operations (list/retrieve data).
     No create, update, delete, or modify operations are allowed.
-    All tools must have names starting with 'qlik_get_' or 'qlik_list_'.
+    All tools must have names starting with 'qlik_get_', 'qlik_list_', 'qlik_export_', 'qlik_query_',
+    'qlik_find_' or 'qlik_search_' (exports read Qlik data and only write files on the MCP server's disk;
+    queries run over data already read into the server's memory; finds search a local index of object
+    metadata; searches only look up field values in a session object, without selecting anything).
     """
     
     # Allowed prefixes for tool names (read-only operations only)
-    ALLOWED_PREFIXES = ["qlik_get_", "qlik_list_"]
+    ALLOWED_PREFIXES = ["qlik_get_", "qlik_list_", "qlik_export_", "qlik_query_", "qlik_find_", "qlik_search_"]
+
+    # Extra time after the request deadline for an in-flight Engine page to finish
+    # (the tool returns partial results itself; this is the hard stop).
+    DEADLINE_GRACE_SECONDS = float(os.getenv("MCP_DEADLINE_GRACE_SECONDS", "2"))
+
+    # Indentação do JSON devolvido ao LLM; vazio/0 = compacto (menos bytes e tokens)
+    RESPONSE_INDENT = int(os.getenv("MCP_RESPONSE_INDENT", "0") or 0) or None
     
     def __init__(self):
         self.qlik_auth = QlikAuth()
@@ -28,7 +50,11 @@ class MCPHandler:
             "qlik_get_apps": QlikGetAppsTool(),
             "qlik_get_app_sheets": QlikGetAppSheetsTool(),
             "qlik_get_sheet_charts": QlikGetSheetChartsTool(),
-            "qlik_get_chart_data": QlikGetChartDataTool()
+            "qlik_get_chart_data": QlikGetChartDataTool(),
+            "qlik_export_chart_data": QlikExportChartDataTool(),
+            "qlik_query_cached_data": QlikQueryCachedDataTool(),
+            "qlik_find_objects": QlikFindObjectsTool(),
+            "qlik_search_field_values": QlikSearchFieldValuesTool()
         }
         
         # Validate that all tools are read-only
@@ -45,7 +71,38 @@ class MCPHandler:
                 logger.error(error_msg)
                 raise ValueError(error_msg)
     
-    async def handle_request(self, body: Dict[str, Any], api_key: Optional[str] = None) -> Dict[str, Any]:
+    def _dump_result(self, result: Any) -> str:
+        if not isinstance(result, (dict, list)):
+            return str(result)
+        if self.RESPONSE_INDENT:
+            return json.dumps(result, indent=self.RESPONSE_INDENT, ensure_ascii=False)
+        return json.dumps(result, separators=(",", ":"), ensure_ascii=False)
+
+    def _observe_tool(self, tool_name: str, started: float, round_trips: int,
+                      error_class: Optional[str] = None, response_bytes: Optional[int] = None):
+        TOOL_CALLS.inc(tool=tool_name)
+        TOOL_DURATION.observe(time.perf_counter() - started, tool=tool_name)
+        TOOL_QIX_ROUND_TRIPS.observe(round_trips, tool=tool_name)
+        if error_class:
+            TOOL_ERRORS.inc(tool=tool_name, error_class=error_class)
+        if response_bytes is not None:
+            TOOL_RESPONSE_BYTES.observe(response_bytes, tool=tool_name)
+
+    async def handle_request(self, body: Dict[str, Any], api_key: Optional[str] = None,
+                             context: Optional[RequestContext] = None) -> Dict[str, Any]:
+        method = body.get("method") if isinstance(body, dict) else None
+        with tracer.start_as_current_span(
+            "MCPHandler.handle_request",
+            {"rpc.system": "jsonrpc", "rpc.method": method or ""},
+            traceparent=context.traceparent if context else None,
+        ) as span:
+            response = await self._handle_request(body, api_key, context)
+            if isinstance(response, dict) and "error" in response:
+                span.set_status("ERROR", response["error"].get("message"))
+            return response
+
+    async def _handle_request(self, body: Dict[str, Any], api_key: Optional[str] = None,
+                              context: Optional[RequestContext] = None) -> Dict[str, Any]:
         import logging
         logger = logging.getLogger(__name__)
         
@@ -74,12 +131,12 @@ class MCPHandler:
                 env_api_key = self.qlik_auth.get_api_key()
                 if env_api_key:
                     qlik_api_key = env_api_key
-                    logger.info(f"Using API key from .env fallback in handler")
+                    logger.debug("Using API key from .env fallback in handler")
                 else:
                     qlik_api_key = None
             
             if method == "initialize":
-                logger.info("Handling initialize request")
+                logger.info("Handling initialize request", extra={"category": "request"})
                 return {
                     "jsonrpc": "2.0",
                     "id": request_id,
@@ -97,7 +154,7 @@ class MCPHandler:
                 }
             
             elif method == "tools/list":
-                logger.info("Handling tools/list request")
+                logger.info("Handling tools/list request", extra={"category": "request"})
                 try:
                     tools_list = []
                     for tool_name, tool_instance in self.tools.items():
@@ -111,7 +168,7 @@ class MCPHandler:
                         }
                     }
                 except Exception as e:
-                    logger.error(f"Error listing tools: {str(e)}")
+                    logger.error("Error listing tools: %s", e)
                     return {
                         "jsonrpc": "2.0",
                         "id": request_id,
@@ -137,7 +194,7 @@ class MCPHandler:
                 
                 # Security check: Only allow read-only tools
                 if not any(tool_name.startswith(prefix) for prefix in self.ALLOWED_PREFIXES):
-                    logger.warning(f"SECURITY: Attempted to call non-read-only tool: '{tool_name}'")
+                    logger.warning("SECURITY: Attempted to call non-read-only tool: '%s'", tool_name)
                     return {
                         "jsonrpc": "2.0",
                         "id": request_id,
@@ -148,7 +205,7 @@ class MCPHandler:
                     }
                 
                 if tool_name not in self.tools:
-                    logger.warning(f"Tool '{tool_name}' not found. Available tools: {list(self.tools.keys())}")
+                    logger.warning("Tool '%s' not found. Available tools: %s", tool_name, list(self.tools.keys()))
                     return {
                         "jsonrpc": "2.0",
                         "id": request_id,
@@ -159,7 +216,7 @@ class MCPHandler:
                     }
                 
                 if tool_name.startswith("qlik_") and not qlik_api_key:
-                    logger.warning(f"Missing Qlik token for tool: {tool_name}")
+                    logger.warning("Missing Qlik token for tool: %s", tool_name)
                     return {
                         "jsonrpc": "2.0",
                         "id": request_id,
@@ -169,12 +226,31 @@ class MCPHandler:
                         }
                     }
                 
+                started = time.perf_counter()
+                round_trips = [0]
                 try:
-                    api_key_source = "header" if api_key else "environment"
-                    api_key_preview = f"{qlik_api_key[:8]}...{qlik_api_key[-4:]}" if qlik_api_key and len(qlik_api_key) > 12 else "not set"
-                    logger.info(f"Executing tool: {tool_name} (API key from: {api_key_source}, preview: {api_key_preview})")
+                    logger.info(
+                        "Executing tool: %s (API key from: %s)", tool_name, "header" if api_key else "environment",
+                        extra={"category": "request"}
+                    )
                     tool_instance = self.tools[tool_name]
-                    result = await tool_instance.execute(arguments, qlik_api_key)
+                    with use_request_context(context) as ctx, qix_round_trip_counter() as round_trips, \
+                            tracer.start_as_current_span(f"{tool_name}.execute", {"mcp.tool": tool_name}):
+                        remaining = ctx.remaining()
+                        if remaining is None:
+                            result = await tool_instance.execute(arguments, qlik_api_key)
+                        else:
+                            if remaining <= 0:
+                                raise Exception("Timeout: request deadline already expired before the tool started")
+                            try:
+                                result = await asyncio.wait_for(
+                                    tool_instance.execute(arguments, qlik_api_key),
+                                    timeout=remaining + self.DEADLINE_GRACE_SECONDS
+                                )
+                            except asyncio.TimeoutError:
+                                raise Exception("Timeout: request deadline exceeded") from None
+                    text = self._dump_result(result)
+                    self._observe_tool(tool_name, started, round_trips[0], response_bytes=len(text.encode("utf-8")))
                     return {
                         "jsonrpc": "2.0",
                         "id": request_id,
@@ -182,12 +258,13 @@ class MCPHandler:
                             "content": [
                                 {
                                     "type": "text",
-                                    "text": json.dumps(result, indent=2) if isinstance(result, (dict, list)) else str(result)
+                                    "text": text
                                 }
                             ]
                         }
                     }
                 except QlikEngineAuthError:
+                    self._observe_tool(tool_name, started, round_trips[0], error_class="qep104")
                     logger.warning("Qlik QEP-104 (token expired or insufficient permissions). User should reconnect in Chat-AI.")
                     return {
                         "jsonrpc": "2.0",
@@ -196,10 +273,22 @@ class MCPHandler:
                             "content": [{"type": "text", "text": QEP104_MESSAGE}]
                         }
                     }
+                except (CursorError, QlikStateChangedError) as e:
+                    self._observe_tool(tool_name, started, round_trips[0], error_class="cursor")
+                    logger.warning("Rejected cursor for tool %s: %s", tool_name, e)
+                    return {
+                        "jsonrpc": "2.0",
+                        "id": request_id,
+                        "error": {
+                            "code": -32602,
+                            "message": str(e)
+                        }
+                    }
                 except Exception as e:
                     error_msg = str(e)
                     is_qep104 = "QEP-104" in error_msg or "4204" in error_msg
                     if is_qep104:
+                        self._observe_tool(tool_name, started, round_trips[0], error_class="qep104")
                         logger.warning("Qlik QEP-104 (token expired or insufficient permissions). User should reconnect in Chat-AI.")
                         return {
                             "jsonrpc": "2.0",
@@ -214,21 +303,26 @@ class MCPHandler:
                         or "token expired" in error_msg.lower() or "401" in error_msg
                     )
                     if is_auth_error:
+                        error_class = "auth"
                         error_code = -32000
                         error_message = error_msg
-                        logger.error(f"Error executing tool {tool_name}: {error_message}")
+                        logger.error("Error executing tool %s: %s", tool_name, error_message)
                     elif "Timeout" in error_msg or "timeout" in error_msg:
+                        error_class = "timeout"
                         error_code = -32603
                         error_message = f"Request timeout: {error_msg}"
-                        logger.error(f"Error executing tool {tool_name}: {error_message}")
+                        logger.error("Error executing tool %s: %s", tool_name, error_message)
                     elif "Cannot connect" in error_msg or "ConnectError" in error_msg:
+                        error_class = "connect"
                         error_code = -32603
                         error_message = f"Connection error: {error_msg}"
-                        logger.error(f"Error executing tool {tool_name}: {error_message}")
+                        logger.error("Error executing tool %s: %s", tool_name, error_message)
                     else:
+                        error_class = "other"
                         error_code = -32603
                         error_message = f"Error executing tool '{tool_name}': {error_msg}"
-                        logger.error(f"Error executing tool {tool_name}: {error_message}", exc_info=True)
+                        logger.error("Error executing tool %s: %s", tool_name, error_message, exc_info=True)
+                    self._observe_tool(tool_name, started, round_trips[0], error_class=error_class)
                     return {
                         "jsonrpc": "2.0",
                         "id": request_id,
@@ -239,7 +333,7 @@ class MCPHandler:
                     }
             
             else:
-                logger.warning(f"Unknown method: {method}")
+                logger.warning("Unknown method: %s", method)
                 return {
                     "jsonrpc": "2.0",
                     "id": request_id,
@@ -249,7 +343,7 @@ class MCPHandler:
                     }
                 }
         except Exception as e:
-            logger.error(f"Unexpected error in handle_request: {str(e)}", exc_info=True)
+            logger.error("Unexpected error in handle_request: %s", e, exc_info=True)
             return {
                 "jsonrpc": "2.0",
                 "id": body.get("id") if isinstance(body, dict) else None,
@@ -2,10 +2,18 @@ from .qlik_get_apps import QlikGetAppsTool
 from .qlik_get_app_sheets import QlikGetAppSheetsTool
 from .qlik_get_sheet_charts import QlikGetSheetChartsTool
 from .qlik_get_chart_data import QlikGetChartDataTool
+from .qlik_export_chart_data import QlikExportChartDataTool
+from .qlik_query_cached_data import QlikQueryCachedDataTool
+from .qlik_find_objects import QlikFindObjectsTool
+from .qlik_search_field_values import QlikSearchFieldValuesTool
 
 __all__ = [
     "QlikGetAppsTool",
     "QlikGetAppSheetsTool",
     "QlikGetSheetChartsTool",
     "QlikGetChartDataTool",
+    "QlikExportChartDataTool",
+    "QlikQueryCachedDataTool",
+    "QlikFindObjectsTool",
+    "QlikSearchFieldValuesTool",
 ]
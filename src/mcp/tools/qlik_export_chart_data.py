@@ -0,0 +1,158 @@
+import asyncio
+import logging
+import os
+import time
+from typing import Dict, Any, Optional
+from src.mcp.tools.base_tool import BaseTool
+from src.mcp.context import get_request_context
+from src.qlik.engine import QlikEngineClient
+from src.qlik.client import QlikRestClient
+from src.qlik.freshness import get_freshness_tracker
+from src.storage.exports import (
+    available_formats, cell_values, cleanup_exports, column_schema, export_path, file_size, open_export_writer
+)
+
+logger = logging.getLogger(__name__)
+
+class QlikExportChartDataTool(BaseTool):
+    def __init__(self):
+        self.engine = QlikEngineClient()
+        self.client = QlikRestClient()
+        self.freshness = get_freshness_tracker()
+        # Diretório local onde os arquivos exportados são gravados
+        self.export_dir = os.path.abspath(os.getenv("MCP_EXPORT_DIR", "exports"))
+        # Limpeza antes de cada exportação: idade máxima (s) e tamanho total do diretório (bytes); 0 = sem limite
+        self.max_age = float(os.getenv("MCP_EXPORT_MAX_AGE", "86400"))
+        self.max_bytes = int(os.getenv("MCP_EXPORT_MAX_BYTES", str(10 * 1024 ** 3)))
+
+    def get_schema(self) -> Dict[str, Any]:
+        return {
+            "name": "qlik_export_chart_data",
+            "description": "Export ALL rows of a chart/table in a Qlik app to a file on the MCP server (csv, or arrow/parquet when available) instead of returning them inline. Use this when the user wants the whole table / a download; use qlik_get_chart_data to look at rows. Pages are streamed straight to disk, so millions of rows are fine. Returns the file path, row_count and schema (column names and types). If the request deadline is hit, the file has the rows read so far, truncated=true and next_row: call again with startRow=next_row to export the rest into another file. READ-ONLY.",
+            "inputSchema": {
+                "type": "object",
+                "properties": {
+                    "appId": {
+                        "type": "string",
+                        "description": "The app resourceId from qlik_get_apps (NOT the item id)"
+                    },
+                    "objectId": {
+                        "type": "string",
+                        "description": "The ID of the chart/object"
+                    },
+                    "format": {
+                        "type": "string",
+                        "enum": available_formats(),
+                        "description": "File format (default: csv)"
+                    },
+                    "maxRows": {
+                        "type": "integer",
+                        "description": "Maximum total rows to export (default: all)",
+                        "minimum": 1
+                    },
+                    "startRow": {
+                        "type": "integer",
+                        "description": "First row to export (default: 0); use next_row from a truncated export",
+                        "minimum": 0
+                    }
+                },
+                "required": ["appId", "objectId"]
+            }
+        }
+
+    def _normalise_id(self, val: Any) -> str:
+        if val is None:
+            return ""
+        s = str(val).strip()
+        if s.startswith("{{") and s.endswith("}}"):
+            s = s[2:-2].strip()
+        return s
+
+    def _looks_like_item_id(self, s: str) -> bool:
+        if not s or "-" in s or len(s) != 24:
+            return False
+        return s.isalnum()
+
+    async def _resolve_app_id(self, app_id: str, api_key: str) -> str:
+        if not self._looks_like_item_id(app_id):
+            return app_id
+        try:
+            item = await self.client.get_item(app_id, api_key)
+            resource_id = (item.get("resourceId") or "").strip()
+            if resource_id:
+                return resource_id
+        except Exception:
+            pass
+        return app_id
+
+    async def execute(self, arguments: Dict[str, Any], api_key: str) -> Dict[str, Any]:
+        app_id = self._normalise_id(arguments.get("appId"))
+        object_id = self._normalise_id(arguments.get("objectId"))
+        fmt = (arguments.get("format") or "csv").strip().lower()
+        max_rows: Optional[int] = arguments.get("maxRows")
+        start_row = int(arguments.get("startRow") or 0)
+        if not app_id:
+            raise ValueError("appId is required. Use resourceId from qlik_get_apps (no {{ }}).")
+        if not object_id:
+            raise ValueError("objectId is required (no {{ }}).")
+        app_id = await self._resolve_app_id(app_id, api_key)
+        self.freshness.touch(app_id, api_key)
+        context = get_request_context()
+
+        obj_handle, layout = await self.engine.open_hypercube(app_id, object_id, api_key)
+        hypercube = await self.engine.table_view(app_id, api_key, obj_handle, layout.get("qHyperCube", {}))
+        columns = column_schema(hypercube)
+        cube_rows = hypercube.get("qSize", {}).get("qcy", 0)
+        end_row = min(cube_rows, start_row + max_rows) if max_rows else cube_rows
+        total_rows = max(0, end_row - start_row)
+
+        removed = await asyncio.to_thread(cleanup_exports, self.export_dir, self.max_age, self.max_bytes)
+        if removed:
+            logger.info("Removed %d old export files from %s", removed, self.export_dir)
+        path = export_path(self.export_dir, object_id, fmt)
+        writer = open_export_writer(fmt, path, columns)
+        next_row = start_row
+        truncated = False
+        pending: Optional[asyncio.Future] = None
+        try:
+            pages = self.engine.iter_hypercube_pages(app_id, api_key, obj_handle, hypercube, start_row=start_row, max_rows=max_rows)
+            page_started = time.monotonic()
+            last_page_seconds = 0.0
+            async for page_end, matrix in pages:
+                last_page_seconds = time.monotonic() - page_started
+                # Escrita em thread: o disco grava a página N enquanto a N+1 vem do Engine
+                if pending is not None:
+                    await pending
+                pending = asyncio.ensure_future(asyncio.to_thread(writer.write_rows, cell_values(matrix, columns)))
+                next_row = page_end
+                await context.report_progress(next_row - start_row, total_rows, f"Exported {next_row - start_row} of {total_rows} rows")
+                if context.deadline is not None and time.monotonic() + last_page_seconds >= context.deadline:
+                    truncated = next_row < end_row
+                    break
+                page_started = time.monotonic()
+            await pages.aclose()
+            if not truncated and next_row < end_row:
+                # O Engine devolveu uma página vazia antes do fim (cubo encolheu): o arquivo não tem tudo
+                truncated = True
+            if pending is not None:
+                await pending
+            await asyncio.to_thread(writer.close)
+        except BaseException:
+            # A thread de escrita não é interrompível: espera terminar antes de apagar o arquivo parcial
+            if pending is not None:
+                await asyncio.gather(pending, return_exceptions=True)
+            await asyncio.to_thread(writer.abort)
+            raise
+
+        response = {
+            "path": path,
+            "format": fmt,
+            "row_count": writer.rows,
+            "size_bytes": file_size(path),
+            "schema": columns,
+            "truncated": truncated,
+            "next_row": next_row if truncated else None
+        }
+        if hypercube.get("columns_truncated"):
+            response["columns_truncated"] = True
+        return response
@@ -0,0 +1,96 @@
+import asyncio
+import os
+import time
+from typing import Dict, Any
+from src.mcp.tools.base_tool import BaseTool
+from src.mcp.context import get_request_context
+from src.qlik.inventory import get_inventory_crawler
+from src.storage.object_index import get_object_index
+
+
+class QlikFindObjectsTool(BaseTool):
+    MAX_LIMIT = 100
+
+    def __init__(self):
+        self.crawler = get_inventory_crawler()
+        self.index = get_object_index()
+        # Na primeira busca de um usuário (índice vazio), espera a varredura até este tempo
+        self.first_crawl_wait = float(os.getenv("MCP_INVENTORY_FIRST_WAIT_SECONDS", "20"))
+
+    def get_schema(self) -> Dict[str, Any]:
+        return {
+            "name": "qlik_find_objects",
+            "description": "Search all apps you can access for sheets and charts/tables by words in their titles, dimension and measure names, sheet or app names (e.g. 'valores fornecedor', 'vendas por mês'). Returns appId, sheetId and objectId ready for qlik_get_chart_data, best matches first, in one call instead of walking qlik_get_apps -> qlik_get_app_sheets -> qlik_get_sheet_charts. Uses a local index refreshed in the background; if an expected object is missing, fall back to the step-by-step tools. READ-ONLY.",
+            "inputSchema": {
+                "type": "object",
+                "properties": {
+                    "query": {
+                        "type": "string",
+                        "description": "Words to look for (accents and case are ignored, partial words match)"
+                    },
+                    "appId": {
+                        "type": "string",
+                        "description": "Only search this app (resourceId)"
+                    },
+                    "type": {
+                        "type": "string",
+                        "description": "Only objects of this type (e.g. table, barchart, kpi, pivot-table, sheet)"
+                    },
+                    "limit": {
+                        "type": "integer",
+                        "description": "Maximum results (default: 20)",
+                        "minimum": 1,
+                        "maximum": self.MAX_LIMIT
+                    }
+                },
+                "required": ["query"]
+            }
+        }
+
+    async def execute(self, arguments: Dict[str, Any], api_key: str) -> Dict[str, Any]:
+        query = (arguments.get("query") or "").strip()
+        if not query:
+            raise ValueError("query is required (words from the chart title, dimensions or measures).")
+        limit = min(int(arguments.get("limit") or 20), self.MAX_LIMIT)
+        owner = await self.crawler.owner(api_key)
+
+        crawl = await self.crawler.register(api_key)
+        stats = await self.index.stats(owner)
+        if crawl is not None and not stats["apps"]:
+            # Primeiro uso: sem índice ainda, vale esperar a varredura (dentro do prazo do request)
+            wait = self.first_crawl_wait
+            deadline = get_request_context().deadline
+            if deadline is not None:
+                wait = min(wait, deadline - time.monotonic() - 1)
+            if wait > 0:
+                try:
+                    await asyncio.wait_for(asyncio.shield(crawl), wait)
+                except asyncio.TimeoutError:
+                    pass
+            stats = await self.index.stats(owner)
+
+        started = time.perf_counter()
+        results = await self.index.search(
+            owner,
+            query,
+            app_id=(arguments.get("appId") or "").strip() or None,
+            object_type=(arguments.get("type") or "").strip() or None,
+            limit=limit,
+        )
+        response = {
+            "results": results,
+            "total": len(results),
+            "index": {
+                "apps": stats["apps"],
+                "objects": stats["objects"],
+                "updating": self.crawler.crawling(owner) is not None,
+                "age_seconds": stats["newest_seconds"],
+            },
+            "search_ms": round((time.perf_counter() - started) * 1000, 2),
+        }
+        if not stats["apps"]:
+            response["message"] = (
+                "The object index is still being built for your apps. Try again shortly, "
+                "or use qlik_get_apps / qlik_get_app_sheets / qlik_get_sheet_charts."
+            )
+        return response
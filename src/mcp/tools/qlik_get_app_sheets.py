@@ -2,11 +2,13 @@ from typing import Dict, Any
 from src.mcp.tools.base_tool import BaseTool
 from src.qlik.engine import QlikEngineClient
 from src.qlik.client import QlikRestClient
+from src.qlik.freshness import get_freshness_tracker
 
 class QlikGetAppSheetsTool(BaseTool):
     def __init__(self):
         self.engine = QlikEngineClient()
         self.client = QlikRestClient()
+        self.freshness = get_freshness_tracker()
     
     def get_schema(self) -> Dict[str, Any]:
         return {
@@ -63,11 +65,12 @@ class QlikGetAppSheetsTool(BaseTool):
             raise Exception("Qlik Cloud API key is required to access Engine API")
 
         app_id = await self._resolve_app_id(app_id, api_key)
+        self.freshness.touch(app_id, api_key)
         
         try:
-            logger.info(f"Fetching sheets for app: {app_id}")
+            logger.info("Fetching sheets for app: %s", app_id, extra={"category": "tool"})
             sheets = await self.engine.get_sheets(app_id, api_key)
-            logger.info(f"Successfully retrieved {len(sheets)} sheets for app {app_id}")
+            logger.info("Successfully retrieved %d sheets for app %s", len(sheets), app_id, extra={"category": "tool"})
             
             return {
                 "appId": app_id,
@@ -1,10 +1,15 @@
 from typing import Dict, Any
 from src.mcp.tools.base_tool import BaseTool
 from src.qlik.client import QlikRestClient
+from src.qlik.freshness import get_freshness_tracker
+from src.qlik.inventory import get_inventory_crawler
 
 class QlikGetAppsTool(BaseTool):
     def __init__(self):
         self.client = QlikRestClient()
+        self.freshness = get_freshness_tracker()
+        # Listar apps é o começo da navegação: aproveita para indexar os objetos em background
+        self.inventory = get_inventory_crawler()
     
     def get_schema(self) -> Dict[str, Any]:
         return {
@@ -46,11 +51,14 @@ class QlikGetAppsTool(BaseTool):
             if limit < 1 or limit > 100:
                 raise ValueError("limit must be between 1 and 100")
             
-            logger.info(f"Fetching Qlik apps (limit={limit}, name_filter={name})")
+            logger.info("Fetching Qlik apps (limit=%s, name_filter=%s)", limit, name, extra={"category": "tool"})
             result = await self.client.get_apps(api_key, limit=limit, cursor=cursor, name=name)
             
             # Processar apps para garantir que tenham id e name claros
             apps_data = result.get("data", [])
+            # O catálogo traz lastReloadTime/updatedAt: detecta reload dos apps em uso sem request extra
+            await self.freshness.observe_items(apps_data)
+            await self.inventory.register(api_key)
             
             if not apps_data:
                 logger.warning("No apps found in Qlik Cloud response")
@@ -95,7 +103,7 @@ class QlikGetAppsTool(BaseTool):
                 
                 processed_apps.append(processed_app)
             
-            logger.info(f"Successfully processed {len(processed_apps)} apps")
+            logger.info("Successfully processed %d apps", len(processed_apps), extra={"category": "tool"})
             
             response = {
                 "apps": processed_apps,
@@ -1,17 +1,32 @@
-from typing import Dict, Any
+import os
+from typing import Dict, Any, List, Optional
 from src.mcp.tools.base_tool import BaseTool
+from src.mcp.context import get_request_context
+from src.mcp.cursors import encode_cursor, decode_cursor, CursorError
+from src.qlik.auth import token_fingerprint
+from src.storage.shared_cache import get_shared_cache, cache_key
+from src.storage.columnar_cache import ColumnarTableBuilder, get_columnar_cache
+from src.storage.exports import cell_values, column_schema
 from src.qlik.engine import QlikEngineClient
 from src.qlik.client import QlikRestClient
+from src.qlik.freshness import get_freshness_tracker
+from src.qlik.shaping import FIELDS, VALUE_FIELD, parse_fields
 
 class QlikGetChartDataTool(BaseTool):
     def __init__(self):
         self.engine = QlikEngineClient()
         self.client = QlikRestClient()
+        self.freshness = get_freshness_tracker()
+        self.cache = get_shared_cache()
+        # Resultados de hypercube no cache compartilhado (segundos); 0 = desativado
+        self.cache_ttl = float(os.getenv("MCP_CACHE_HYPERCUBE_TTL", "0"))
+        # Cubos lidos por inteiro ficam em memória para qlik_query_cached_data
+        self.columnar = get_columnar_cache()
     
     def get_schema(self) -> Dict[str, Any]:
         return {
             "name": "qlik_get_chart_data",
-            "description": "Extract actual data from a chart/table in a Qlik app (e.g. valores, fornecedores, produtos, totais). Returns rows with dimensions and measures. Flow: use qlik_get_app_sheets(appId) to get sheet IDs, then qlik_get_sheet_charts(appId, sheetId) to get object IDs, then this tool with (appId, objectId) to get the data. Set includeMeta=true for dimension/measure names. READ-ONLY.",
+            "description": "Extract actual data from a chart/table in a Qlik app (e.g. valores, fornecedores, produtos, totais). Returns rows with dimensions and measures (pivot tables: left dimensions then one column per visible top-header column, read as shown without expanding collapsed rows; columns_truncated=true when a pivot has more columns than one Engine page; for stacked charts maxRows/next_row count rows of the first dimension). Flow: use qlik_get_app_sheets(appId) to get sheet IDs, then qlik_get_sheet_charts(appId, sheetId) to get object IDs, then this tool with (appId, objectId) to get the data. Use format='values' for a compact answer: 'columns' (dimension/measure titles) plus rows of plain values (text for dimensions, numbers for measures) instead of full Qlik cells; or pick the cell fields with 'fields'. For totals, min/max, distinct counts and row counts use mode='summary': one call, no paging, plus the first sampleRows rows. Set includeMeta=true for dimension/measure details. With maxRows, the response has has_more, next_row and an opaque 'cursor': pass it back (same appId/objectId) to continue from the next row instead of re-fetching from the start. If the request deadline is hit, the rows read so far are returned with truncated=true (and a cursor to continue). READ-ONLY.",
             "inputSchema": {
                 "type": "object",
                 "properties": {
@@ -37,6 +52,31 @@ class QlikGetChartDataTool(BaseTool):
                     "includeMeta": {
                         "type": "boolean",
                         "description": "Include metadata about dimensions and measures (default: false)"
+                    },
+                    "mode": {
+                        "type": "string",
+                        "enum": ["rows", "summary"],
+                        "description": "rows (default): page through the data; summary: Engine-computed grand totals, min/max per measure, distinct values per dimension and row count, plus the first sampleRows rows"
+                    },
+                    "sampleRows": {
+                        "type": "integer",
+                        "description": "Rows included with mode='summary' (default: 10)",
+                        "minimum": 0,
+                        "maximum": 1000
+                    },
+                    "format": {
+                        "type": "string",
+                        "enum": ["cells", "values"],
+                        "description": "cells (default): full Qlik cells (qText, qNum, qElemNumber, qState...); values: header row in 'columns' and rows of native values, several times smaller"
+                    },
+                    "fields": {
+                        "type": "array",
+                        "items": {"type": "string", "enum": list(FIELDS)},
+                        "description": "Cell fields to keep (overrides format), e.g. [\"text\"] or [\"text\", \"num\"]. One field: each cell is a bare value; several: a list per cell in this order. 'value' = text for dimensions, number for measures"
+                    },
+                    "cursor": {
+                        "type": "string",
+                        "description": "Continuation cursor from a previous call (resumes at the next row; expires after a few minutes or when the app is reloaded)"
                     }
                 },
                 "required": ["appId", "objectId"]
@@ -71,21 +111,115 @@ class QlikGetChartDataTool(BaseTool):
     async def execute(self, arguments: Dict[str, Any], api_key: str) -> Dict[str, Any]:
         app_id = self._normalise_id(arguments.get("appId"))
         object_id = self._normalise_id(arguments.get("objectId"))
-        page_size = arguments.get("pageSize", 100)
+        page_size = arguments.get("pageSize")
         max_rows = arguments.get("maxRows")
         include_meta = arguments.get("includeMeta", False)
+        fields = parse_fields(arguments.get("fields"))
+        response_format = (arguments.get("format") or "cells").strip().lower()
+        if response_format not in ("cells", "values"):
+            raise ValueError("format must be 'cells' or 'values'.")
+        mode = (arguments.get("mode") or "rows").strip().lower()
+        if mode not in ("rows", "summary"):
+            raise ValueError("mode must be 'rows' or 'summary'.")
+        if fields is None and (response_format == "values" or (mode == "summary" and not arguments.get("format"))):
+            # No summary as amostras saem compactas, salvo format/fields explícito
+            fields = [VALUE_FIELD]
+        cursor = (arguments.get("cursor") or "").strip()
+        start_row = 0
+        expected_state = None
+        if cursor and mode == "summary":
+            raise ValueError("cursor is not used with mode='summary'. Call with mode='rows' to continue paging.")
+        if cursor:
+            # O cursor já carrega o app (resourceId resolvido), objeto, próxima linha e o estado de origem
+            position = decode_cursor(cursor, api_key)
+            if object_id and object_id != position["obj"]:
+                raise CursorError("Cursor belongs to a different objectId. Call again without 'cursor'.")
+            if app_id and app_id != position["app"] and await self._resolve_app_id(app_id, api_key) != position["app"]:
+                raise CursorError("Cursor belongs to a different appId. Call again without 'cursor'.")
+            app_id, object_id = position["app"], position["obj"]
+            start_row = position["row"]
+            expected_state = position["st"]
+            page_size = page_size or position.get("ps")
+            max_rows = max_rows or position.get("n")
+            if fields is None and position.get("f"):
+                fields = position["f"]
+        page_size = page_size or 100
         if not app_id:
             raise ValueError("appId is required. Use resourceId from qlik_get_apps (no {{ }}).")
         if not object_id:
             raise ValueError("objectId is required (no {{ }}).")
-        app_id = await self._resolve_app_id(app_id, api_key)
-        result = await self.engine.get_hypercube_data(
-            app_id,
-            object_id,
-            api_key,
-            page_size=page_size,
-            max_rows=max_rows,
-            include_meta=include_meta
-        )
+        if not cursor:
+            app_id = await self._resolve_app_id(app_id, api_key)
+        self.freshness.touch(app_id, api_key)
+        if mode == "summary":
+            return await self._summary(app_id, object_id, api_key, arguments.get("sampleRows"), fields)
+        context = get_request_context()
+
+        async def on_page(rows_fetched: int, total_rows: int):
+            await context.report_progress(rows_fetched, total_rows, f"Fetched {rows_fetched} of {total_rows} rows")
+
+        with_state = bool(max_rows) or context.deadline is not None
+        key = cache_key("hypercube", token_fingerprint(api_key), app_id, object_id, start_row, page_size, max_rows, include_meta, with_state, ",".join(fields or ()))
+        result = None
+        if self.cache_ttl > 0 and not expected_state:
+            result = await self.cache.get(key)
+        if result is None:
+            result = await self.engine.get_hypercube_data(
+                app_id,
+                object_id,
+                api_key,
+                page_size=page_size,
+                max_rows=max_rows,
+                include_meta=include_meta or self.columnar.enabled,
+                on_page=on_page,
+                start_row=start_row,
+                with_state=with_state,
+                expected_state=expected_state,
+                deadline=context.deadline,
+                fields=fields
+            )
+            if self.cache_ttl > 0 and not result.get("truncated"):
+                await self.cache.set(key, result, self.cache_ttl, tag=app_id)
+
+        if self.columnar.enabled and start_row == 0 and result.get("next_row") is None and not result.get("truncated"):
+            self._keep_columnar(api_key, app_id, object_id, result, fields)
+        if not include_meta:
+            result.pop("meta", None)
+
+        state = result.pop("state", None)
+        next_row = result.get("next_row")
+        result["has_more"] = next_row is not None
+        if next_row is not None and state:
+            result["cursor"] = encode_cursor(
+                {"app": app_id, "obj": object_id, "row": next_row, "st": state, "ps": page_size, "n": max_rows, "f": fields},
+                api_key,
+            )
         
         return result
+
+    async def _summary(self, app_id: str, object_id: str, api_key: str, sample_rows: Any,
+                       fields: Optional[List[str]]) -> Dict[str, Any]:
+        sample_rows = min(max(int(10 if sample_rows is None else sample_rows), 0), 1000)
+        key = cache_key("hypercube_summary", token_fingerprint(api_key), app_id, object_id, sample_rows, ",".join(fields or ()))
+        result = await self.cache.get(key) if self.cache_ttl > 0 else None
+        if result is None:
+            result = await self.engine.get_hypercube_summary(app_id, object_id, api_key, sample_rows=sample_rows, fields=fields)
+            if self.cache_ttl > 0:
+                await self.cache.set(key, result, self.cache_ttl, tag=app_id)
+        result["mode"] = "summary"
+        result["has_more"] = result["total_rows"] > len(result["sample"])
+        return result
+
+    def _keep_columnar(self, api_key: str, app_id: str, object_id: str, result: Dict[str, Any],
+                       fields: Optional[List[str]] = None):
+        meta = result.get("meta")
+        # Linhas já reduzidas só servem se forem os próprios valores (format="values")
+        if not meta or (fields and fields != [VALUE_FIELD]):
+            return
+        columns = column_schema({"qDimensionInfo": meta.get("dimensions", []), "qMeasureInfo": meta.get("measures", [])})
+        data = result.get("data") or []
+        if not columns or len(data) * len(columns) > self.columnar.max_cells:
+            return
+        builder = ColumnarTableBuilder(columns)
+        builder.add_rows(data if fields else cell_values(data, columns))
+        self.columnar.put(cache_key("columnar", token_fingerprint(api_key), app_id, object_id), builder.build(), tag=app_id)
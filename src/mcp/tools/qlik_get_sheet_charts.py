@@ -2,11 +2,13 @@ from typing import Dict, Any
 from src.mcp.tools.base_tool import BaseTool
 from src.qlik.engine import QlikEngineClient
 from src.qlik.client import QlikRestClient
+from src.qlik.freshness import get_freshness_tracker
 
 class QlikGetSheetChartsTool(BaseTool):
     def __init__(self):
         self.engine = QlikEngineClient()
         self.client = QlikRestClient()
+        self.freshness = get_freshness_tracker()
     
     def get_schema(self) -> Dict[str, Any]:
         return {
@@ -61,6 +63,7 @@ class QlikGetSheetChartsTool(BaseTool):
         if not sheet_id:
             raise ValueError("sheetId is required (no {{ }}).")
         app_id = await self._resolve_app_id(app_id, api_key)
+        self.freshness.touch(app_id, api_key)
         charts = await self.engine.get_sheet_objects(app_id, sheet_id, api_key)
         
         return {
@@ -0,0 +1,180 @@
+import time
+from typing import Dict, Any, Optional
+from src.mcp.tools.base_tool import BaseTool
+from src.mcp.context import get_request_context
+from src.qlik.auth import token_fingerprint
+from src.qlik.engine import QlikEngineClient
+from src.qlik.client import QlikRestClient
+from src.qlik.freshness import get_freshness_tracker
+from src.storage.shared_cache import cache_key
+from src.storage.columnar_cache import (
+    AGGREGATES, FILTER_OPS, ColumnarTable, ColumnarTableBuilder, get_columnar_cache
+)
+from src.storage.exports import cell_values, column_schema
+
+
+class QlikQueryCachedDataTool(BaseTool):
+    MAX_LIMIT = 10000
+
+    def __init__(self):
+        self.engine = QlikEngineClient()
+        self.client = QlikRestClient()
+        self.freshness = get_freshness_tracker()
+        self.cache = get_columnar_cache()
+
+    def get_schema(self) -> Dict[str, Any]:
+        return {
+            "name": "qlik_query_cached_data",
+            "description": "Answer follow-up questions on a chart's data locally (e.g. top 10 fornecedores, soma por mês, filtrar por região) with filter / group-by / aggregate / sort / top-N. Runs on the chart's full data kept in memory after qlik_get_chart_data read it (or loaded once by this tool), so repeated questions take milliseconds and do not hit Qlik again. Column names are the dimension/measure titles (see includeMeta in qlik_get_chart_data, or the 'columns' returned here). Set refresh=true to reload from Qlik. READ-ONLY.",
+            "inputSchema": {
+                "type": "object",
+                "properties": {
+                    "appId": {
+                        "type": "string",
+                        "description": "The app resourceId from qlik_get_apps (NOT the item id)"
+                    },
+                    "objectId": {
+                        "type": "string",
+                        "description": "The ID of the chart/object"
+                    },
+                    "filters": {
+                        "type": "array",
+                        "description": "Row filters, all must match",
+                        "items": {
+                            "type": "object",
+                            "properties": {
+                                "column": {"type": "string"},
+                                "op": {"type": "string", "enum": [*FILTER_OPS, "in", "not_in", "contains"]},
+                                "value": {"description": "Value to compare (a list for in/not_in)"}
+                            },
+                            "required": ["column", "value"]
+                        }
+                    },
+                    "groupBy": {
+                        "type": "array",
+                        "items": {"type": "string"},
+                        "description": "Columns to group by (default aggregates: count and sum of each measure)"
+                    },
+                    "aggregates": {
+                        "type": "array",
+                        "items": {
+                            "type": "object",
+                            "properties": {
+                                "func": {"type": "string", "enum": list(AGGREGATES)},
+                                "column": {"type": "string", "description": "Column to aggregate (omit for count of rows)"},
+                                "as": {"type": "string", "description": "Result column name"}
+                            },
+                            "required": ["func"]
+                        }
+                    },
+                    "sort": {
+                        "type": "array",
+                        "description": "Sort keys over the result columns, e.g. [{\"column\": \"sum(Valor)\", \"desc\": true}]",
+                        "items": {
+                            "type": "object",
+                            "properties": {"column": {"type": "string"}, "desc": {"type": "boolean"}},
+                            "required": ["column"]
+                        }
+                    },
+                    "columns": {
+                        "type": "array",
+                        "items": {"type": "string"},
+                        "description": "Columns to return when not aggregating (default: all)"
+                    },
+                    "limit": {
+                        "type": "integer",
+                        "description": "Maximum result rows (default: 100)",
+                        "minimum": 1,
+                        "maximum": self.MAX_LIMIT
+                    },
+                    "refresh": {
+                        "type": "boolean",
+                        "description": "Reload the data from Qlik before querying (default: false)"
+                    }
+                },
+                "required": ["appId", "objectId"]
+            }
+        }
+
+    def _normalise_id(self, val: Any) -> str:
+        if val is None:
+            return ""
+        s = str(val).strip()
+        if s.startswith("{{") and s.endswith("}}"):
+            s = s[2:-2].strip()
+        return s
+
+    def _looks_like_item_id(self, s: str) -> bool:
+        if not s or "-" in s or len(s) != 24:
+            return False
+        return s.isalnum()
+
+    async def _resolve_app_id(self, app_id: str, api_key: str) -> str:
+        if not self._looks_like_item_id(app_id):
+            return app_id
+        try:
+            item = await self.client.get_item(app_id, api_key)
+            resource_id = (item.get("resourceId") or "").strip()
+            if resource_id:
+                return resource_id
+        except Exception:
+            pass
+        return app_id
+
+    async def _load(self, app_id: str, object_id: str, api_key: str) -> ColumnarTable:
+        """Read the whole hypercube page by page straight into columns."""
+        context = get_request_context()
+        obj_handle, layout = await self.engine.open_hypercube(app_id, object_id, api_key)
+        hypercube = await self.engine.table_view(app_id, api_key, obj_handle, layout.get("qHyperCube", {}))
+        columns = column_schema(hypercube)
+        q_size = hypercube.get("qSize", {})
+        total_rows = q_size.get("qcy", 0)
+        if total_rows * len(columns) > self.cache.max_cells:
+            raise ValueError(
+                f"Chart has {total_rows} rows x {len(columns)} columns, above the in-memory query limit "
+                f"({self.cache.max_cells} cells). Use qlik_export_chart_data to export it instead."
+            )
+        builder = ColumnarTableBuilder(columns)
+        async for next_row, matrix in self.engine.iter_hypercube_pages(app_id, api_key, obj_handle, hypercube):
+            builder.add_rows(cell_values(matrix, columns))
+            await context.report_progress(next_row, total_rows, f"Loaded {next_row} of {total_rows} rows")
+        table = builder.build()
+        table.columns_truncated = bool(hypercube.get("columns_truncated"))
+        return table
+
+    async def execute(self, arguments: Dict[str, Any], api_key: str) -> Dict[str, Any]:
+        app_id = self._normalise_id(arguments.get("appId"))
+        object_id = self._normalise_id(arguments.get("objectId"))
+        limit: Optional[int] = min(int(arguments.get("limit") or 100), self.MAX_LIMIT)
+        if not app_id:
+            raise ValueError("appId is required. Use resourceId from qlik_get_apps (no {{ }}).")
+        if not object_id:
+            raise ValueError("objectId is required (no {{ }}).")
+        app_id = await self._resolve_app_id(app_id, api_key)
+        self.freshness.touch(app_id, api_key)
+
+        # Por token: um usuário nunca consulta dados lidos com o token de outro
+        key = cache_key("columnar", token_fingerprint(api_key), app_id, object_id)
+        table = None if arguments.get("refresh") else self.cache.get(key)
+        source = "cache"
+        if table is None:
+            table = await self._load(app_id, object_id, api_key)
+            self.cache.put(key, table, tag=app_id)
+            source = "qlik"
+
+        started = time.perf_counter()
+        result = table.query(
+            filters=arguments.get("filters"),
+            group_by=arguments.get("groupBy"),
+            aggregates=arguments.get("aggregates"),
+            sort=arguments.get("sort"),
+            limit=limit,
+            select=arguments.get("columns"),
+        )
+        result["source"] = source
+        result["cached_rows"] = table.row_count
+        result["data_age_seconds"] = round(time.monotonic() - table.created_at, 1)
+        result["query_ms"] = round((time.perf_counter() - started) * 1000, 2)
+        if table.columns_truncated:
+            result["columns_truncated"] = True
+        return result
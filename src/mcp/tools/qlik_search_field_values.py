@@ -0,0 +1,119 @@
+import os
+from typing import Dict, Any
+from src.mcp.tools.base_tool import BaseTool
+from src.qlik.auth import token_fingerprint
+from src.qlik.engine import QlikEngineClient
+from src.qlik.client import QlikRestClient
+from src.qlik.freshness import get_freshness_tracker
+from src.storage.shared_cache import get_shared_cache, cache_key
+
+
+class QlikSearchFieldValuesTool(BaseTool):
+    MAX_LIMIT = 1000
+
+    def __init__(self):
+        self.engine = QlikEngineClient()
+        self.client = QlikRestClient()
+        self.freshness = get_freshness_tracker()
+        self.cache = get_shared_cache()
+        # A chave inclui o reload do app, então o TTL pode ser longo
+        self.cache_ttl = float(os.getenv("MCP_CACHE_FIELD_VALUES_TTL", "3600"))
+
+    def get_schema(self) -> Dict[str, Any]:
+        return {
+            "name": "qlik_search_field_values",
+            "description": "List or search the values of a field in a Qlik app (e.g. exact supplier/customer/product names, which months exist) without extracting any chart. With 'search', returns the values matching the words (Qlik search: case/accent-insensitive, word prefixes, * and ? wildcards) and exactMatch when one equals the search. Without 'search', pages through all distinct values, sorted. Field names are the data model fields (often the same as the chart dimension titles). READ-ONLY.",
+            "inputSchema": {
+                "type": "object",
+                "properties": {
+                    "appId": {
+                        "type": "string",
+                        "description": "The app resourceId from qlik_get_apps (NOT the item id)"
+                    },
+                    "field": {
+                        "type": "string",
+                        "description": "Field name (case-sensitive), e.g. Fornecedor"
+                    },
+                    "search": {
+                        "type": "string",
+                        "description": "Text to look for in the values (omit to list all values)"
+                    },
+                    "offset": {
+                        "type": "integer",
+                        "description": "Number of values to skip (use nextOffset from the previous call)",
+                        "minimum": 0
+                    },
+                    "limit": {
+                        "type": "integer",
+                        "description": "Maximum values to return (default: 100)",
+                        "minimum": 1,
+                        "maximum": self.MAX_LIMIT
+                    }
+                },
+                "required": ["appId", "field"]
+            }
+        }
+
+    def _normalise_id(self, val: Any) -> str:
+        if val is None:
+            return ""
+        s = str(val).strip()
+        if s.startswith("{{") and s.endswith("}}"):
+            s = s[2:-2].strip()
+        return s
+
+    def _looks_like_item_id(self, s: str) -> bool:
+        if not s or "-" in s or len(s) != 24:
+            return False
+        return s.isalnum()
+
+    async def _resolve_app_id(self, app_id: str, api_key: str) -> str:
+        if not self._looks_like_item_id(app_id):
+            return app_id
+        try:
+            item = await self.client.get_item(app_id, api_key)
+            resource_id = (item.get("resourceId") or "").strip()
+            if resource_id:
+                return resource_id
+        except Exception:
+            pass
+        return app_id
+
+    async def execute(self, arguments: Dict[str, Any], api_key: str) -> Dict[str, Any]:
+        app_id = self._normalise_id(arguments.get("appId"))
+        field = (arguments.get("field") or "").strip()
+        search = (arguments.get("search") or "").strip()
+        offset = max(0, int(arguments.get("offset") or 0))
+        limit = min(int(arguments.get("limit") or 100), self.MAX_LIMIT)
+        if not app_id:
+            raise ValueError("appId is required. Use resourceId from qlik_get_apps (no {{ }}).")
+        if not field:
+            raise ValueError("field is required (a field name of the app's data model).")
+        app_id = await self._resolve_app_id(app_id, api_key)
+        self.freshness.touch(app_id, api_key)
+
+        # GetAppLayout na sessão já aberta: o reload entra na chave (e avisa o freshness se o app mudou)
+        reload_time = (await self.engine.get_app_layout(app_id, api_key)).get("qLastReloadTime")
+        key = cache_key("field_values", token_fingerprint(api_key), app_id, field, search, offset, limit, reload_time)
+        result = await self.cache.get(key) if self.cache_ttl > 0 else None
+        source = "cache"
+        if result is None:
+            source = "qlik"
+            result = await self.engine.get_field_values(app_id, field, api_key, search=search or None, offset=offset, limit=limit)
+            if self.cache_ttl > 0:
+                await self.cache.set(key, result, self.cache_ttl, tag=app_id)
+
+        response = {
+            "appId": app_id,
+            "field": field,
+            "values": result["values"],
+            "total": result["total"],
+            "offset": offset,
+            "hasMore": result["next_offset"] is not None,
+            "nextOffset": result["next_offset"],
+            "source": source,
+        }
+        if search:
+            response["search"] = search
+            response["exactMatch"] = next((v for v in result["values"] if v and v.casefold() == search.casefold()), None)
+        return response
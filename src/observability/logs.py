@@ -0,0 +1,181 @@
+import atexit
+import copy
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import sys
+from datetime import datetime, timezone
+from typing import Dict, Optional
+
+# Atributos padrão de LogRecord; o resto (extra=...) vira campo no JSON
+_RESERVED_ATTRS = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime"}
+
+TEXT_FORMAT = "%(asctime)s - %(name)s - %(levelname)s - %(message)s"
+_EXCEPTION_FORMATTER = logging.Formatter()
+
+_listener: Optional[logging.handlers.QueueListener] = None
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line: ts, level, logger, msg, any extra fields and the exception, if any."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, tz=timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        for key, value in record.__dict__.items():
+            if key not in _RESERVED_ATTRS and not key.startswith("_"):
+                entry[key] = value
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            # Exceção já serializada antes da fila (StructuredQueueHandler)
+            entry["exc"] = record.exc_text
+        return json.dumps(entry, default=str, ensure_ascii=False)
+
+
+class StructuredQueueHandler(logging.handlers.QueueHandler):
+    """
+    QueueHandler that keeps the record structured for the listener's formatter.
+
+    The stock prepare() formats the whole record (traceback included) into msg
+    and drops exc_info, so JsonFormatter never saw the exception. Here only the
+    message is merged with its args and the exception goes to exc_text, which
+    both JsonFormatter ("exc") and logging.Formatter render.
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record = copy.copy(record)
+        record.message = record.getMessage()
+        record.msg = record.message
+        record.args = None
+        if record.exc_info:
+            # O traceback (frames) não deve atravessar a fila; só o texto
+            record.exc_text = record.exc_text or _EXCEPTION_FORMATTER.formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+
+class SamplingFilter(logging.Filter):
+    """
+    Keep only a fraction of high-volume records. A record opts in by passing
+    extra={"category": "<name>"}; rates come from LOG_SAMPLING ("request=0.1,qix=0.01").
+    WARNING and above are never dropped.
+    """
+
+    def __init__(self, rates: Dict[str, float]):
+        super().__init__()
+        self.rates = rates
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno >= logging.WARNING:
+            return True
+        rate = self.rates.get(getattr(record, "category", None), 1.0)
+        return rate >= 1.0 or random.random() < rate
+
+
+def parse_sampling(spec: str) -> Dict[str, float]:
+    rates: Dict[str, float] = {}
+    for part in (spec or "").split(","):
+        name, sep, value = part.partition("=")
+        if not sep or not name.strip():
+            continue
+        try:
+            rates[name.strip()] = max(0.0, min(1.0, float(value)))
+        except ValueError:
+            continue
+    return rates
+
+
+def setup_logging():
+    """
+    Configure the root logger from the environment:
+
+    - LOG_LEVEL (INFO), LOG_FORMAT (text | json)
+    - LOG_QUEUE (true): records go through a QueueHandler and are written by a
+      QueueListener thread, so handler I/O never runs on the event loop
+    - LOG_SAMPLING: per-category sampling rates, see SamplingFilter
+
+    Idempotent: calling it again (e.g. in each uvicorn worker) is a no-op.
+    """
+    global _listener
+    root = logging.getLogger()
+    if getattr(root, "_mcp_configured", False):
+        return
+    level = os.getenv("LOG_LEVEL", "INFO").upper()
+    formatter: logging.Formatter
+    if os.getenv("LOG_FORMAT", "text").strip().lower() == "json":
+        formatter = JsonFormatter()
+    else:
+        formatter = logging.Formatter(TEXT_FORMAT)
+    stream_handler = logging.StreamHandler(sys.stderr)
+    stream_handler.setFormatter(formatter)
+
+    use_queue = os.getenv("LOG_QUEUE", "true").strip().lower() not in ("0", "false", "no", "off")
+    if use_queue:
+        handler: logging.Handler = StructuredQueueHandler(queue.SimpleQueue())
+        _listener = logging.handlers.QueueListener(handler.queue, stream_handler, respect_handler_level=True)
+        _listener.start()
+        atexit.register(shutdown_logging)
+    else:
+        handler = stream_handler
+    handler.addFilter(SamplingFilter(parse_sampling(os.getenv("LOG_SAMPLING", ""))))
+
+    for existing in list(root.handlers):
+        root.removeHandler(existing)
+    root.addHandler(handler)
+    root.setLevel(level)
+    root._mcp_configured = True
+
+
+def shutdown_logging():
+    """Flush and stop the queue listener thread (records still queued are written)."""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+class JsonlWriter:
+    """
+    Appends JSON lines to a file from a QueueListener thread, so file I/O never
+    runs on the event loop (trace exporter, traffic capture, cassettes).
+    """
+
+    def __init__(self, path: str, name: str):
+        self.path = path
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._file_handler = logging.FileHandler(path, encoding="utf-8")
+        self._file_handler.setFormatter(logging.Formatter("%(message)s"))
+        self._queue_handler = logging.handlers.QueueHandler(queue.SimpleQueue())
+        self._listener: Optional[logging.handlers.QueueListener] = logging.handlers.QueueListener(
+            self._queue_handler.queue, self._file_handler
+        )
+        self._listener.start()
+        self._logger = logging.getLogger(name)
+        self._logger.addHandler(self._queue_handler)
+        self._logger.propagate = False
+        self._logger.setLevel(logging.INFO)
+
+    def write(self, line: str):
+        self._logger.info(line)
+
+    def close(self):
+        """Write what is still queued and close the file."""
+        if self._listener is not None:
+            self._listener.stop()
+            self._listener = None
+            self._logger.removeHandler(self._queue_handler)
+            self._file_handler.close()
+
+
+def open_jsonl_writer(path: str, name: str) -> JsonlWriter:
+    """JSONL writer for path; name is the (non-propagating) logger its lines go through."""
+    return JsonlWriter(path, name)
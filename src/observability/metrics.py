@@ -0,0 +1,200 @@
+import bisect
+import time
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+LabelValues = Tuple[str, ...]
+
+DEFAULT_LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+BYTES_BUCKETS = (1_000, 10_000, 100_000, 1_000_000, 10_000_000, 50_000_000)
+COUNT_BUCKETS = (1, 2, 3, 5, 10, 20, 50, 100, 500, 1000)
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: Optional[Tuple[str, str]] = None) -> str:
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.append(f'{extra[0]}="{extra[1]}"')
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class _Metric(ABC):
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+
+    def _key(self, labels: Dict[str, str]) -> LabelValues:
+        return tuple(str(labels.get(n, "")) for n in self.labelnames)
+
+    @abstractmethod
+    def samples(self) -> List[str]:
+        """Exposition lines for every label set, without the HELP/TYPE header."""
+
+    def render(self) -> str:
+        header = f"# HELP {self.name} {self.documentation}\n# TYPE {self.name} {self.kind}\n"
+        return header + "".join(line + "\n" for line in self.samples())
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[LabelValues, float] = {} if self.labelnames else {(): 0}
+
+    def inc(self, amount: float = 1, **labels: str):
+        key = self._key(labels)
+        self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels: str) -> float:
+        return self._values.get(self._key(labels), 0)
+
+    def samples(self) -> List[str]:
+        return [f"{self.name}{_format_labels(self.labelnames, k)} {_format_value(v)}" for k, v in self._values.items()]
+
+
+class Gauge(_Metric):
+    """Gauge set explicitly, or computed at scrape time when created with a callback."""
+    kind = "gauge"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 callback: Optional[Callable[[], float]] = None):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[LabelValues, float] = {}
+        self._callback = callback
+
+    def set(self, value: float, **labels: str):
+        self._values[self._key(labels)] = value
+
+    def samples(self) -> List[str]:
+        if self._callback is not None:
+            return [f"{self.name} {_format_value(self._callback())}"]
+        return [f"{self.name}{_format_labels(self.labelnames, k)} {_format_value(v)}" for k, v in self._values.items()]
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # por label: [contagem por bucket..., +Inf], soma
+        self._counts: Dict[LabelValues, List[int]] = {}
+        self._sums: Dict[LabelValues, float] = {}
+
+    def observe(self, value: float, **labels: str):
+        key = self._key(labels)
+        counts = self._counts.get(key)
+        if counts is None:
+            counts = self._counts[key] = [0] * (len(self.buckets) + 1)
+            self._sums[key] = 0.0
+        counts[bisect.bisect_left(self.buckets, value)] += 1
+        self._sums[key] += value
+
+    @contextmanager
+    def time(self, **labels: str) -> Iterator[None]:
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def samples(self) -> List[str]:
+        lines = []
+        for key, counts in self._counts.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                labels = _format_labels(self.labelnames, key, ("le", _format_value(bound)))
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(self._sums[key])}")
+            lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+
+    def register(self, metric: _Metric) -> _Metric:
+        self._metrics[metric.name] = metric
+        return metric
+
+    def render(self) -> str:
+        """Prometheus text exposition format (version 0.0.4)."""
+        return "".join(m.render() for m in self._metrics.values())
+
+
+REGISTRY = Registry()
+
+# MCP tools
+TOOL_CALLS = REGISTRY.register(Counter("mcp_tool_calls_total", "MCP tool calls", ["tool"]))
+TOOL_DURATION = REGISTRY.register(Histogram("mcp_tool_duration_seconds", "MCP tool execution latency", ["tool"]))
+TOOL_ERRORS = REGISTRY.register(Counter(
+    "mcp_tool_errors_total", "MCP tool errors by class (qep104, timeout, connect, auth, cursor, other)", ["tool", "error_class"]
+))
+TOOL_RESPONSE_BYTES = REGISTRY.register(Histogram(
+    "mcp_tool_response_bytes", "Size of the serialized tool result", ["tool"], buckets=BYTES_BUCKETS
+))
+TOOL_QIX_ROUND_TRIPS = REGISTRY.register(Histogram(
+    "mcp_tool_qix_round_trips", "QIX round trips per tool call", ["tool"], buckets=COUNT_BUCKETS
+))
+
+# Qlik Engine (QIX over WebSocket)
+QIX_REQUESTS = REGISTRY.register(Counter("qix_requests_total", "QIX requests sent to the Engine", ["method"]))
+QIX_DURATION = REGISTRY.register(Histogram("qix_request_duration_seconds", "QIX round-trip latency", ["method"]))
+ENGINE_WS_OPENS = REGISTRY.register(Counter("engine_ws_opens_total", "Engine WebSocket connections opened"))
+ENGINE_WS_EVICTIONS = REGISTRY.register(Counter(
+    "engine_ws_evictions_total", "Engine WebSocket connections dropped from the pool", ["reason"]
+))
+
+# Qlik REST
+REST_DURATION = REGISTRY.register(Histogram("rest_request_duration_seconds", "Qlik REST API latency", ["endpoint", "status"]))
+
+# Caches
+CACHE_REQUESTS = REGISTRY.register(Counter("cache_requests_total", "Cache lookups by cache and result", ["cache", "result"]))
+CACHE_INVALIDATIONS = REGISTRY.register(Counter(
+    "cache_invalidations_total", "App caches invalidated because the app changed (reload/update)", ["source"]
+))
+
+
+def register_gauge_callback(name: str, documentation: str, callback: Callable[[], float]):
+    REGISTRY.register(Gauge(name, documentation, callback=callback))
+
+
+# Contador de round trips QIX do request corrente (o handler inicia um por tools/call)
+_qix_round_trips: ContextVar[Optional[List[int]]] = ContextVar("qix_round_trips", default=None)
+
+
+@contextmanager
+def qix_round_trip_counter() -> Iterator[List[int]]:
+    """Count QIX round trips made inside the block (counter[0]), including in child tasks."""
+    counter = [0]
+    token = _qix_round_trips.set(counter)
+    try:
+        yield counter
+    finally:
+        _qix_round_trips.reset(token)
+
+
+def count_qix_round_trip(method: str):
+    QIX_REQUESTS.inc(method=method)
+    counter = _qix_round_trips.get()
+    if counter is not None:
+        counter[0] += 1
@@ -0,0 +1,104 @@
+import cProfile
+import hmac
+import io
+import json
+import logging
+import os
+import pstats
+import re
+import time
+from contextlib import asynccontextmanager
+from datetime import datetime
+from typing import Any, AsyncIterator, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class RequestProfiler:
+    """
+    Profile a single /mcp request on demand, without redeploying.
+
+    A request is profiled when it carries X-MCP-Profile with the value of
+    MCP_PROFILE_TOKEN (privileged: no token configured means the header is
+    ignored), or for every request when MCP_PROFILE_ALWAYS=true.
+
+    cProfile runs with the event-loop thread's CPU clock, so the .pstats file
+    shows where CPU goes (JSON serialisation, Engine response parsing...). The
+    .json summary separates wall time, CPU time and await time (wall - CPU).
+    Only one request is profiled at a time: cProfile sees the whole loop thread,
+    so concurrent requests in the window are included in the profile.
+    """
+    TOP_FUNCTIONS = 25
+
+    def __init__(self):
+        self.token = (os.getenv("MCP_PROFILE_TOKEN") or "").strip()
+        self.always = os.getenv("MCP_PROFILE_ALWAYS", "false").strip().lower() in ("1", "true", "yes", "on")
+        self.output_dir = os.getenv("MCP_PROFILE_DIR", "profiles")
+        self._busy = False
+
+    def wants(self, header_value: Optional[str]) -> bool:
+        if self.always:
+            return True
+        if not self.token or not header_value:
+            return False
+        return hmac.compare_digest(header_value.strip(), self.token)
+
+    @asynccontextmanager
+    async def profile(self, label: str) -> AsyncIterator[Optional[Dict[str, Any]]]:
+        """Yield a dict that receives profile_id/paths once the block ends (None when another profile is running)."""
+        if self._busy:
+            logger.info("Profiling skipped for %s: another request is being profiled", label)
+            yield None
+            return
+        self._busy = True
+        info: Dict[str, Any] = {}
+        profiler = cProfile.Profile(time.thread_time)
+        wall_started = time.perf_counter()
+        cpu_started = time.thread_time()
+        profiler.enable()
+        try:
+            yield info
+        finally:
+            profiler.disable()
+            wall = time.perf_counter() - wall_started
+            cpu = time.thread_time() - cpu_started
+            self._busy = False
+            try:
+                info.update(self._write(profiler, label, wall, cpu))
+                logger.info("Request profile written: %s (wall=%.1fms cpu=%.1fms)", info["pstats"], wall * 1000, cpu * 1000)
+            except Exception as e:
+                logger.warning("Failed to write request profile: %s", e)
+
+    def _write(self, profiler: cProfile.Profile, label: str, wall: float, cpu: float) -> Dict[str, Any]:
+        os.makedirs(self.output_dir, exist_ok=True)
+        safe_label = re.sub(r"[^A-Za-z0-9_.-]+", "_", label)[:60]
+        profile_id = f"{datetime.utcnow().strftime('%Y%m%dT%H%M%S%f')}-{safe_label}"
+        base = os.path.join(self.output_dir, profile_id)
+        profiler.dump_stats(f"{base}.pstats")
+        summary = {
+            "profile_id": profile_id,
+            "label": label,
+            "wall_ms": round(wall * 1000, 3),
+            "cpu_ms": round(cpu * 1000, 3),
+            "await_ms": round(max(0.0, wall - cpu) * 1000, 3),
+            "top_functions": self._top_functions(profiler),
+        }
+        with open(f"{base}.json", "w", encoding="utf-8") as f:
+            json.dump(summary, f, indent=2)
+        return {"profile_id": profile_id, "pstats": f"{base}.pstats", "summary": f"{base}.json"}
+
+    def _top_functions(self, profiler: cProfile.Profile) -> List[Dict[str, Any]]:
+        stats = pstats.Stats(profiler, stream=io.StringIO())
+        rows = []
+        for (filename, line, func), (cc, nc, tottime, cumtime, _) in stats.stats.items():
+            rows.append({
+                "function": f"{func} ({os.path.basename(filename)}:{line})",
+                "calls": nc,
+                "self_cpu_ms": round(tottime * 1000, 3),
+                "cumulative_cpu_ms": round(cumtime * 1000, 3),
+            })
+        rows.sort(key=lambda r: r["self_cpu_ms"], reverse=True)
+        return rows[:self.TOP_FUNCTIONS]
+
+
+profiler = RequestProfiler()
@@ -0,0 +1,172 @@
+import json
+import logging
+import os
+import re
+import secrets
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from src.observability.logs import JsonlWriter, open_jsonl_writer
+
+logger = logging.getLogger(__name__)
+
+_TRACEPARENT_RE = re.compile(r"^([0-9a-f]{2})-([0-9a-f]{32})-([0-9a-f]{16})-([0-9a-f]{2})$")
+
+
+def parse_traceparent(header: Optional[str]) -> Optional[Tuple[str, str, bool]]:
+    """Parse a W3C traceparent header into (trace_id, parent_span_id, sampled); None when absent/invalid."""
+    match = _TRACEPARENT_RE.match((header or "").strip().lower())
+    if not match:
+        return None
+    version, trace_id, span_id, flags = match.groups()
+    if version == "ff" or trace_id == "0" * 32 or span_id == "0" * 16:
+        return None
+    return trace_id, span_id, bool(int(flags, 16) & 0x01)
+
+
+class Span:
+    """
+    Minimal span with the OpenTelemetry API surface used here (set_attribute,
+    set_status, record_exception, add_event). Exported as OTel-style JSON.
+    """
+
+    def __init__(self, name: str, trace_id: str, span_id: str, parent_id: Optional[str],
+                 attributes: Optional[Dict[str, Any]] = None, recording: bool = True):
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = span_id
+        self.parent_id = parent_id
+        self.attributes: Dict[str, Any] = dict(attributes or {})
+        self.events: List[Dict[str, Any]] = []
+        self.status = "UNSET"
+        self.status_description: Optional[str] = None
+        self.recording = recording
+        self.start_ns = time.time_ns()
+        self.end_ns: Optional[int] = None
+
+    def is_recording(self) -> bool:
+        return self.recording
+
+    def set_attribute(self, key: str, value: Any):
+        self.attributes[key] = value
+
+    def add_event(self, name: str, attributes: Optional[Dict[str, Any]] = None):
+        self.events.append({"name": name, "timestamp": time.time_ns(), "attributes": attributes or {}})
+
+    def set_status(self, status: str, description: Optional[str] = None):
+        self.status = status
+        self.status_description = description
+
+    def record_exception(self, exc: BaseException):
+        self.add_event("exception", {"exception.type": type(exc).__name__, "exception.message": str(exc)})
+
+    def end(self):
+        if self.end_ns is None:
+            self.end_ns = time.time_ns()
+
+    @property
+    def traceparent(self) -> str:
+        return f"00-{self.trace_id}-{self.span_id}-{'01' if self.recording else '00'}"
+
+    def to_dict(self) -> Dict[str, Any]:
+        end_ns = self.end_ns or time.time_ns()
+        return {
+            "name": self.name,
+            "context": {"trace_id": self.trace_id, "span_id": self.span_id},
+            "parent_id": self.parent_id,
+            "start_time": self.start_ns,
+            "end_time": end_ns,
+            "duration_ms": round((end_ns - self.start_ns) / 1e6, 3),
+            "status": {"status_code": self.status, "description": self.status_description},
+            "attributes": self.attributes,
+            "events": self.events,
+        }
+
+
+class _NoopSpan(Span):
+    def __init__(self):
+        super().__init__("", "0" * 32, "0" * 16, None, recording=False)
+
+    def set_attribute(self, key: str, value: Any):
+        pass
+
+    def add_event(self, name: str, attributes: Optional[Dict[str, Any]] = None):
+        pass
+
+
+_NOOP_SPAN = _NoopSpan()
+_current_span: ContextVar[Optional[Span]] = ContextVar("mcp_current_span", default=None)
+
+
+class Tracer:
+    """
+    Tracer configured from the environment:
+
+    - MCP_TRACING: none (default, spans are no-ops), console (JSON via logging)
+      or file (JSON lines appended to MCP_TRACE_FILE, written by a background thread)
+    - MCP_TRACE_FILE: path for the file exporter (traces.jsonl)
+
+    An incoming W3C traceparent is honoured (trace id and sampled flag).
+    """
+
+    def __init__(self):
+        self.exporter = os.getenv("MCP_TRACING", "none").strip().lower()
+        self.enabled = self.exporter in ("console", "file")
+        self._export_logger = logging.getLogger("mcp.traces")
+        self._writer: Optional[JsonlWriter] = None
+        if self.exporter == "file":
+            self._writer = open_jsonl_writer(os.getenv("MCP_TRACE_FILE", "traces.jsonl"), "mcp.traces")
+
+    @contextmanager
+    def start_as_current_span(self, name: str, attributes: Optional[Dict[str, Any]] = None,
+                              traceparent: Optional[str] = None) -> Iterator[Span]:
+        if not self.enabled:
+            yield _NOOP_SPAN
+            return
+        parent = _current_span.get()
+        remote = parse_traceparent(traceparent) if traceparent else None
+        if remote:
+            trace_id, parent_id, sampled = remote
+        elif parent is not None:
+            trace_id, parent_id, sampled = parent.trace_id, parent.span_id, parent.recording
+        else:
+            trace_id, parent_id, sampled = secrets.token_hex(16), None, True
+        span = Span(name, trace_id, secrets.token_hex(8), parent_id, attributes, recording=sampled)
+        token = _current_span.set(span)
+        try:
+            yield span
+        except BaseException as e:
+            span.record_exception(e)
+            span.set_status("ERROR", str(e) or type(e).__name__)
+            raise
+        finally:
+            span.end()
+            _current_span.reset(token)
+            if span.recording:
+                self._export(span)
+
+    def _export(self, span: Span):
+        try:
+            line = json.dumps(span.to_dict(), default=str, separators=(",", ":"))
+            if self._writer is not None:
+                self._writer.write(line)
+            else:
+                self._export_logger.info(line)
+        except Exception as e:
+            logger.debug("Span export failed: %s", e)
+
+    def shutdown(self):
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+
+
+tracer = Tracer()
+
+
+def current_traceparent() -> Optional[str]:
+    """traceparent header for outgoing calls made inside the current span (None when tracing is off)."""
+    span = _current_span.get()
+    return span.traceparent if span is not None else None
@@ -0,0 +1,48 @@
+import json
+import logging
+import os
+import time
+from typing import Any, Optional
+
+from src.observability.logs import JsonlWriter, open_jsonl_writer
+from src.qlik.auth import token_fingerprint
+
+logger = logging.getLogger(__name__)
+
+
+class TrafficRecorder:
+    """
+    Append incoming tools/call requests to a JSONL file (MCP_TRAFFIC_CAPTURE_FILE)
+    for replay with benchmarks/replay.py.
+
+    Each line: {"ts": <epoch seconds>, "user": <token fingerprint>, "body": <JSON-RPC request>}.
+    Tokens never reach the file: users are identified only by fingerprint. Lines
+    are written by a background thread, like the file trace exporter.
+    """
+
+    def __init__(self):
+        self.path = (os.getenv("MCP_TRAFFIC_CAPTURE_FILE") or "").strip()
+        self.enabled = bool(self.path)
+        self._writer: Optional[JsonlWriter] = open_jsonl_writer(self.path, "mcp.traffic") if self.enabled else None
+
+    def record(self, body: Any, token: Optional[str]):
+        if self._writer is None:
+            return
+        items = body if isinstance(body, list) else [body]
+        user = token_fingerprint(token) if token else None
+        now = time.time()
+        for item in items:
+            if not isinstance(item, dict) or item.get("method") != "tools/call":
+                continue
+            try:
+                self._writer.write(json.dumps({"ts": now, "user": user, "body": item}, separators=(",", ":")))
+            except Exception as e:
+                logger.debug("Traffic capture failed: %s", e)
+
+    def shutdown(self):
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+
+
+traffic_recorder = TrafficRecorder()
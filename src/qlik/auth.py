@@ -1,6 +1,12 @@
+import hashlib
 import os
 from typing import Optional
 
+
+def token_fingerprint(api_key: Optional[str]) -> str:
+    """Short, non-reversible id of a Qlik token, used to scope pooled sessions, caches and cursors per user."""
+    return hashlib.sha256((api_key or "").strip().encode("utf-8")).hexdigest()[:16]
+
 class QlikAuth:
     """QlikAuth using API key from master user"""
     def __init__(self):
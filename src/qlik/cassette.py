@@ -0,0 +1,209 @@
+import asyncio
+import json
+import logging
+import os
+import time
+from collections import defaultdict
+from typing import Any, Dict, Iterable, List, Optional
+
+from src.observability.logs import JsonlWriter, open_jsonl_writer
+
+logger = logging.getLogger(__name__)
+
+REDACTED = "<redacted>"
+
+
+def _canonical(value: Any) -> str:
+    return json.dumps(value, sort_keys=True, separators=(",", ":"), default=str)
+
+
+def redact(value: Any, secrets: Iterable[str]) -> Any:
+    """Replace every occurrence of the given secrets (tokens) inside strings of a JSON-like value."""
+    secrets = [s for s in secrets if s]
+    if not secrets:
+        return value
+    if isinstance(value, str):
+        for secret in secrets:
+            value = value.replace(secret, REDACTED)
+        return value
+    if isinstance(value, dict):
+        return {k: redact(v, secrets) for k, v in value.items()}
+    if isinstance(value, list):
+        return [redact(v, secrets) for v in value]
+    return value
+
+
+def qix_key(app_id: str, method: str, handle: Any, params: Any) -> str:
+    return f"qix|{app_id}|{method}|{handle}|{_canonical(params)}"
+
+
+def rest_key(method: str, path: str, params: Optional[Dict[str, Any]]) -> str:
+    return f"rest|{method}|{path}|{_canonical(sorted((params or {}).items()))}"
+
+
+class Cassette:
+    """
+    Record / replay of the Qlik traffic (QIX over WebSocket and REST), configured by:
+
+    - QLIK_RECORD_MODE: off (default), record or replay
+    - QLIK_CASSETTE_DIR (cassettes) and QLIK_CASSETTE (default): file <dir>/<name>.jsonl
+    - QLIK_REPLAY_SPEED: 1 replays with the recorded latencies, 2 twice as fast, 0 without delay
+
+    Recording never stores headers or the WebSocket URL, and the caller's token is
+    replaced by <redacted> anywhere it appears in requests or responses. In replay
+    no connection to Qlik is opened: responses are served by key (app, method,
+    handle, params / path, query) in recorded order; once a key's recordings are
+    used up the last one is repeated, so a cassette can back a benchmark loop.
+    """
+
+    def __init__(self, mode: str, path: str, speed: float = 1.0):
+        self.mode = mode
+        self.path = path
+        self.speed = speed
+        self._entries: Dict[str, List[Dict[str, Any]]] = defaultdict(list)
+        self._positions: Dict[str, int] = defaultdict(int)
+        self._writer: Optional[JsonlWriter] = None
+        if mode == "record":
+            self._writer = open_jsonl_writer(path, "mcp.cassette")
+        elif mode == "replay":
+            self._load()
+
+    @classmethod
+    def from_env(cls) -> Optional["Cassette"]:
+        mode = os.getenv("QLIK_RECORD_MODE", "off").strip().lower()
+        if mode not in ("record", "replay"):
+            return None
+        directory = os.getenv("QLIK_CASSETTE_DIR", "cassettes")
+        name = os.getenv("QLIK_CASSETTE", "default").strip() or "default"
+        return cls(mode, os.path.join(directory, f"{name}.jsonl"), float(os.getenv("QLIK_REPLAY_SPEED", "1")))
+
+    @property
+    def recording(self) -> bool:
+        return self.mode == "record"
+
+    @property
+    def replaying(self) -> bool:
+        return self.mode == "replay"
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            raise Exception(f"QLIK_RECORD_MODE=replay but cassette {self.path} does not exist")
+        with open(self.path, encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    entry = json.loads(line)
+                    self._entries[entry["key"]].append(entry)
+        logger.info("Loaded cassette %s (%d keys)", self.path, len(self._entries))
+
+    def record(self, key: str, entry: Dict[str, Any], secrets: Iterable[str] = ()):
+        entry = redact(dict(entry, key=key, ts=time.time()), list(secrets))
+        try:
+            self._writer.write(_canonical(entry))
+        except Exception as e:
+            logger.warning("Failed to record Qlik interaction: %s", e)
+
+    def lookup(self, key: str) -> Optional[Dict[str, Any]]:
+        entries = self._entries.get(key)
+        if not entries:
+            return None
+        position = self._positions[key]
+        self._positions[key] = position + 1
+        return entries[min(position, len(entries) - 1)]
+
+    async def delay(self, entry: Dict[str, Any]):
+        if self.speed > 0:
+            await asyncio.sleep(entry.get("duration_ms", 0) / 1000 / self.speed)
+
+    def close(self):
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+
+
+class RecordingWebSocket:
+    """Wraps an Engine WebSocket and records each request with its matching response."""
+
+    def __init__(self, ws: Any, cassette: Cassette, app_id: str, api_key: str):
+        self._ws = ws
+        self._cassette = cassette
+        self._app_id = app_id
+        self._api_key = api_key
+        self._pending: Dict[Any, Dict[str, Any]] = {}
+
+    @property
+    def closed(self) -> bool:
+        return self._ws.closed
+
+    async def send(self, message: str):
+        request = json.loads(message)
+        self._pending[request.get("id")] = {"request": request, "started": time.perf_counter()}
+        await self._ws.send(message)
+
+    async def recv(self) -> str:
+        message = await self._ws.recv()
+        try:
+            response = json.loads(message)
+            pending = self._pending.pop(response.get("id"), None)
+            if pending is not None:
+                request = pending["request"]
+                self._cassette.record(
+                    qix_key(self._app_id, request.get("method"), request.get("handle"), request.get("params")),
+                    {
+                        "kind": "qix",
+                        "app_id": self._app_id,
+                        "method": request.get("method"),
+                        "handle": request.get("handle"),
+                        "params": request.get("params"),
+                        "response": {k: v for k, v in response.items() if k != "id"},
+                        "duration_ms": round((time.perf_counter() - pending["started"]) * 1000, 3),
+                    },
+                    secrets=[self._api_key],
+                )
+        except (ValueError, AttributeError):
+            pass
+        return message
+
+    async def close(self):
+        await self._ws.close()
+
+
+class ReplayWebSocket:
+    """Stands in for an Engine WebSocket, answering from the cassette."""
+
+    def __init__(self, cassette: Cassette, app_id: str):
+        self._cassette = cassette
+        self._app_id = app_id
+        self._responses: asyncio.Queue = asyncio.Queue()
+        self.closed = False
+
+    async def send(self, message: str):
+        request = json.loads(message)
+        key = qix_key(self._app_id, request.get("method"), request.get("handle"), request.get("params"))
+        entry = self._cassette.lookup(key)
+        if entry is None:
+            response = {"error": {"code": "CASSETTE_MISS", "message": f"No recorded response for {request.get('method')} (handle {request.get('handle')})"}}
+        else:
+            await self._cassette.delay(entry)
+            response = dict(entry["response"])
+        response["id"] = request.get("id")
+        response.setdefault("jsonrpc", "2.0")
+        await self._responses.put(json.dumps(response))
+
+    async def recv(self) -> str:
+        return await self._responses.get()
+
+    async def close(self):
+        self.closed = True
+
+
+_cassette: Optional[Cassette] = None
+_cassette_loaded = False
+
+
+def get_cassette() -> Optional[Cassette]:
+    """Process-wide cassette, or None when QLIK_RECORD_MODE is off."""
+    global _cassette, _cassette_loaded
+    if not _cassette_loaded:
+        _cassette = Cassette.from_env()
+        _cassette_loaded = True
+    return _cassette
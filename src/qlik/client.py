@@ -1,6 +1,13 @@
 import httpx
 import os
+import time
 from typing import Optional, Dict, Any, List
+from urllib.parse import urlsplit
+from src.qlik.auth import token_fingerprint
+from src.qlik.cassette import get_cassette, rest_key
+from src.storage.shared_cache import get_shared_cache, cache_key
+from src.observability.metrics import REST_DURATION
+from src.observability.tracing import tracer, current_traceparent
 
 class QlikRestClient:
     """
@@ -11,6 +18,55 @@ class QlikRestClient:
     """
     def __init__(self):
         self.tenant_url = os.getenv("QLIK_CLOUD_TENANT_URL", "").rstrip("/")
+        # TTLs (segundos) do cache compartilhado entre workers; 0 desativa
+        self.apps_cache_ttl = float(os.getenv("MCP_CACHE_APPS_TTL", "60"))
+        self.item_cache_ttl = float(os.getenv("MCP_CACHE_ITEM_TTL", "3600"))
+        self.cache = get_shared_cache()
+        # QLIK_RECORD_MODE=record|replay: grava/reproduz as respostas REST (ver src/qlik/cassette.py)
+        self.cassette = get_cassette()
+
+    def _headers(self, api_key: str) -> Dict[str, str]:
+        headers = {
+            "Authorization": f"Bearer {api_key}",
+            "Content-Type": "application/json"
+        }
+        traceparent = current_traceparent()
+        if traceparent:
+            headers["traceparent"] = traceparent
+        return headers
+
+    async def _get(self, url: str, api_key: str, params: Optional[Dict[str, Any]] = None) -> httpx.Response:
+        """GET on the tenant, going through the cassette when record/replay is on."""
+        cassette = self.cassette
+        key = rest_key("GET", urlsplit(url).path, params) if cassette is not None else None
+        if cassette is not None and cassette.replaying:
+            entry = cassette.lookup(key)
+            if entry is None:
+                raise Exception(f"No recorded Qlik response for GET {urlsplit(url).path} (QLIK_RECORD_MODE=replay)")
+            await cassette.delay(entry)
+            body = entry["response"]
+            request = httpx.Request("GET", url, params=params)
+            if isinstance(body, str):
+                return httpx.Response(entry["status"], text=body, request=request)
+            return httpx.Response(entry["status"], json=body, request=request)
+        started = time.perf_counter()
+        async with httpx.AsyncClient() as client:
+            response = await client.get(url, params=params, headers=self._headers(api_key), timeout=30.0)
+        if cassette is not None and cassette.recording:
+            try:
+                body = response.json()
+            except ValueError:
+                body = response.text
+            cassette.record(key, {
+                "kind": "rest",
+                "method": "GET",
+                "path": urlsplit(url).path,
+                "params": params,
+                "status": response.status_code,
+                "response": body,
+                "duration_ms": round((time.perf_counter() - started) * 1000, 3),
+            }, secrets=[api_key])
+        return response
     
     async def get_apps(self, api_key: str, limit: Optional[int] = None, cursor: Optional[str] = None, name: Optional[str] = None) -> Dict[str, Any]:
         """List Qlik Cloud apps using API key"""
@@ -42,27 +98,31 @@ class QlikRestClient:
             params["cursor"] = cursor
         if name:
             params["name"] = name
+
+        key = cache_key("apps", token_fingerprint(api_key), params)
+        if self.apps_cache_ttl > 0:
+            cached = await self.cache.get(key)
+            if cached is not None:
+                logger.debug("App catalog served from shared cache")
+                return cached
         
         try:
-            logger.info(f"Calling Qlik API: {url} with params: {params}")
-            # Log mascarado da API key (primeiros 8 e últimos 4 caracteres) para debug
-            api_key_preview = f"{api_key[:8]}...{api_key[-4:]}" if len(api_key) > 12 else "***"
-            logger.info(f"Using API key (preview): {api_key_preview} (length: {len(api_key)} chars)")
+            logger.info("Calling Qlik API: %s with params: %s", url, params, extra={"category": "rest"})
             
-            async with httpx.AsyncClient() as client:
-                response = await client.get(
-                    url,
-                    params=params,
-                    headers={
-                        "Authorization": f"Bearer {api_key}",
-                        "Content-Type": "application/json"
-                    },
-                    timeout=30.0
-                )
-                response.raise_for_status()
-                result = response.json()
-                logger.debug(f"Qlik API response: {len(result.get('data', []))} apps found")
-                return result
+            started = time.perf_counter()
+            status = "error"
+            try:
+                with tracer.start_as_current_span("QlikRestClient.get_apps", {"http.method": "GET", "http.url": url}) as span:
+                    response = await self._get(url, api_key, params=params)
+                    status = str(response.status_code)
+                    span.set_attribute("http.status_code", response.status_code)
+            finally:
+                REST_DURATION.observe(time.perf_counter() - started, endpoint="items", status=status)
+            response.raise_for_status()
+            result = response.json()
+            logger.debug("Qlik API response: %d apps found", len(result.get('data', [])))
+            await self.cache.set(key, result, self.apps_cache_ttl, tag="apps")
+            return result
         except httpx.HTTPStatusError as e:
             error_detail = ""
             try:
@@ -97,15 +157,61 @@ class QlikRestClient:
             raise Exception("Qlik Cloud API key is required")
         if not self.tenant_url:
             raise Exception("QLIK_CLOUD_TENANT_URL is not configured.")
+        key = cache_key("item", token_fingerprint(api_key), item_id)
+        if self.item_cache_ttl > 0:
+            cached = await self.cache.get(key)
+            if cached is not None:
+                return cached
         url = f"{self.tenant_url}/api/v1/items/{item_id}"
-        async with httpx.AsyncClient() as client:
-            response = await client.get(
-                url,
-                headers={
-                    "Authorization": f"Bearer {api_key}",
-                    "Content-Type": "application/json"
-                },
-                timeout=30.0
-            )
-            response.raise_for_status()
-            return response.json()
+        started = time.perf_counter()
+        status = "error"
+        try:
+            with tracer.start_as_current_span("QlikRestClient.get_item", {"http.method": "GET", "http.url": url}) as span:
+                response = await self._get(url, api_key)
+                status = str(response.status_code)
+                span.set_attribute("http.status_code", response.status_code)
+        finally:
+            REST_DURATION.observe(time.perf_counter() - started, endpoint="item", status=status)
+        response.raise_for_status()
+        item = response.json()
+        await self.cache.set(key, item, self.item_cache_ttl, tag=item.get("resourceId") or None)
+        return item
+
+    async def get_current_user(self, api_key: str) -> Dict[str, Any]:
+        """The token's user (/users/me); its id stays the same when OAuth tokens rotate."""
+        key = cache_key("user", token_fingerprint(api_key))
+        if self.item_cache_ttl > 0:
+            cached = await self.cache.get(key)
+            if cached is not None:
+                return cached
+        url = f"{self.tenant_url}/api/v1/users/me"
+        started = time.perf_counter()
+        status = "error"
+        try:
+            with tracer.start_as_current_span("QlikRestClient.get_current_user", {"http.method": "GET", "http.url": url}) as span:
+                response = await self._get(url, api_key)
+                status = str(response.status_code)
+                span.set_attribute("http.status_code", response.status_code)
+        finally:
+            REST_DURATION.observe(time.perf_counter() - started, endpoint="users_me", status=status)
+        response.raise_for_status()
+        user = response.json()
+        await self.cache.set(key, user, self.item_cache_ttl)
+        return user
+
+    async def get_app_item(self, resource_id: str, api_key: str) -> Optional[Dict[str, Any]]:
+        """Items API entry of an app by resourceId (never cached: used to detect reloads)."""
+        url = f"{self.tenant_url}/api/v1/items"
+        params = {"resourceType": "app", "resourceId": resource_id}
+        started = time.perf_counter()
+        status = "error"
+        try:
+            with tracer.start_as_current_span("QlikRestClient.get_app_item", {"http.method": "GET", "http.url": url}) as span:
+                response = await self._get(url, api_key, params=params)
+                status = str(response.status_code)
+                span.set_attribute("http.status_code", response.status_code)
+        finally:
+            REST_DURATION.observe(time.perf_counter() - started, endpoint="app_item", status=status)
+        response.raise_for_status()
+        data = response.json().get("data") or []
+        return data[0] if data else None
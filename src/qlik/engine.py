@@ -1,13 +1,34 @@
 import asyncio
+import hashlib
 import json
+import time
+import weakref
 import websockets
 import os
 import logging
-from urllib.parse import urlencode
-from typing import Optional, Dict, Any, List
+from urllib.parse import quote, urlencode
+from typing import Optional, Dict, Any, List, Callable, Awaitable, AsyncIterator, Tuple
+from src.qlik.auth import token_fingerprint
+from src.qlik.cassette import get_cassette, RecordingWebSocket, ReplayWebSocket
+from src.qlik.freshness import get_freshness_tracker
+from src.qlik.shaping import (
+    column_titles, native_number, pivot_column_titles, pivot_rows, row_shaper, shaped_meta, stack_rows
+)
+from src.observability.tracing import tracer
+from src.observability.metrics import (
+    QIX_DURATION, ENGINE_WS_OPENS, ENGINE_WS_EVICTIONS, count_qix_round_trip, register_gauge_callback
+)
 
 logger = logging.getLogger(__name__)
 
+# Todas as instâncias vivas do client, para o gauge de tamanho do pool de WebSockets
+_engine_clients: "weakref.WeakSet[QlikEngineClient]" = weakref.WeakSet()
+register_gauge_callback(
+    "engine_ws_pool_size",
+    "Open Engine WebSocket connections in the pool",
+    lambda: sum(1 for client in list(_engine_clients) for ws in list(client.connections.values()) if not ws.closed),
+)
+
 QEP104_MESSAGE = (
     "Qlik token expired or insufficient permissions (QEP-104). "
     "Please reconnect to Qlik in the Chat-AI (Conectar Qlik) and try again. "
@@ -20,6 +41,14 @@ class QlikEngineAuthError(Exception):
     def __init__(self):
         super().__init__(QEP104_MESSAGE)
 
+class QlikStateChangedError(Exception):
+    """Raised when a resumed hypercube read no longer matches the app reload / selection state it started from."""
+    def __init__(self):
+        super().__init__(
+            "The chart data changed since the cursor was issued (app reloaded or selections changed). "
+            "Call again without 'cursor' to restart paging."
+        )
+
 class QlikEngineClient:
     """
     Qlik Engine API Client (WebSocket) - READ-ONLY operations only.
@@ -29,20 +58,54 @@ class QlikEngineClient:
     - CreateSessionObject + GetLayout: List sheets (qAppObjectListDef qType sheet)
     - GetSheetObjects: List objects in a sheet
     - GetObject: Get object metadata
-    - GetHyperCubeData: Get data from visualizations
+    - GetHyperCubeData / GetHyperCubePivotData / GetHyperCubeStackData: Get data from visualizations
+    - Session list objects (GetListObjectData, SearchListObjectFor): Values of a field
     
     No create, update, delete, or modify operations are implemented.
+
+    With an identity, connections go to /app/{app_id}/identity/{identity}: the Engine
+    gives them their own session instead of attaching them to the user's session of
+    the same app, so they can be closed without touching what the user has open.
     """
     GLOBAL_HANDLE = -1
+    # Limite do Engine por GetHyperCubeData (qWidth * qHeight)
+    MAX_PAGE_CELLS = 10000
+    # qMode do hypercube que não é tabela reta ("S")
+    CUBE_TYPES = {"P": "pivot", "K": "stacked"}
 
-    def __init__(self):
+    def __init__(self, identity: Optional[str] = None):
         self.tenant_url = os.getenv("QLIK_CLOUD_TENANT_URL", "").rstrip("/")
         self.ws_url = self.tenant_url.replace("https://", "wss://").replace("http://", "ws://")
+        self.identity = identity
         self.connections: Dict[str, websockets.WebSocketClientProtocol] = {}
         self.doc_handles: Dict[str, int] = {}
+        # Locks para permitir chamadas concorrentes (ex.: batch JSON-RPC) sobre o mesmo pool:
+        # um por chave de conexão (connect/OpenDoc) e um por WebSocket (send+recv de um request QIX)
+        self._connect_locks: Dict[str, asyncio.Lock] = {}
+        self._open_locks: Dict[str, asyncio.Lock] = {}
+        self._ws_locks: "weakref.WeakKeyDictionary[Any, asyncio.Lock]" = weakref.WeakKeyDictionary()
+        # List objects de sessão (um por campo) reaproveitados na mesma conexão: WebSocket -> {campo: handle}
+        self._field_lists: "weakref.WeakKeyDictionary[Any, Dict[str, int]]" = weakref.WeakKeyDictionary()
+        self._field_list_locks: "weakref.WeakKeyDictionary[Any, asyncio.Lock]" = weakref.WeakKeyDictionary()
+        # QLIK_RECORD_MODE=record|replay: grava/reproduz o tráfego QIX (ver src/qlik/cassette.py)
+        self.cassette = get_cassette()
+        _engine_clients.add(self)
+
+    def _cache_key(self, app_id: str, api_key: Optional[str]) -> str:
+        """Connections are per app AND per token, so one user's session is never reused for another."""
+        return f"{app_id}:{token_fingerprint(api_key)}"
+
+    def _ws_lock(self, ws: Any) -> asyncio.Lock:
+        lock = self._ws_locks.get(ws)
+        if lock is None:
+            lock = asyncio.Lock()
+            self._ws_locks[ws] = lock
+        return lock
     
     def _get_ws_url(self, app_id: str, api_key: Optional[str] = None) -> str:
         path = f"{self.ws_url}/app/{app_id}/"
+        if self.identity:
+            path += f"identity/{quote(self.identity, safe='')}"
         if api_key:
             qs = urlencode({"qlikAuth": f"Bearer {api_key}"})
             return f"{path}?{qs}"
@@ -50,18 +113,41 @@ class QlikEngineClient:
 
     async def _get_connection(self, app_id: str, api_key: str) -> websockets.WebSocketClientProtocol:
         """Get or create WebSocket connection to Qlik Engine API"""
-        cache_key = f"{app_id}"
+        cache_key = self._cache_key(app_id, api_key)
+        with tracer.start_as_current_span("QlikEngineClient._get_connection", {"qlik.app_id": app_id}) as span:
+            ws = self.connections.get(cache_key)
+            if ws is not None and not ws.closed:
+                span.set_attribute("qlik.pooled", True)
+                return ws
+            span.set_attribute("qlik.pooled", False)
+            lock = self._connect_locks.setdefault(cache_key, asyncio.Lock())
+            async with lock:
+                try:
+                    return await self._connect(app_id, api_key, cache_key)
+                except BaseException:
+                    # Conexão falhou: não deixa o lock da chave para trás
+                    if cache_key not in self.connections:
+                        self._connect_locks.pop(cache_key, None)
+                    raise
+
+    async def _connect(self, app_id: str, api_key: str, cache_key: str) -> websockets.WebSocketClientProtocol:
         if cache_key in self.connections:
             ws = self.connections[cache_key]
             if not ws.closed:
                 return ws
             del self.connections[cache_key]
+            ENGINE_WS_EVICTIONS.inc(reason="closed")
         if cache_key in self.doc_handles:
             del self.doc_handles[cache_key]
 
         if not api_key:
             raise Exception("Qlik Cloud API key is required")
 
+        if self.cassette is not None and self.cassette.replaying:
+            ws = ReplayWebSocket(self.cassette, app_id)
+            self.connections[cache_key] = ws
+            return ws
+
         ws_url = self._get_ws_url(app_id, api_key)
         origin = self.tenant_url if self.tenant_url.startswith("http") else f"https://{self.tenant_url}"
         if origin.startswith("wss://"):
@@ -76,8 +162,11 @@ class QlikEngineClient:
         logger.info("Connecting to Qlik Engine API WebSocket: %s", self._get_ws_url(app_id))
         try:
             ws = await websockets.connect(ws_url, extra_headers=headers)
+            if self.cassette is not None and self.cassette.recording:
+                ws = RecordingWebSocket(ws, self.cassette, app_id, api_key)
             self.connections[cache_key] = ws
-            logger.info(f"Successfully connected to Qlik Engine API WebSocket for app {app_id}")
+            ENGINE_WS_OPENS.inc()
+            logger.info("Successfully connected to Qlik Engine API WebSocket for app %s", app_id)
             return ws
         except websockets.exceptions.ConnectionClosedError as e:
             err_str = str(e)
@@ -106,22 +195,28 @@ class QlikEngineClient:
             "params": params
         }
         
+        sent = False
+        count_qix_round_trip(method)
         try:
-            await ws.send(json.dumps(request))
-            for _ in range(10):
-                response = await ws.recv()
-                result = json.loads(response)
-                if "error" in result:
-                    error_code = str(result["error"].get("code", "unknown"))
-                    error_message = result["error"].get("message", str(result["error"]))
-                    logger.error("QIX API error: code=%s, message=%s", error_code, error_message)
-                    if error_code == "QEP-104" or "QEP-104" in error_code or "QEP-104" in str(result["error"]):
-                        raise QlikEngineAuthError() from None
-                    raise Exception(f"QIX error: {error_code} - {error_message}")
-                mid = result.get("id")
-                if mid == request_id or ("result" in result and mid is None):
-                    return result
-            raise Exception("QIX: no response matching request id %s" % request_id)
+            async with self._ws_lock(ws):
+                with QIX_DURATION.time(method=method), \
+                        tracer.start_as_current_span(f"qix.{method}", {"qix.method": method, "qix.handle": qix_handle}):
+                    await ws.send(json.dumps(request))
+                    sent = True
+                    for _ in range(10):
+                        response = await ws.recv()
+                        result = json.loads(response)
+                        if "error" in result:
+                            error_code = str(result["error"].get("code", "unknown"))
+                            error_message = result["error"].get("message", str(result["error"]))
+                            logger.error("QIX API error: code=%s, message=%s", error_code, error_message)
+                            if error_code == "QEP-104" or "QEP-104" in error_code or "QEP-104" in str(result["error"]):
+                                raise QlikEngineAuthError() from None
+                            raise Exception(f"QIX error: {error_code} - {error_message}")
+                        mid = result.get("id")
+                        if mid == request_id or ("result" in result and mid is None):
+                            return result
+                    raise Exception("QIX: no response matching request id %s" % request_id)
         except websockets.exceptions.ConnectionClosedError as e:
             err_str = str(e)
             if "QEP-101" in err_str or ("QEP" in err_str and "101" in err_str):
@@ -130,11 +225,7 @@ class QlikEngineClient:
                     "Ensure app_id is the raw id (e.g. 636d37c753782e98b7ea0a66) with no {{ }}. Check API key has Engine and app access."
                 ) from None
             if "QEP-104" in err_str or "4204" in err_str or ("QEP" in err_str and "104" in err_str):
-                for k, v in list(self.connections.items()):
-                    if v is ws:
-                        del self.connections[k]
-                        self.doc_handles.pop(k, None)
-                        break
+                self._discard_connection(ws, reason="auth")
                 raise QlikEngineAuthError() from None
             logger.error("WebSocket closed during QIX request: %s", err_str)
             raise Exception(f"WebSocket connection closed during QIX request: {err_str}") from None
@@ -142,6 +233,30 @@ class QlikEngineClient:
             error_msg = f"Failed to parse QIX API response: {str(e)}"
             logger.error(error_msg)
             raise Exception(error_msg) from None
+        except asyncio.CancelledError:
+            # Request cancelado (cliente desconectou / prazo): a resposta em voo chegaria
+            # para o próximo request neste socket, então a conexão é descartada.
+            if sent:
+                logger.info("QIX request %s cancelled in flight; discarding Engine connection", method)
+                self._discard_connection(ws, reason="cancelled")
+                asyncio.ensure_future(ws.close())
+            raise
+
+    def _discard_connection(self, ws: websockets.WebSocketClientProtocol, reason: str):
+        for k, v in list(self.connections.items()):
+            if v is ws:
+                del self.connections[k]
+                self.doc_handles.pop(k, None)
+                self._forget_locks(k)
+                ENGINE_WS_EVICTIONS.inc(reason=reason)
+                break
+
+    def _forget_locks(self, cache_key: str):
+        """Drop the connect/OpenDoc locks of a key that left the pool, unless a call is holding them."""
+        for locks in (self._connect_locks, self._open_locks):
+            lock = locks.get(cache_key)
+            if lock is not None and not lock.locked():
+                del locks[cache_key]
     
     def _doc_handle_from_open_result(self, result: Dict[str, Any]) -> int:
         res = result.get("result")
@@ -160,9 +275,18 @@ class QlikEngineClient:
         return 1
 
     async def open_doc(self, app_id: str, api_key: str) -> int:
-        if app_id in self.doc_handles:
-            return self.doc_handles[app_id]
-        logger.info(f"Opening Qlik app document: {app_id}")
+        cache_key = self._cache_key(app_id, api_key)
+        if cache_key in self.doc_handles:
+            return self.doc_handles[cache_key]
+        lock = self._open_locks.setdefault(cache_key, asyncio.Lock())
+        with tracer.start_as_current_span("QlikEngineClient.open_doc", {"qlik.app_id": app_id}):
+            async with lock:
+                if cache_key in self.doc_handles:
+                    return self.doc_handles[cache_key]
+                return await self._open_doc(app_id, api_key, cache_key)
+
+    async def _open_doc(self, app_id: str, api_key: str, cache_key: str) -> int:
+        logger.info("Opening Qlik app document: %s", app_id)
         ws = await self._get_connection(app_id, api_key)
         result = await self._send_qix_request(
             ws, "OpenDoc", [app_id, "", "", "", False], request_id=1, qix_handle=self.GLOBAL_HANDLE
@@ -172,8 +296,8 @@ class QlikEngineClient:
             error_message = result["error"].get("message", str(result["error"]))
             raise Exception(f"Failed to open Qlik app document: {error_code} - {error_message}")
         doc_handle = self._doc_handle_from_open_result(result)
-        self.doc_handles[app_id] = doc_handle
-        logger.info(f"Successfully opened Qlik app document: {app_id} (handle=%s)", doc_handle)
+        self.doc_handles[cache_key] = doc_handle
+        logger.info("Successfully opened Qlik app document: %s (handle=%s)", app_id, doc_handle)
         return doc_handle
     
     async def get_sheets(self, app_id: str, api_key: str) -> List[Dict[str, Any]]:
@@ -234,66 +358,397 @@ class QlikEngineClient:
         result = await self._send_qix_request(ws, "GetObject", [object_id], request_id=4, qix_handle=doc_handle)
         if "error" in result:
             raise Exception(f"QIX error: {result['error']}")
-        return result.get("result", {})
+        obj_result = result.get("result", {})
+        # GetObject só devolve qReturn (handle); o layout (qHyperCube, qSelectionInfo...) vem de GetLayout
+        obj_handle = (obj_result.get("qReturn") or {}).get("qHandle")
+        if "layout" not in obj_result and obj_handle is not None:
+            layout_result = await self._send_qix_request(ws, "GetLayout", [], request_id=7, qix_handle=obj_handle)
+            if "error" not in layout_result:
+                obj_result = dict(obj_result)
+                obj_result["layout"] = (layout_result.get("result") or {}).get("qLayout") or {}
+        return obj_result
     
-    async def get_hypercube_data(self, app_id: str, object_id: str, api_key: str, 
-                                  page_size: int = 100, max_rows: Optional[int] = None,
-                                  include_meta: bool = False) -> Dict[str, Any]:
+    async def get_app_layout(self, app_id: str, api_key: str) -> Dict[str, Any]:
+        """GetAppLayout on the pooled session (qTitle, qLastReloadTime, ...)."""
         ws = await self._get_connection(app_id, api_key)
         doc_handle = await self.open_doc(app_id, api_key)
-        obj_result = await self.get_object(app_id, object_id, api_key)
-        layout = obj_result.get("layout", {})
+        result = await self._send_qix_request(ws, "GetAppLayout", [], request_id=6, qix_handle=doc_handle)
+        if "error" in result:
+            raise Exception(f"QIX error: {result['error']}")
+        layout = (result.get("result") or {}).get("qLayout") or {}
+        # Reload visto de graça: invalida os caches do app se ele mudou
+        await get_freshness_tracker().observe(app_id, layout.get("qLastReloadTime"))
+        return layout
+
+    def _hypercube_state(self, layout: Dict[str, Any], app_layout: Dict[str, Any]) -> str:
+        """Fingerprint of what a hypercube page depends on: app reload, selection state and cube size."""
         hypercube = layout.get("qHyperCube", {})
+        state = [
+            app_layout.get("qLastReloadTime"),
+            layout.get("qStateName"),
+            layout.get("qSelectionInfo"),
+            hypercube.get("qSize"),
+        ]
+        return hashlib.sha256(json.dumps(state, sort_keys=True, default=str).encode("utf-8")).hexdigest()[:32]
+
+    async def open_hypercube(self, app_id: str, object_id: str, api_key: str) -> Tuple[int, Dict[str, Any]]:
+        """Handle and layout of a chart object, for GetHyperCubeData (the doc handle if the object has none)."""
+        doc_handle = await self.open_doc(app_id, api_key)
+        obj_result = await self.get_object(app_id, object_id, api_key)
         obj_handle = (obj_result.get("qReturn") or {}).get("qHandle")
-        if obj_handle is None:
-            obj_handle = doc_handle
+        return (doc_handle if obj_handle is None else obj_handle), obj_result.get("layout", {})
+
+    async def table_view(self, app_id: str, api_key: str, obj_handle: int,
+                         hypercube: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        The hypercube as the straight table iter_hypercube_pages yields, for headers and
+        shaping (column_schema, row_shaper). Straight cubes are returned as they are.
+
+        Pivot cubes (qMode "P") become their qNoOfLeftDims left dimensions followed by one
+        column per visible data column, titled from the top headers (one single-row
+        GetHyperCubePivotData call). Stacked cubes (qMode "K") become every dimension
+        followed by the measures. Pivots are read as laid out: collapsed nodes stay
+        collapsed (qCanExpand on the cell), nothing is expanded. A pivot wider than
+        MAX_PAGE_CELLS keeps its first MAX_PAGE_CELLS data columns and the view gets
+        columns_truncated=True.
+        """
+        mode = hypercube.get("qMode", "S")
+        if mode not in ("P", "K"):
+            return hypercube
+        dims = hypercube.get("qDimensionInfo", [])
+        measures = hypercube.get("qMeasureInfo", [])
+        q_size = hypercube.get("qSize", {})
+        view = {**hypercube, "qDataSize": q_size}
+        if mode == "K":
+            view["qSize"] = {"qcx": len(dims) + len(measures), "qcy": q_size.get("qcy", 0)}
+            return view
+        left_count = min(hypercube.get("qNoOfLeftDims", len(dims)), len(dims))
+        width = min(q_size.get("qcx", 0), self.MAX_PAGE_CELLS)
+        titles = []
+        if width and q_size.get("qcy", 0):
+            page = await self._pivot_page(app_id, api_key, obj_handle, 0, 1, width)
+            titles = pivot_column_titles(page, width, column_titles({"qMeasureInfo": measures}))
+        view["qDimensionInfo"] = dims[:left_count]
+        view["qMeasureInfo"] = [{"qFallbackTitle": t} for t in titles]
+        view["qSize"] = {"qcx": left_count + len(titles), "qcy": q_size.get("qcy", 0)}
+        view["qNoOfLeftDims"] = left_count
+        if q_size.get("qcx", 0) > width:
+            # Não é propriedade do Qlik: avisa quem monta a resposta que faltam colunas do topo
+            view["columns_truncated"] = True
+        return view
+
+    async def _pivot_page(self, app_id: str, api_key: str, obj_handle: int,
+                          top: int, height: int, width: int, stacked: bool = False) -> Dict[str, Any]:
+        ws = await self._get_connection(app_id, api_key)
+        pages = [{"qTop": top, "qLeft": 0, "qWidth": width, "qHeight": height}]
+        if stacked:
+            method, params = "GetHyperCubeStackData", ["/qHyperCubeDef", pages, self.MAX_PAGE_CELLS]
+        else:
+            method, params = "GetHyperCubePivotData", ["/qHyperCubeDef", pages]
+        result = await self._send_qix_request(ws, method, params, request_id=5, qix_handle=obj_handle)
+        if "error" in result:
+            raise Exception(f"QIX error: {result['error']}")
+        data_pages = result.get("result", {}).get("qDataPages", [])
+        return data_pages[0] if data_pages else {}
+
+    async def iter_hypercube_pages(self, app_id: str, api_key: str, obj_handle: int, hypercube: Dict[str, Any],
+                                   start_row: int = 0, max_rows: Optional[int] = None,
+                                   page_size: Optional[int] = None) -> AsyncIterator[Tuple[int, List[List[Dict[str, Any]]]]]:
+        """
+        Yield (next_row, qMatrix) one page at a time, so callers can stream a cube of any
+        size without holding it in memory. page_size defaults to the largest page the
+        Engine allows (MAX_PAGE_CELLS cells).
+
+        Straight cubes are read with GetHyperCubeData. For pivot and stacked cubes pass
+        the table_view: pages come from GetHyperCubePivotData / GetHyperCubeStackData
+        (rows are the visible left/stack rows, without expanding anything) and are
+        flattened to qMatrix-style rows laid out as the view's columns.
+
+        start_row, max_rows and next_row count cube rows (qTop/qHeight). A stacked row
+        is one value of the first dimension and flattens to one qMatrix row per inner
+        dimension path, so a page of a stacked cube can yield more rows than its height.
+        """
+        ws = await self._get_connection(app_id, api_key)
+        mode = hypercube.get("qMode", "S")
+        q_size = hypercube.get("qSize", {})
+        data_width = max(1, hypercube.get("qDataSize", q_size).get("qcx", 1))
+        width = min(data_width, self.MAX_PAGE_CELLS)
+        end_row = q_size.get("qcy", 0)
+        if max_rows:
+            end_row = min(end_row, start_row + max_rows)
+        page_size = max(1, min(page_size or self.MAX_PAGE_CELLS, self.MAX_PAGE_CELLS // width))
+        current_row = max(0, start_row)
+        while current_row < end_row:
+            height = min(page_size, end_row - current_row)
+            if mode == "P":
+                page = await self._pivot_page(app_id, api_key, obj_handle, current_row, height, width)
+                matrix = pivot_rows(page, hypercube.get("qNoOfLeftDims", 0)) if page else []
+                matrix = [row[:hypercube.get("qNoOfLeftDims", 0) + width] for row in matrix]
+            elif mode == "K":
+                page = await self._pivot_page(app_id, api_key, obj_handle, current_row, height, width, stacked=True)
+                matrix = stack_rows(page, len(hypercube.get("qDimensionInfo", [])), len(hypercube.get("qMeasureInfo", [])))
+                # O Engine corta a página em qMaxNbrCells: avança só as linhas de fora que vieram
+                height = min(height, page.get("qArea", {}).get("qHeight", height))
+            else:
+                result = await self._send_qix_request(
+                    ws,
+                    "GetHyperCubeData",
+                    ["/qHyperCubeDef", [{"qTop": current_row, "qLeft": 0, "qWidth": width, "qHeight": height}]],
+                    request_id=5,
+                    qix_handle=obj_handle
+                )
+                if "error" in result:
+                    raise Exception(f"QIX error: {result['error']}")
+                data_pages = result.get("result", {}).get("qDataPages", [])
+                matrix = [row for page in data_pages for row in page.get("qMatrix", [])]
+            if not matrix or not height:
+                return
+            current_row += height
+            yield current_row, matrix
+
+    async def get_hypercube_data(self, app_id: str, object_id: str, api_key: str, 
+                                  page_size: int = 100, max_rows: Optional[int] = None,
+                                  include_meta: bool = False,
+                                  on_page: Optional[Callable[[int, int], Awaitable[None]]] = None,
+                                  start_row: int = 0, with_state: bool = False,
+                                  expected_state: Optional[str] = None,
+                                  deadline: Optional[float] = None,
+                                  fields: Optional[List[str]] = None) -> Dict[str, Any]:
+        """
+        Page through the object's hypercube from start_row (qTop). on_page(rows_fetched, total_rows)
+        is awaited after each GetHyperCubeData page (used for streaming progress notifications).
+
+        The response has next_row (None when the cube is exhausted) so callers can resume
+        without re-fetching from row zero; with_state=True adds "state", a fingerprint of the
+        app reload time, selection state and cube size. When expected_state is given and no
+        longer matches, QlikStateChangedError is raised before any page is read.
+
+        deadline is a time.monotonic() instant: paging stops before a page that would not
+        finish in time and the rows read so far are returned with truncated=True.
+
+        Pivot and stacked objects are paged with their own QIX methods (see table_view):
+        rows are their visible rows, collapsed pivot nodes are not expanded. For stacked
+        cubes max_rows, total_rows and next_row count stack rows (see iter_hypercube_pages),
+        so "data" can hold more rows than max_rows. Pivots wider than the Engine page
+        have columns_truncated=True.
+
+        fields (see src.qlik.shaping) trims each qMatrix cell as the page arrives, so the
+        full cells are never accumulated; the response then also has "columns", the
+        header row built from the dimension/measure titles.
+        """
+        obj_handle, layout = await self.open_hypercube(app_id, object_id, api_key)
+        state = None
+        if with_state or expected_state:
+            app_layout = await self.get_app_layout(app_id, api_key)
+            state = self._hypercube_state(layout, app_layout)
+            if expected_state and expected_state != state:
+                raise QlikStateChangedError()
+        hypercube = await self.table_view(app_id, api_key, obj_handle, layout.get("qHyperCube", {}))
+        shape = row_shaper(hypercube, fields) if fields else None
         q_size = hypercube.get("qSize", {})
-        total_rows = q_size.get("qcy", 0)
+        cube_rows = q_size.get("qcy", 0)
+        start_row = max(0, start_row)
+        end_row = cube_rows
         if max_rows:
-            total_rows = min(total_rows, max_rows)
+            end_row = min(cube_rows, start_row + max_rows)
+        total_rows = max(0, end_row - start_row)
         all_data = []
-        current_row = 0
-        while current_row < total_rows:
-            page_size_actual = min(page_size, total_rows - current_row)
-            result = await self._send_qix_request(
-                ws,
-                "GetHyperCubeData",
-                ["/qHyperCubeDef", [{"qTop": current_row, "qLeft": 0, "qWidth": hypercube.get("qSize", {}).get("qcx", 1), "qHeight": page_size_actual}]],
-                request_id=5,
-                qix_handle=obj_handle
-            )
-            
-            if "error" in result:
-                raise Exception(f"QIX error: {result['error']}")
-            
-            data_pages = result.get("result", {}).get("qDataPages", [])
-            if not data_pages:
-                break
-            
-            for page in data_pages:
-                q_matrix = page.get("qMatrix", [])
-                all_data.extend(q_matrix)
-            
-            current_row += page_size_actual
-        
+        current_row = start_row
+        exhausted = False
+        truncated = False
+        last_page_seconds = 0.0
+        pages = self.iter_hypercube_pages(
+            app_id, api_key, obj_handle, hypercube, start_row=start_row, max_rows=max_rows, page_size=page_size
+        )
+        try:
+            while current_row < end_row:
+                if deadline is not None and time.monotonic() + last_page_seconds >= deadline:
+                    logger.info("Deadline reached for object %s after %d rows; returning partial result", object_id, current_row - start_row)
+                    truncated = True
+                    break
+                page_started = time.monotonic()
+                try:
+                    current_row, q_matrix = await pages.__anext__()
+                except StopAsyncIteration:
+                    # Página vazia antes de qcy (cubo encolheu): não há o que continuar
+                    exhausted = True
+                    break
+                all_data.extend(map(shape, q_matrix) if shape else q_matrix)
+                last_page_seconds = time.monotonic() - page_started
+                if on_page is not None:
+                    await on_page(current_row - start_row, total_rows)
+        finally:
+            await pages.aclose()
+
         response = {
-            "data": all_data[:max_rows] if max_rows else all_data,
-            "total_rows": total_rows
+            "data": all_data,
+            "total_rows": total_rows,
+            "next_row": current_row if current_row < cube_rows and not exhausted else None,
+            "truncated": truncated
         }
+        if hypercube.get("columns_truncated"):
+            response["columns_truncated"] = True
+        if shape:
+            response.update(shaped_meta(hypercube, fields))
         
         if include_meta:
             response["meta"] = {
                 "dimensions": hypercube.get("qDimensionInfo", []),
                 "measures": hypercube.get("qMeasureInfo", []),
-                "size": q_size
+                "size": q_size,
+                "mode": hypercube.get("qMode", "S")
             }
+
+        if state is not None:
+            response["state"] = state
         
         return response
     
-    async def close_connection(self, app_id: str):
-        cache_key = f"{app_id}"
-        if cache_key in self.connections:
-            ws = self.connections[cache_key]
+    async def get_hypercube_summary(self, app_id: str, object_id: str, api_key: str,
+                                    sample_rows: int = 10,
+                                    fields: Optional[List[str]] = None) -> Dict[str, Any]:
+        """
+        Totals, min/max and sizes of a chart straight from its layout, plus the first
+        sample_rows rows, without paging through the cube.
+
+        Everything comes from the GetObject/GetLayout already done to open the object:
+        qSize (rows/columns), qCardinal per dimension, qMin/qMax per measure and
+        qGrandTotalRow (the Engine-computed totals, using each measure's own total
+        function). The sample reuses the layout's qDataPages when they cover it, else
+        costs one GetHyperCubeData page (for stacked cubes, sample_rows stack rows).
+        """
+        obj_handle, layout = await self.open_hypercube(app_id, object_id, api_key)
+        hypercube = layout.get("qHyperCube", {})
+        q_size = hypercube.get("qSize", {})
+        cube_rows = q_size.get("qcy", 0)
+        width = q_size.get("qcx", 0)
+        titles = column_titles(hypercube)
+        dim_count = len(hypercube.get("qDimensionInfo", []))
+        totals = hypercube.get("qGrandTotalRow") or []
+
+        dimensions = [
+            {"title": titles[i], "distinct_values": info.get("qCardinal")}
+            for i, info in enumerate(hypercube.get("qDimensionInfo", []))
+        ]
+        measures = []
+        for i, info in enumerate(hypercube.get("qMeasureInfo", [])):
+            measure = {
+                "title": titles[dim_count + i],
+                "min": native_number(info.get("qMin")),
+                "max": native_number(info.get("qMax")),
+            }
+            if i < len(totals):
+                measure["total"] = native_number(totals[i].get("qNum"))
+                measure["total_text"] = totals[i].get("qText")
+            measures.append(measure)
+
+        sample_rows = max(0, min(sample_rows, cube_rows))
+        sample: List[Any] = []
+        view = hypercube
+        if sample_rows:
+            view = await self.table_view(app_id, api_key, obj_handle, hypercube)
+            # qInitialDataFetch: a primeira página pode já ter vindo no layout (só em tabelas retas)
+            for page in (hypercube.get("qDataPages") or []) if view is hypercube else []:
+                area = page.get("qArea", {})
+                if area.get("qTop", 0) == 0 and area.get("qLeft", 0) == 0 and area.get("qWidth", 0) >= width:
+                    sample = page.get("qMatrix", [])[:sample_rows]
+                    break
+            if len(sample) < sample_rows:
+                sample = []
+                async for _, matrix in self.iter_hypercube_pages(
+                    app_id, api_key, obj_handle, view, max_rows=sample_rows, page_size=sample_rows
+                ):
+                    sample.extend(matrix)
+        if fields:
+            sample = list(map(row_shaper(view, fields), sample))
+
+        response = {
+            "total_rows": cube_rows,
+            "total_columns": width,
+            "dimensions": dimensions,
+            "measures": measures,
+            "sample": sample,
+        }
+        if hypercube.get("qMode") in self.CUBE_TYPES:
+            response["cube_type"] = self.CUBE_TYPES[hypercube["qMode"]]
+        if view.get("columns_truncated"):
+            response["columns_truncated"] = True
+        if fields:
+            response.update(shaped_meta(view, fields))
+        return response
+
+    async def _field_list(self, ws: Any, app_id: str, field: str, api_key: str) -> int:
+        """Handle of a session list object over field, created once per pooled connection."""
+        lists = self._field_lists.setdefault(ws, {})
+        handle = lists.get(field)
+        if handle is None:
+            doc_handle = await self.open_doc(app_id, api_key)
+            definition = [{
+                "qInfo": {"qId": "", "qType": "FieldValues"},
+                "qListObjectDef": {
+                    "qDef": {"qFieldDefs": [field], "qSortCriterias": [{"qSortByAscii": 1, "qSortByNumeric": 1}]},
+                    "qInitialDataFetch": [],
+                },
+            }]
+            result = await self._send_qix_request(ws, "CreateSessionObject", definition, request_id=8, qix_handle=doc_handle)
+            res = result.get("result") or {}
+            handle = (res.get("qReturn") or res).get("qHandle")
+            if handle is None:
+                raise Exception(f"QIX: could not create a list object for field '{field}'")
+            lists[field] = handle
+        return handle
+
+    async def get_field_values(self, app_id: str, field: str, api_key: str, search: Optional[str] = None,
+                               offset: int = 0, limit: int = 100) -> Dict[str, Any]:
+        """
+        Distinct values of a field, sorted, one page (offset/limit) at a time, from a
+        session list object on the pooled connection: nothing is selected and no chart
+        data is read.
+
+        With search, the list object is put in search mode (SearchListObjectFor), so its
+        size and pages are only the matching values, and the search is aborted after the
+        page is read. The list objects of a connection are used by one call at a time.
+        """
+        ws = await self._get_connection(app_id, api_key)
+        lock = self._field_list_locks.get(ws)
+        if lock is None:
+            lock = self._field_list_locks[ws] = asyncio.Lock()
+        async with lock:
+            handle = await self._field_list(ws, app_id, field, api_key)
+            try:
+                if search:
+                    await self._send_qix_request(ws, "SearchListObjectFor", ["/qListObjectDef", search], request_id=11, qix_handle=handle)
+                layout_result = await self._send_qix_request(ws, "GetLayout", [], request_id=9, qix_handle=handle)
+                list_object = ((layout_result.get("result") or {}).get("qLayout") or {}).get("qListObject") or {}
+                if (list_object.get("qDimensionInfo") or {}).get("qError"):
+                    self._field_lists.get(ws, {}).pop(field, None)
+                    raise ValueError(f"Field '{field}' not found in app {app_id}. Field names are case-sensitive.")
+                total = (list_object.get("qSize") or {}).get("qcy", 0)
+                offset = max(0, offset)
+                height = max(0, min(limit, total - offset, self.MAX_PAGE_CELLS))
+                values: List[str] = []
+                if height:
+                    result = await self._send_qix_request(
+                        ws,
+                        "GetListObjectData",
+                        ["/qListObjectDef", [{"qTop": offset, "qLeft": 0, "qWidth": 1, "qHeight": height}]],
+                        request_id=10,
+                        qix_handle=handle,
+                    )
+                    for page in (result.get("result") or {}).get("qDataPages", []):
+                        values.extend(row[0].get("qText") for row in page.get("qMatrix", []) if row)
+            finally:
+                if search and field in self._field_lists.get(ws, {}):
+                    await self._send_qix_request(ws, "AbortListObjectSearch", ["/qListObjectDef"], request_id=12, qix_handle=handle)
+        return {"total": total, "values": values, "next_offset": offset + len(values) if offset + len(values) < total else None}
+
+    async def close_connection(self, app_id: str, api_key: Optional[str] = None):
+        """Close the pooled sessions of an app (only the one of api_key's token, when given)."""
+        only = self._cache_key(app_id, api_key) if api_key else None
+        for cache_key in [k for k in self.connections if k.split(":", 1)[0] == app_id and only in (None, k)]:
+            ws = self.connections.pop(cache_key)
+            self.doc_handles.pop(cache_key, None)
+            self._forget_locks(cache_key)
+            ENGINE_WS_EVICTIONS.inc(reason="closed")
             if not ws.closed:
                 await ws.close()
-            del self.connections[cache_key]
@@ -0,0 +1,216 @@
+import asyncio
+import logging
+import os
+import time
+from collections import OrderedDict
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional, Tuple
+
+import httpx
+
+from src.observability.metrics import CACHE_INVALIDATIONS
+from src.qlik.client import QlikRestClient
+from src.storage.columnar_cache import get_columnar_cache
+from src.storage.shared_cache import get_shared_cache, cache_key
+
+logger = logging.getLogger(__name__)
+
+
+def normalise_marker(marker: Any) -> Optional[str]:
+    """ISO-8601 timestamps in one canonical UTC form, so markers from the Engine and the items API compare as strings."""
+    if not marker:
+        return None
+    try:
+        parsed = datetime.fromisoformat(str(marker).replace("Z", "+00:00"))
+    except ValueError:
+        return str(marker)
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return parsed.astimezone(timezone.utc).strftime("%Y-%m-%dT%H:%M:%S.%fZ")
+
+
+def item_marker(item: Dict[str, Any]) -> Optional[str]:
+    """Change marker of an app in the items API: last reload time, else last update."""
+    attributes = item.get("resourceAttributes") or {}
+    return attributes.get("lastReloadTime") or item.get("resourceUpdatedAt") or item.get("updatedAt")
+
+
+class AppFreshnessTracker:
+    """
+    Knows when an app's data last changed, so caches can use long TTLs.
+
+    The marker of an app is its last reload time (qLastReloadTime from
+    GetAppLayout, or lastReloadTime/updatedAt from the items API). Markers seen
+    anywhere (observe) are compared with the last one recorded in the shared
+    cache, so every worker agrees; only a newer marker counts as a change and
+    invalidates what was cached for the app: shared cache entries tagged with
+    the app id, app catalogs and the in-memory columnar tables. A worker that
+    finds the change already recorded by another one still drops its own
+    in-memory tables.
+
+    Apps used in the last MCP_FRESHNESS_HOT_SECONDS are polled every
+    MCP_FRESHNESS_POLL_SECONDS with one items API GET each, using the token of
+    their last caller (kept in memory only).
+    """
+
+    def __init__(self):
+        self.tenant_url = os.getenv("QLIK_CLOUD_TENANT_URL", "").rstrip("/")
+        self.poll_interval = float(os.getenv("MCP_FRESHNESS_POLL_SECONDS", "30"))
+        self.hot_window = float(os.getenv("MCP_FRESHNESS_HOT_SECONDS", "900"))
+        self.max_apps = int(os.getenv("MCP_FRESHNESS_MAX_APPS", "200"))
+        self.concurrency = int(os.getenv("MCP_FRESHNESS_CONCURRENCY", "4"))
+        # Os marcadores não levam tag: delete_tag(app_id) não apaga o próprio marcador
+        self.marker_ttl = float(os.getenv("MCP_FRESHNESS_MARKER_TTL", str(7 * 24 * 3600)))
+        self.enabled = (
+            bool(self.tenant_url)
+            and os.getenv("MCP_FRESHNESS_ENABLED", "true").strip().lower() not in ("0", "false", "no", "off")
+        )
+        self.cache = get_shared_cache()
+        self.columnar = get_columnar_cache()
+        # app_id -> (token do último uso, instante do último uso em time.monotonic())
+        self._hot: "OrderedDict[str, Tuple[str, float]]" = OrderedDict()
+        self._markers: Dict[str, str] = {}
+        self._checked_at: Dict[str, float] = {}
+        self._task: Optional[asyncio.Task] = None
+        self._rest: Optional[QlikRestClient] = None
+
+    def touch(self, app_id: str, api_key: str):
+        """Mark the app as in use (it gets polled while hot)."""
+        if not self.enabled or not app_id or not api_key:
+            return
+        self._hot[app_id] = (api_key, time.monotonic())
+        self._hot.move_to_end(app_id)
+        while len(self._hot) > self.max_apps:
+            stale, _ = self._hot.popitem(last=False)
+            self._checked_at.pop(stale, None)
+
+    async def observe(self, app_id: str, marker: Optional[str], source: str = "layout") -> bool:
+        """Record a marker seen for the app; returns True (after invalidating) if the app changed."""
+        marker = normalise_marker(marker)
+        if not self.enabled or not app_id or not marker:
+            return False
+        known = self._markers.get(app_id)
+        if known is not None and marker <= known:
+            return False
+        key = cache_key("freshness", app_id)
+        stored = await self.cache.get(key)
+        previous = max(filter(None, (known, stored)), default=None)
+        if previous is not None and marker <= previous:
+            # Marcador antigo (ex.: catálogo servido do cache); o mais novo já foi registrado
+            self._markers[app_id] = previous
+            if known is not None and previous > known:
+                # Outro worker registrou a mudança e limpou o cache compartilhado; falta o estado deste processo
+                self.invalidate_local(app_id, source)
+                return True
+            return False
+        self._markers[app_id] = marker
+        await self.cache.set(key, marker, self.marker_ttl)
+        if previous is None:
+            return False
+        await self.invalidate(app_id, source)
+        return True
+
+    async def observe_items(self, items: List[Dict[str, Any]]) -> int:
+        """Markers from an app catalog (items API); only hot apps are looked at. Returns how many changed."""
+        changed = 0
+        for item in items:
+            app_id = item.get("resourceId")
+            if app_id in self._hot:
+                changed += await self.observe(app_id, item_marker(item), source="catalog")
+        return changed
+
+    async def invalidate(self, app_id: str, source: str = "manual"):
+        removed = await self.cache.delete_tag(app_id)
+        # Catálogos de apps trazem updatedAt/lastReloadTime do app
+        await self.cache.delete_tag("apps")
+        tables = self.columnar.delete_tag(app_id)
+        CACHE_INVALIDATIONS.inc(source=source)
+        logger.info(
+            "App %s changed (%s): invalidated %d shared cache entries and %d in-memory tables",
+            app_id, source, removed, tables,
+        )
+
+    def invalidate_local(self, app_id: str, source: str = "manual"):
+        """Drop only this process's in-memory state for the app (the shared cache was already cleared)."""
+        tables = self.columnar.delete_tag(app_id)
+        CACHE_INVALIDATIONS.inc(source=source)
+        logger.info("App %s changed (%s, seen by another worker): invalidated %d in-memory tables", app_id, source, tables)
+
+    async def check(self, app_id: str) -> bool:
+        """Poll one hot app through the items API; returns True if it changed."""
+        entry = self._hot.get(app_id)
+        if entry is None:
+            return False
+        self._checked_at[app_id] = time.monotonic()
+        try:
+            item = await self._client().get_app_item(app_id, entry[0])
+        except httpx.HTTPStatusError as e:
+            if e.response.status_code in (401, 403):
+                # Token do último uso expirou: para de consultar até o próximo touch
+                self._hot.pop(app_id, None)
+            logger.debug("Freshness check failed for app %s: %s", app_id, e)
+            return False
+        except httpx.HTTPError as e:
+            logger.debug("Freshness check failed for app %s: %s", app_id, e)
+            return False
+        if item is None:
+            return False
+        return await self.observe(app_id, item_marker(item), source="poll")
+
+    async def poll_once(self) -> int:
+        """Check every hot app not checked in the last poll interval; returns how many changed."""
+        now = time.monotonic()
+        for app_id, (_, used_at) in list(self._hot.items()):
+            if now - used_at > self.hot_window:
+                self._hot.pop(app_id, None)
+                self._checked_at.pop(app_id, None)
+        due = [a for a in self._hot if now - self._checked_at.get(a, 0) >= self.poll_interval]
+        if not due:
+            return 0
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def check_one(app_id: str) -> bool:
+            async with semaphore:
+                return await self.check(app_id)
+
+        return sum(await asyncio.gather(*(check_one(a) for a in due)))
+
+    def start(self):
+        if self.enabled and self.poll_interval > 0 and self._task is None:
+            self._task = asyncio.ensure_future(self._run())
+            logger.info("App freshness polling started (interval=%ss, hot window=%ss)", self.poll_interval, self.hot_window)
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.poll_interval)
+            try:
+                await self.poll_once()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning("App freshness poll failed: %s", e)
+
+    def _client(self) -> QlikRestClient:
+        if self._rest is None:
+            self._rest = QlikRestClient()
+        return self._rest
+
+
+_freshness_tracker: Optional[AppFreshnessTracker] = None
+
+
+def get_freshness_tracker() -> AppFreshnessTracker:
+    """Process-wide AppFreshnessTracker."""
+    global _freshness_tracker
+    if _freshness_tracker is None:
+        _freshness_tracker = AppFreshnessTracker()
+    return _freshness_tracker
@@ -0,0 +1,273 @@
+import asyncio
+import logging
+import os
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+from urllib.parse import parse_qs, urlsplit
+
+from src.qlik.auth import token_fingerprint
+from src.qlik.client import QlikRestClient
+from src.qlik.engine import QlikEngineAuthError, QlikEngineClient
+from src.qlik.freshness import item_marker
+from src.storage.object_index import get_object_index
+
+logger = logging.getLogger(__name__)
+
+
+def next_cursor(result: Dict[str, Any]) -> Optional[str]:
+    """Cursor of the next items API page (links.next.href), if any."""
+    if result.get("nextCursor"):
+        return result["nextCursor"]
+    href = (((result.get("links") or {}).get("next") or {}).get("href")) or ""
+    values = parse_qs(urlsplit(href).query).get("cursor")
+    return values[0] if values else None
+
+
+def object_entry(object_id: str, layout: Dict[str, Any], sheet_id: str, sheet_title: str) -> Dict[str, Any]:
+    """What the index keeps of one object: type, title and dimension/measure labels."""
+    info = layout.get("qInfo") or {}
+    hypercube = layout.get("qHyperCube") or {}
+    title = layout.get("title")
+    if not isinstance(title, str):
+        title = ""
+    return {
+        "object_id": object_id,
+        "object_type": layout.get("visualization") or info.get("qType") or "",
+        "title": title or (layout.get("qMeta") or {}).get("title") or "",
+        "sheet_id": sheet_id,
+        "sheet_title": sheet_title,
+        "dimensions": [d.get("qFallbackTitle") for d in hypercube.get("qDimensionInfo", []) if d.get("qFallbackTitle")],
+        "measures": [m.get("qFallbackTitle") for m in hypercube.get("qMeasureInfo", []) if m.get("qFallbackTitle")],
+    }
+
+
+class AppInventoryCrawler:
+    """
+    Background inventory of every app a user can open: sheets and their objects
+    (titles, types, dimension/measure labels) go into the ObjectIndex, which
+    qlik_find_objects searches instead of walking apps -> sheets -> objects.
+
+    Users are registered by the tools (token kept in memory only, like the
+    freshness tracker) and crawled with their own token, so the index never holds
+    anything the user could not list. A crawl lists the apps (items API) and only
+    re-reads apps whose updatedAt changed since they were indexed, at most
+    MCP_INVENTORY_CONCURRENCY apps at a time, each on an Engine session of the
+    crawler's own (a separate identity, never the session the user's tools use)
+    that is closed when the app is done. Users seen in the last
+    MCP_INVENTORY_HOT_SECONDS are re-crawled every MCP_INVENTORY_REFRESH_SECONDS.
+
+    The index is keyed by the Qlik user id (/users/me), not by the token, so a
+    rotated OAuth token keeps the user's index instead of starting a full
+    re-crawl. Users not crawled for MCP_INVENTORY_RETENTION_SECONDS are purged.
+    """
+
+    def __init__(self):
+        self.tenant_url = os.getenv("QLIK_CLOUD_TENANT_URL", "").rstrip("/")
+        self.refresh_interval = float(os.getenv("MCP_INVENTORY_REFRESH_SECONDS", "600"))
+        self.hot_window = float(os.getenv("MCP_INVENTORY_HOT_SECONDS", "3600"))
+        self.concurrency = int(os.getenv("MCP_INVENTORY_CONCURRENCY", "4"))
+        self.max_apps = int(os.getenv("MCP_INVENTORY_MAX_APPS", "500"))
+        self.max_users = int(os.getenv("MCP_INVENTORY_MAX_USERS", "100"))
+        self.retention = float(os.getenv("MCP_INVENTORY_RETENTION_SECONDS", "604800"))
+        self.enabled = (
+            bool(self.tenant_url)
+            and os.getenv("MCP_INVENTORY_ENABLED", "true").strip().lower() not in ("0", "false", "no", "off")
+        )
+        self.index = get_object_index()
+        # Sessão própria no Engine: fechar a conexão do crawler não encerra a sessão interativa do usuário
+        self.engine = QlikEngineClient(identity="mcp-inventory")
+        self.client = QlikRestClient()
+        # user id -> (token do último uso, instante do último uso em time.monotonic())
+        self._users: "OrderedDict[str, Tuple[str, float]]" = OrderedDict()
+        # fingerprint do token -> user id (perder uma entrada só custa um /users/me em cache)
+        self._owners: "OrderedDict[str, str]" = OrderedDict()
+        self._crawled_at: Dict[str, float] = {}
+        self._crawls: Dict[str, asyncio.Task] = {}
+        self._task: Optional[asyncio.Task] = None
+        self._purged_at = 0.0
+
+    async def owner(self, api_key: str) -> str:
+        """Index owner of a token: the Qlik user id, or the token fingerprint if /users/me fails."""
+        fingerprint = token_fingerprint(api_key)
+        owner = self._owners.get(fingerprint)
+        if owner is not None:
+            self._owners.move_to_end(fingerprint)
+            return owner
+        try:
+            user_id = (await self.client.get_current_user(api_key)).get("id")
+        except Exception as e:
+            logger.debug("Could not resolve Qlik user for the inventory: %s", e)
+            user_id = None
+        if not user_id:
+            # Não memoriza: tenta de novo no próximo uso; o que ficar com o fingerprint é expurgado
+            return fingerprint
+        owner = f"user:{user_id}"
+        self._owners[fingerprint] = owner
+        while len(self._owners) > self.max_users:
+            self._owners.popitem(last=False)
+        return owner
+
+    async def register(self, api_key: str) -> Optional[asyncio.Task]:
+        """Remember the user's token and start a crawl if their index is missing or stale; returns the running crawl."""
+        if not self.enabled or not api_key:
+            return None
+        owner = await self.owner(api_key)
+        # Token novo (rotação) substitui o antigo: mesmo usuário, mesmo índice
+        self._users[owner] = (api_key, time.monotonic())
+        self._users.move_to_end(owner)
+        while len(self._users) > self.max_users:
+            stale, _ = self._users.popitem(last=False)
+            self._crawled_at.pop(stale, None)
+        crawled_at = self._crawled_at.get(owner)
+        if crawled_at is None or time.monotonic() - crawled_at >= self.refresh_interval:
+            return self.schedule(owner)
+        return self._crawls.get(owner)
+
+    def schedule(self, owner: str) -> Optional[asyncio.Task]:
+        running = self._crawls.get(owner)
+        if running is not None and not running.done():
+            return running
+        entry = self._users.get(owner)
+        if entry is None:
+            return None
+        self._crawled_at[owner] = time.monotonic()
+        task = asyncio.ensure_future(self._crawl_logged(entry[0], owner))
+        self._crawls[owner] = task
+        task.add_done_callback(lambda _: self._crawls.pop(owner, None) if self._crawls.get(owner) is task else None)
+        return task
+
+    def crawling(self, owner: str) -> Optional[asyncio.Task]:
+        task = self._crawls.get(owner)
+        return task if task is not None and not task.done() else None
+
+    async def _crawl_logged(self, api_key: str, owner: str) -> Dict[str, int]:
+        try:
+            return await self.crawl(api_key, owner)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.warning("App inventory crawl failed: %s", e)
+            return {}
+
+    async def list_apps(self, api_key: str) -> List[Dict[str, Any]]:
+        apps: List[Dict[str, Any]] = []
+        cursor = None
+        while len(apps) < self.max_apps:
+            result = await self.client.get_apps(api_key, limit=100, cursor=cursor)
+            apps.extend(item for item in result.get("data", []) if item.get("resourceId"))
+            cursor = next_cursor(result)
+            if not cursor:
+                break
+        return apps[:self.max_apps]
+
+    async def crawl(self, api_key: str, owner: Optional[str] = None) -> Dict[str, int]:
+        """Index the user's new or changed apps and drop the ones they no longer list."""
+        owner = owner or await self.owner(api_key)
+        started = time.perf_counter()
+        await self.index.touch_owner(owner)
+        apps = await self.list_apps(api_key)
+        known = await self.index.app_markers(owner)
+        listed = {item["resourceId"] for item in apps}
+        await self.index.remove_apps(owner, [app_id for app_id in known if app_id not in listed])
+        changed = [
+            item for item in apps
+            if item["resourceId"] not in known or known[item["resourceId"]] != self._marker(item)
+        ]
+        semaphore = asyncio.Semaphore(self.concurrency)
+        auth_failed = asyncio.Event()
+
+        async def index_one(item: Dict[str, Any]) -> bool:
+            async with semaphore:
+                if auth_failed.is_set():
+                    return False
+                try:
+                    await self.index_app(api_key, item, owner)
+                    return True
+                except QlikEngineAuthError:
+                    # Token expirado: não adianta tentar os outros apps
+                    auth_failed.set()
+                    return False
+
+        indexed = sum(await asyncio.gather(*(index_one(item) for item in changed)))
+        logger.info(
+            "App inventory: %d apps listed, %d re-indexed, %d unchanged, %d removed in %.1fs",
+            len(apps), indexed, len(apps) - len(changed), len(set(known) - listed), time.perf_counter() - started,
+        )
+        return {"apps": len(apps), "indexed": indexed, "unchanged": len(apps) - len(changed), "removed": len(set(known) - listed)}
+
+    def _marker(self, item: Dict[str, Any]) -> Optional[str]:
+        return item.get("updatedAt") or item_marker(item)
+
+    async def index_app(self, api_key: str, item: Dict[str, Any], owner: Optional[str] = None):
+        owner = owner or await self.owner(api_key)
+        app_id = item["resourceId"]
+        app_name = item.get("name") or app_id
+        objects: List[Dict[str, Any]] = []
+        try:
+            for sheet in await self.engine.get_sheets(app_id, api_key):
+                sheet_id = (sheet.get("qInfo") or {}).get("qId")
+                if not sheet_id:
+                    continue
+                sheet_title = (sheet.get("qMeta") or {}).get("title") or (sheet.get("qData") or {}).get("title") or sheet_id
+                objects.append({"object_id": sheet_id, "object_type": "sheet", "title": sheet_title,
+                                "sheet_id": sheet_id, "sheet_title": sheet_title})
+                for child in await self.engine.get_sheet_objects(app_id, sheet_id, api_key):
+                    object_id = (child.get("qInfo") or {}).get("qId")
+                    if not object_id:
+                        continue
+                    layout = (await self.engine.get_object(app_id, object_id, api_key)).get("layout") or {}
+                    objects.append(object_entry(object_id, layout, sheet_id, sheet_title))
+        except QlikEngineAuthError:
+            raise
+        except Exception as e:
+            # Sem marcador: o app é tentado de novo na próxima varredura
+            logger.warning("App inventory failed for app %s: %s", app_id, e)
+            await self.index.replace_app(owner, app_id, app_name, None, objects, error=str(e)[:500])
+            return
+        finally:
+            await self.engine.close_connection(app_id, api_key)
+        await self.index.replace_app(owner, app_id, app_name, self._marker(item), objects)
+
+    def start(self):
+        if self.enabled and self.refresh_interval > 0 and self._task is None:
+            self._task = asyncio.ensure_future(self._run())
+            logger.info("App inventory crawler started (refresh=%ss, concurrency=%d)", self.refresh_interval, self.concurrency)
+
+    async def stop(self):
+        tasks = [t for t in (self._task, *self._crawls.values()) if t is not None]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._task = None
+        self._crawls.clear()
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(min(self.refresh_interval, 60))
+            now = time.monotonic()
+            for owner, (_, used_at) in list(self._users.items()):
+                if now - used_at > self.hot_window:
+                    self._users.pop(owner, None)
+                    self._crawled_at.pop(owner, None)
+                elif now - self._crawled_at.get(owner, 0) >= self.refresh_interval:
+                    self.schedule(owner)
+            if self.retention > 0 and now - self._purged_at >= self.refresh_interval:
+                self._purged_at = now
+                try:
+                    purged = await self.index.purge_owners(time.time() - self.retention)
+                    if purged:
+                        logger.info("App inventory: purged the index of %d inactive users", purged)
+                except Exception as e:
+                    logger.warning("App inventory purge failed: %s", e)
+
+
+_inventory_crawler: Optional[AppInventoryCrawler] = None
+
+
+def get_inventory_crawler() -> AppInventoryCrawler:
+    """Process-wide AppInventoryCrawler."""
+    global _inventory_crawler
+    if _inventory_crawler is None:
+        _inventory_crawler = AppInventoryCrawler()
+    return _inventory_crawler
@@ -0,0 +1,155 @@
+import math
+from typing import Any, Callable, Dict, List, Optional
+
+# Campos de célula do qMatrix que podem ser pedidos em "fields"
+CELL_FIELDS = {
+    "text": "qText",
+    "num": "qNum",
+    "elemNumber": "qElemNumber",
+    "state": "qState",
+}
+# "value": texto nas dimensões, número nativo nas medidas
+VALUE_FIELD = "value"
+FIELDS = (*CELL_FIELDS, VALUE_FIELD)
+
+RowShaper = Callable[[List[Dict[str, Any]]], List[Any]]
+
+
+def column_titles(hypercube: Dict[str, Any]) -> List[str]:
+    """Header row: dimension then measure titles, in qMatrix column order."""
+    dims = [info.get("qFallbackTitle") or f"dim{i}" for i, info in enumerate(hypercube.get("qDimensionInfo", []))]
+    measures = [info.get("qFallbackTitle") or f"measure{i}" for i, info in enumerate(hypercube.get("qMeasureInfo", []))]
+    return dims + measures
+
+
+def native_number(value: Any) -> Any:
+    """qNum as a JSON number: NaN/Infinity (Qlik's "no number") -> None, integral floats -> int."""
+    if not isinstance(value, (int, float)) or isinstance(value, bool):
+        return None
+    if isinstance(value, float):
+        if math.isnan(value) or math.isinf(value):
+            return None
+        if value.is_integer() and abs(value) < 2 ** 53:
+            return int(value)
+    return value
+
+
+def parse_fields(fields: Any) -> Optional[List[str]]:
+    """Validate a "fields" argument (list or comma-separated string); None/empty means full cells."""
+    if not fields:
+        return None
+    if isinstance(fields, str):
+        fields = [f.strip() for f in fields.split(",") if f.strip()]
+    unknown = [f for f in fields if f not in FIELDS]
+    if unknown:
+        raise ValueError(f"Unsupported fields {unknown}. Use any of: {', '.join(FIELDS)}")
+    return list(dict.fromkeys(fields))
+
+
+def row_shaper(hypercube: Dict[str, Any], fields: List[str]) -> RowShaper:
+    """
+    Function reducing a qMatrix row to the requested fields. With one field each
+    cell becomes a bare value; with several, a list in the order asked. Numbers
+    are native JSON numbers (NaN -> null, integral values without ".0").
+    """
+    fields = parse_fields(fields) or [VALUE_FIELD]
+    dim_count = len(hypercube.get("qDimensionInfo", []))
+
+    def getter(field: str) -> Callable[[int, Dict[str, Any]], Any]:
+        if field == VALUE_FIELD:
+            return lambda i, cell: cell.get("qText") if i < dim_count else native_number(cell.get("qNum"))
+        if field == "num":
+            return lambda i, cell: native_number(cell.get("qNum"))
+        key = CELL_FIELDS[field]
+        return lambda i, cell: cell.get(key)
+
+    getters = [getter(f) for f in fields]
+    if len(getters) == 1:
+        get = getters[0]
+        return lambda row: [get(i, cell) for i, cell in enumerate(row)]
+    return lambda row: [[g(i, cell) for g in getters] for i, cell in enumerate(row)]
+
+
+def shaped_meta(hypercube: Dict[str, Any], fields: Optional[List[str]]) -> Dict[str, Any]:
+    """What a shaped response carries next to the rows: header row and cell layout."""
+    meta: Dict[str, Any] = {"columns": column_titles(hypercube)}
+    if fields and len(fields) > 1:
+        meta["cell_fields"] = list(fields)
+    return meta
+
+
+# Pivot ("P") e stacked ("K"): as páginas vêm em árvores (qSubNodes) e viram linhas de tabela reta
+
+_EMPTY_CELL = {"qText": None, "qNum": "NaN", "qElemNumber": -1, "qType": "E"}
+# Campos de paginação/árvore que não fazem sentido numa linha achatada
+_TREE_ONLY = ("qSubNodes", "qUp", "qDown", "qRow", "qMaxPos", "qMinNeg")
+
+
+def tree_cell(node: Dict[str, Any]) -> Dict[str, Any]:
+    """A pivot/stack tree node as a qMatrix-style cell (qValue -> qNum, qElemNo -> qElemNumber)."""
+    cell = {k: v for k, v in node.items() if k not in _TREE_ONLY}
+    if "qValue" in cell:
+        cell["qNum"] = cell.pop("qValue")
+    if "qElemNo" in cell:
+        cell["qElemNumber"] = cell.pop("qElemNo")
+    return cell
+
+
+def tree_paths(nodes: List[Dict[str, Any]]) -> List[List[Dict[str, Any]]]:
+    """Root-to-leaf paths of a header tree (one per visible row/column, collapsed nodes are leaves)."""
+    paths: List[List[Dict[str, Any]]] = []
+
+    def walk(node: Dict[str, Any], path: List[Dict[str, Any]]):
+        path = path + [node]
+        children = node.get("qSubNodes") or []
+        if not children:
+            paths.append(path)
+        for child in children:
+            walk(child, path)
+
+    for node in nodes or []:
+        walk(node, [])
+    return paths
+
+
+def pivot_rows(page: Dict[str, Any], left_count: int) -> List[List[Dict[str, Any]]]:
+    """Rows of a GetHyperCubePivotData page: left header path (padded to left_count) then the data cells."""
+    rows = []
+    for path, values in zip(tree_paths(page.get("qLeft", [])), page.get("qData", [])):
+        cells = [tree_cell(n) for n in path[:left_count]]
+        cells += [dict(_EMPTY_CELL) for _ in range(left_count - len(cells))]
+        rows.append(cells + list(values))
+    return rows
+
+
+def pivot_column_titles(page: Dict[str, Any], width: int, measure_titles: List[str]) -> List[str]:
+    """Titles of the data columns of a pivot page, from its top header paths ("2023 / Vendas")."""
+    titles = [" / ".join(str(n.get("qText") or "") for n in path) for path in tree_paths(page.get("qTop", []))][:width]
+    if len(titles) != width:
+        # Sem dimensões no topo: uma coluna por medida
+        titles = [measure_titles[i % len(measure_titles)] if measure_titles else f"col{i}" for i in range(width)]
+    return titles
+
+
+def stack_rows(page: Dict[str, Any], dim_count: int, measure_count: int) -> List[List[Dict[str, Any]]]:
+    """Rows of a GetHyperCubeStackData page: one per dimension path, followed by its measure values."""
+    rows: List[List[Dict[str, Any]]] = []
+
+    def walk(node: Dict[str, Any], path: List[Dict[str, Any]]):
+        children = node.get("qSubNodes") or []
+        if node.get("qType") == "R":
+            for child in children:
+                walk(child, path)
+            return
+        path = path + [tree_cell(node)]
+        if len(path) < dim_count and children:
+            for child in children:
+                walk(child, path)
+            return
+        values = [tree_cell(c) for c in children][:measure_count]
+        cells = path + [dict(_EMPTY_CELL) for _ in range(dim_count - len(path))]
+        rows.append(cells + values + [dict(_EMPTY_CELL) for _ in range(measure_count - len(values))])
+
+    for node in page.get("qData", []):
+        walk(node, [])
+    return rows
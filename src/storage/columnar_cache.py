@@ -0,0 +1,326 @@
+import operator
+import os
+import time
+from array import array
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from src.observability.metrics import CACHE_REQUESTS
+from src.storage.exports import unique_column_names
+
+FILTER_OPS = {
+    "=": operator.eq, "!=": operator.ne,
+    ">": operator.gt, ">=": operator.ge, "<": operator.lt, "<=": operator.le,
+}
+AGGREGATES = ("sum", "avg", "min", "max", "count", "count_distinct")
+
+
+class ColumnarTable:
+    """
+    A fetched hypercube held column by column for local queries.
+
+    Dimensions are dictionary-encoded (int32 codes into an array of distinct
+    texts), so filters are evaluated once per distinct value and group-by works
+    on the codes; measures are float64 arrays with NaN for nulls. Every query
+    step is a NumPy operation over whole columns.
+    """
+
+    def __init__(self, columns: List[Dict[str, str]], codes: Dict[str, np.ndarray],
+                 categories: Dict[str, np.ndarray], values: Dict[str, np.ndarray], row_count: int):
+        self.columns = columns
+        self.codes = codes
+        self.categories = categories
+        self.values = values
+        self.row_count = row_count
+        self.created_at = time.monotonic()
+        # Pivot mais largo que a página do Engine: só as primeiras colunas do topo foram lidas
+        self.columns_truncated = False
+
+    @property
+    def cells(self) -> int:
+        return self.row_count * len(self.columns)
+
+    @property
+    def names(self) -> List[str]:
+        return [c["name"] for c in self.columns]
+
+    def _check(self, name: Any) -> str:
+        if name not in self.codes and name not in self.values:
+            raise ValueError(f"Unknown column '{name}'. Columns: {', '.join(self.names)}")
+        return name
+
+    def _materialize(self, name: str, rows: np.ndarray) -> np.ndarray:
+        if name in self.codes:
+            return self.categories[name][self.codes[name][rows]]
+        return self.values[name][rows]
+
+    def _filter_mask(self, filters: Sequence[Dict[str, Any]]) -> np.ndarray:
+        mask = np.ones(self.row_count, dtype=bool)
+        for f in filters:
+            name = self._check(f.get("column"))
+            op = f.get("op", "=")
+            value = f.get("value")
+            if name in self.codes:
+                # Avaliado sobre os valores distintos e projetado nas linhas pelos códigos
+                cats = self.categories[name]
+                mask &= self._match(cats, op, value, str)[self.codes[name]]
+            else:
+                mask &= self._match(self.values[name], op, value, float)
+        return mask
+
+    def _match(self, col: np.ndarray, op: str, value: Any, cast) -> np.ndarray:
+        if op in ("in", "not_in"):
+            items = value if isinstance(value, list) else [value]
+            matched = np.isin(col, np.array([cast(v) for v in items], dtype=col.dtype))
+            return ~matched if op == "not_in" else matched
+        if op == "contains":
+            needle = str(value).lower()
+            return np.fromiter((needle in str(v).lower() for v in col), dtype=bool, count=len(col))
+        if op not in FILTER_OPS:
+            raise ValueError(f"Unsupported filter op '{op}'. Use one of: {', '.join([*FILTER_OPS, 'in', 'not_in', 'contains'])}")
+        try:
+            operand = cast(value)
+        except (TypeError, ValueError):
+            raise ValueError(f"Filter value {value!r} is not valid for this column") from None
+        return np.asarray(FILTER_OPS[op](col, operand), dtype=bool)
+
+    def _group_codes(self, name: str, rows: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """(codes of the rows, distinct values) for a group-by column."""
+        if name in self.codes:
+            return self.codes[name][rows], self.categories[name]
+        uniques, inverse = np.unique(self.values[name][rows], return_inverse=True)
+        return inverse.reshape(-1), uniques
+
+    def _aggregate(self, rows: np.ndarray, group_by: List[str],
+                   aggregates: List[Dict[str, Any]]) -> Tuple[List[str], List[np.ndarray]]:
+        names: List[str] = []
+        out: List[np.ndarray] = []
+        if group_by:
+            keyed = [self._group_codes(self._check(g), rows) for g in group_by]
+            dims = tuple(len(values) for _, values in keyed)
+            if np.prod(dims, dtype=float) < 2 ** 62:
+                combined = np.ravel_multi_index(tuple(codes for codes, _ in keyed), dims)
+                uniq, inverse = np.unique(combined, return_inverse=True)
+                group_codes = np.unravel_index(uniq, dims)
+            else:
+                uniq, inverse = np.unique(np.stack([codes for codes, _ in keyed], axis=1), axis=0, return_inverse=True)
+                group_codes = tuple(uniq[:, i] for i in range(len(keyed)))
+            inverse = inverse.reshape(-1)
+            groups = len(uniq)
+            for g, (_, values), codes in zip(group_by, keyed, group_codes):
+                names.append(g)
+                out.append(values[codes])
+        else:
+            inverse = np.zeros(len(rows), dtype=np.intp)
+            groups = 1
+
+        for agg in aggregates:
+            func = (agg.get("func") or "sum").lower()
+            column = agg.get("column")
+            if func not in AGGREGATES:
+                raise ValueError(f"Unsupported aggregate '{func}'. Use one of: {', '.join(AGGREGATES)}")
+            names.append(agg.get("as") or (f"{func}({column})" if column else func))
+            if func == "count" and not column:
+                out.append(np.bincount(inverse, minlength=groups))
+                continue
+            name = self._check(column)
+            if func == "count_distinct":
+                # Nulos (NaN nas medidas) não contam como valor distinto
+                keep = ~np.isnan(self.values[name][rows]) if name in self.values else slice(None)
+                codes, _ = self._group_codes(name, rows[keep])
+                pairs = np.unique(np.stack([inverse[keep], codes], axis=1), axis=0)
+                out.append(np.bincount(pairs[:, 0], minlength=groups))
+                continue
+            if name in self.codes:
+                if func != "count":
+                    raise ValueError(f"Column '{name}' is a dimension: only count and count_distinct apply")
+                out.append(np.bincount(inverse, minlength=groups))
+                continue
+            vals = self.values[name][rows]
+            valid = ~np.isnan(vals)
+            count = np.bincount(inverse, weights=valid, minlength=groups)
+            if func == "count":
+                out.append(count.astype(np.int64))
+                continue
+            total = np.bincount(inverse, weights=np.where(valid, vals, 0.0), minlength=groups)
+            with np.errstate(invalid="ignore", divide="ignore"):
+                if func == "sum":
+                    result = np.where(count > 0, total, np.nan)
+                elif func == "avg":
+                    result = np.where(count > 0, total / np.maximum(count, 1), np.nan)
+                else:
+                    result = np.full(groups, np.inf if func == "min" else -np.inf)
+                    (np.minimum if func == "min" else np.maximum).at(result, inverse[valid], vals[valid])
+                    result[count == 0] = np.nan
+            out.append(result)
+        return names, out
+
+    @staticmethod
+    def _sort_key(col: np.ndarray, desc: bool) -> np.ndarray:
+        if col.dtype.kind != "f":
+            col = np.unique(col, return_inverse=True)[1].reshape(-1).astype(float)
+        # NaN fica por último nos dois sentidos (lexsort/argpartition põem NaN no fim)
+        return -col if desc else col
+
+    def _order(self, keys: List[np.ndarray], limit: Optional[int]) -> np.ndarray:
+        n = len(keys[0])
+        if len(keys) == 1 and limit and n > 4 * limit:
+            # Top-N: particiona e ordena só os N primeiros
+            key = keys[0]
+            top = np.argpartition(key, limit - 1)[:limit]
+            return top[np.lexsort((top, key[top]))]
+        return np.lexsort(tuple(reversed(keys)))
+
+    def query(self, filters: Optional[List[Dict[str, Any]]] = None, group_by: Optional[List[str]] = None,
+              aggregates: Optional[List[Dict[str, Any]]] = None, sort: Optional[List[Dict[str, Any]]] = None,
+              limit: Optional[int] = 100, select: Optional[List[str]] = None) -> Dict[str, Any]:
+        rows = np.flatnonzero(self._filter_mask(filters or []))
+        group_by = list(group_by or [])
+        aggregates = list(aggregates or [])
+        if group_by and not aggregates:
+            # Padrão para group-by sem agregação: contagem de linhas e soma de cada medida
+            aggregates = [{"func": "count"}] + [{"func": "sum", "column": n} for n in self.values]
+
+        if group_by or aggregates:
+            names, out = self._aggregate(rows, group_by, aggregates)
+            size = len(out[0]) if out else 0
+
+            def column(name: str, picked: np.ndarray) -> np.ndarray:
+                return out[names.index(name)][picked]
+
+            def sort_column(name: str) -> np.ndarray:
+                return out[names.index(name)]
+        else:
+            names = [self._check(n) for n in (select or self.names)]
+            size = len(rows)
+
+            def column(name: str, picked: np.ndarray) -> np.ndarray:
+                return self._materialize(name, rows[picked])
+
+            def sort_column(name: str) -> np.ndarray:
+                if name in self.codes:
+                    # Ordem das linhas pelo rank de cada texto distinto
+                    ranks = np.argsort(np.argsort(self.categories[name], kind="stable"), kind="stable")
+                    return ranks[self.codes[name][rows]].astype(float)
+                return self.values[self._check(name)][rows]
+
+        if sort and size:
+            keys = []
+            for s in sort:
+                name = s.get("column")
+                if name not in names:
+                    raise ValueError(f"Cannot sort by '{name}': result columns are {', '.join(names)}")
+                keys.append(self._sort_key(sort_column(name), bool(s.get("desc"))))
+            picked = self._order(keys, limit)
+        else:
+            picked = np.arange(size)
+        if limit:
+            picked = picked[:limit]
+
+        data = []
+        for name in names:
+            col = column(name, picked)
+            if col.dtype.kind == "f":
+                col = np.where(np.isnan(col), None, col)
+            data.append(col.tolist())
+        return {
+            "columns": names,
+            "rows": [list(r) for r in zip(*data)] if data else [],
+            "matched_rows": int(len(rows)),
+            "result_rows": int(size),
+        }
+
+
+class ColumnarTableBuilder:
+    """Accumulates pages of plain rows (see exports.cell_values) into a ColumnarTable."""
+
+    def __init__(self, columns: List[Dict[str, str]]):
+        # Colunas são indexadas pelo nome: títulos repetidos não podem se sobrescrever
+        self.columns = unique_column_names(columns)
+        self._dims = [i for i, c in enumerate(columns) if c["type"] != "float64"]
+        self._measures = [i for i, c in enumerate(columns) if c["type"] == "float64"]
+        self._codes = {i: array("i") for i in self._dims}
+        self._lookup: Dict[int, Dict[str, int]] = {i: {} for i in self._dims}
+        self._values = {i: array("d") for i in self._measures}
+        self.row_count = 0
+
+    def add_rows(self, rows: List[List[Any]]):
+        nan = float("nan")
+        for i in self._dims:
+            lookup = self._lookup[i]
+            self._codes[i].extend(lookup.setdefault(row[i] or "", len(lookup)) for row in rows)
+        for i in self._measures:
+            self._values[i].extend(nan if row[i] is None else row[i] for row in rows)
+        self.row_count += len(rows)
+
+    def build(self) -> ColumnarTable:
+        codes, categories, values = {}, {}, {}
+        for i in self._dims:
+            name = self.columns[i]["name"]
+            codes[name] = np.frombuffer(self._codes[i], dtype=np.int32).copy()
+            cats = np.empty(len(self._lookup[i]), dtype=object)
+            cats[:] = list(self._lookup[i])
+            categories[name] = cats
+        for i in self._measures:
+            values[self.columns[i]["name"]] = np.frombuffer(self._values[i], dtype=np.float64).copy()
+        return ColumnarTable(self.columns, codes, categories, values, self.row_count)
+
+
+class ColumnarCache:
+    """
+    In-process LRU of ColumnarTables (per worker), bounded by total cells
+    (MCP_COLUMNAR_CACHE_MAX_CELLS) and entry age (MCP_COLUMNAR_CACHE_TTL).
+    Entries are tagged with the app id for invalidation, like SharedCache.
+    """
+
+    def __init__(self):
+        self.max_cells = int(os.getenv("MCP_COLUMNAR_CACHE_MAX_CELLS", "10000000"))
+        self.ttl = float(os.getenv("MCP_COLUMNAR_CACHE_TTL", "900"))
+        self.enabled = self.max_cells > 0 and self.ttl > 0
+        self._entries: "OrderedDict[str, Tuple[ColumnarTable, Optional[str]]]" = OrderedDict()
+        self._cells = 0
+
+    def get(self, key: str) -> Optional[ColumnarTable]:
+        entry = self._entries.get(key)
+        if entry is not None and time.monotonic() - entry[0].created_at >= self.ttl:
+            self._remove(key)
+            entry = None
+        CACHE_REQUESTS.inc(cache="columnar", result="hit" if entry is not None else "miss")
+        if entry is None:
+            return None
+        self._entries.move_to_end(key)
+        return entry[0]
+
+    def put(self, key: str, table: ColumnarTable, tag: Optional[str] = None) -> bool:
+        if not self.enabled or table.cells > self.max_cells:
+            return False
+        self._remove(key)
+        self._entries[key] = (table, tag)
+        self._cells += table.cells
+        while self._cells > self.max_cells:
+            self._remove(next(iter(self._entries)))
+        return True
+
+    def delete_tag(self, tag: str) -> int:
+        keys = [k for k, (_, t) in self._entries.items() if t == tag]
+        for key in keys:
+            self._remove(key)
+        return len(keys)
+
+    def _remove(self, key: str):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._cells -= entry[0].cells
+
+
+_columnar_cache: Optional[ColumnarCache] = None
+
+
+def get_columnar_cache() -> ColumnarCache:
+    """Process-wide ColumnarCache (shared by the tools of this worker)."""
+    global _columnar_cache
+    if _columnar_cache is None:
+        _columnar_cache = ColumnarCache()
+    return _columnar_cache
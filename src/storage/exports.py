@@ -0,0 +1,235 @@
+import csv
+import math
+import os
+import re
+import time
+import uuid
+from abc import ABC, abstractmethod
+from typing import Any, Dict, List, Optional
+
+# pyarrow é opcional: sem ele só o formato csv fica disponível
+try:
+    import pyarrow as pa
+    import pyarrow.ipc as pa_ipc
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+
+FORMATS = ("csv", "arrow", "parquet")
+EXTENSIONS = {"csv": "csv", "arrow": "arrow", "parquet": "parquet"}
+
+
+def column_schema(hypercube: Dict[str, Any]) -> List[Dict[str, str]]:
+    """Export columns of a hypercube: dimensions as strings, then measures as float64."""
+    columns = []
+    for info in hypercube.get("qDimensionInfo", []):
+        columns.append({"name": info.get("qFallbackTitle") or f"dim{len(columns)}", "type": "string", "kind": "dimension"})
+    for info in hypercube.get("qMeasureInfo", []):
+        columns.append({"name": info.get("qFallbackTitle") or f"measure{len(columns)}", "type": "float64", "kind": "measure"})
+    return unique_column_names(columns)
+
+
+def unique_column_names(columns: List[Dict[str, str]]) -> List[Dict[str, str]]:
+    """Columns with repeated titles renamed "Title (2)", "Title (3)"..., so names can key a table."""
+    seen = set()
+    renamed = []
+    for column in columns:
+        name, n = column["name"], 1
+        while name in seen:
+            n += 1
+            name = f"{column['name']} ({n})"
+        seen.add(name)
+        renamed.append(column if name == column["name"] else dict(column, name=name))
+    return renamed
+
+
+def cell_values(matrix: List[List[Dict[str, Any]]], columns: List[Dict[str, str]]) -> List[List[Any]]:
+    """qMatrix rows -> plain values: qText for dimensions, qNum (None when NaN) for measures."""
+    rows = []
+    for q_row in matrix:
+        row = []
+        for cell, column in zip(q_row, columns):
+            if column["type"] == "float64":
+                num = cell.get("qNum")
+                row.append(float(num) if isinstance(num, (int, float)) and not math.isnan(num) else None)
+            else:
+                row.append(cell.get("qText"))
+        rows.append(row)
+    return rows
+
+
+class ExportWriter(ABC):
+    """
+    Writes rows to a file on local disk, one chunk at a time.
+
+    Rows go to "<path>.partial" and the file is renamed into place by close(),
+    so a half-written export is never mistaken for a complete one.
+    """
+
+    def __init__(self, path: str, columns: List[Dict[str, str]]):
+        self.path = path
+        self.partial_path = path + ".partial"
+        self.columns = columns
+        self.rows = 0
+
+    @abstractmethod
+    def write_rows(self, rows: List[List[Any]]):
+        pass
+
+    @abstractmethod
+    def _finish(self):
+        """Flush and close the partial file (safe to call twice)."""
+
+    def close(self):
+        self._finish()
+        os.replace(self.partial_path, self.path)
+
+    def abort(self):
+        try:
+            self._finish()
+        finally:
+            if os.path.exists(self.partial_path):
+                os.remove(self.partial_path)
+
+
+class CsvExportWriter(ExportWriter):
+    def __init__(self, path: str, columns: List[Dict[str, str]]):
+        super().__init__(path, columns)
+        self._file = open(self.partial_path, "w", newline="", encoding="utf-8")
+        self._csv = csv.writer(self._file)
+        self._csv.writerow([c["name"] for c in columns])
+
+    def write_rows(self, rows: List[List[Any]]):
+        self._csv.writerows(rows)
+        self.rows += len(rows)
+
+    def _finish(self):
+        if not self._file.closed:
+            self._file.close()
+
+
+class _ArrowExportWriter(ExportWriter):
+    def __init__(self, path: str, columns: List[Dict[str, str]]):
+        super().__init__(path, columns)
+        self.schema = pa.schema([(c["name"], pa.float64() if c["type"] == "float64" else pa.string()) for c in columns])
+
+    def _batch(self, rows: List[List[Any]]) -> "pa.RecordBatch":
+        arrays = [pa.array([row[i] for row in rows], type=field.type) for i, field in enumerate(self.schema)]
+        return pa.RecordBatch.from_arrays(arrays, schema=self.schema)
+
+
+class ArrowExportWriter(_ArrowExportWriter):
+    """Arrow IPC file format; one record batch per hypercube page."""
+
+    def __init__(self, path: str, columns: List[Dict[str, str]]):
+        super().__init__(path, columns)
+        self._writer = pa_ipc.new_file(self.partial_path, self.schema)
+
+    def write_rows(self, rows: List[List[Any]]):
+        if rows:
+            self._writer.write_batch(self._batch(rows))
+            self.rows += len(rows)
+
+    def _finish(self):
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+
+
+class ParquetExportWriter(_ArrowExportWriter):
+    """Parquet (zstd); pages are buffered up to MCP_EXPORT_PARQUET_ROW_GROUP rows per row group."""
+
+    def __init__(self, path: str, columns: List[Dict[str, str]]):
+        super().__init__(path, columns)
+        self.row_group_rows = int(os.getenv("MCP_EXPORT_PARQUET_ROW_GROUP", "65536"))
+        self._writer = pq.ParquetWriter(self.partial_path, self.schema, compression="zstd")
+        self._pending: List[List[Any]] = []
+
+    def write_rows(self, rows: List[List[Any]]):
+        self._pending.extend(rows)
+        self.rows += len(rows)
+        if len(self._pending) >= self.row_group_rows:
+            self._flush()
+
+    def _flush(self):
+        if self._pending:
+            self._writer.write_batch(self._batch(self._pending))
+            self._pending = []
+
+    def _finish(self):
+        if self._writer is not None:
+            self._flush()
+            self._writer.close()
+            self._writer = None
+
+
+_WRITERS = {"csv": CsvExportWriter, "arrow": ArrowExportWriter, "parquet": ParquetExportWriter}
+
+
+def export_path(export_dir: str, name: str, fmt: str) -> str:
+    """Unique file name under export_dir for an export of `name` (an object id)."""
+    safe = re.sub(r"[^A-Za-z0-9_-]+", "_", name).strip("_")[:64] or "export"
+    stamp = time.strftime("%Y%m%dT%H%M%S", time.gmtime())
+    return os.path.join(export_dir, f"{safe}-{stamp}-{uuid.uuid4().hex[:8]}.{EXTENSIONS[fmt]}")
+
+
+def open_export_writer(fmt: str, path: str, columns: List[Dict[str, str]]) -> ExportWriter:
+    if fmt not in FORMATS:
+        raise ValueError(f"Unsupported export format: {fmt} (use one of {', '.join(FORMATS)})")
+    if fmt != "csv" and pa is None:
+        raise ValueError(f"Format '{fmt}' requires pyarrow on the MCP server (pip install pyarrow); use format=csv.")
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    return _WRITERS[fmt](path, columns)
+
+
+def available_formats() -> List[str]:
+    return list(FORMATS) if pa is not None else ["csv"]
+
+
+def cleanup_exports(export_dir: str, max_age: float, max_bytes: int) -> int:
+    """
+    Delete exports older than max_age seconds, then the oldest ones until the
+    directory holds at most max_bytes (0 disables either limit). Partial files
+    of exports still being written only go by age. Returns how many were removed.
+    """
+    now = time.time()
+    files = []
+    removed = 0
+    try:
+        entries = list(os.scandir(export_dir))
+    except FileNotFoundError:
+        return 0
+    for entry in entries:
+        try:
+            if not entry.is_file():
+                continue
+            stat = entry.stat()
+        except OSError:
+            continue
+        if max_age > 0 and now - stat.st_mtime > max_age:
+            removed += _remove(entry.path)
+        elif not entry.name.endswith(".partial"):
+            files.append((stat.st_mtime, stat.st_size, entry.path))
+    if max_bytes > 0:
+        total = sum(size for _, size, _ in files)
+        for _, size, path in sorted(files):
+            if total <= max_bytes:
+                break
+            removed += _remove(path)
+            total -= size
+    return removed
+
+
+def _remove(path: str) -> int:
+    try:
+        os.remove(path)
+        return 1
+    except OSError:
+        return 0
+
+
+def file_size(path: str) -> Optional[int]:
+    try:
+        return os.path.getsize(path)
+    except OSError:
+        return None
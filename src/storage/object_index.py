@@ -0,0 +1,209 @@
+import aiosqlite
+import asyncio
+import logging
+import os
+import re
+import time
+from typing import Any, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Colunas pesquisáveis e o peso de cada uma no bm25 (título do objeto pesa mais)
+SEARCH_COLUMNS = ("object_type", "app_name", "sheet_title", "title", "dimensions", "measures")
+SEARCH_WEIGHTS = (1.0, 2.0, 3.0, 10.0, 5.0, 5.0)
+_TOKEN = re.compile(r"\w+", re.UNICODE)
+
+
+def match_expression(query: str) -> Optional[str]:
+    """FTS5 query for free text: every word as a prefix, any word may match (bm25 ranks rows matching more)."""
+    tokens = _TOKEN.findall(query or "")
+    if not tokens:
+        return None
+    return " OR ".join(f'"{token}"*' for token in tokens)
+
+
+class ObjectIndex:
+    """
+    Persistent search index of sheets and objects (charts, tables, KPIs...) of the
+    apps each user can open, kept in a local SQLite file with FTS5.
+
+    Rows are scoped by owner (the Qlik user id): a user only ever finds objects of
+    apps their own token listed and opened, including private sheets. Each indexed
+    app keeps its items API updatedAt so crawls only re-read apps that changed.
+    Owners not crawled for a while are dropped with purge_owners().
+    Accents are folded (unicode61 remove_diacritics), so "preco" finds "Preço".
+    """
+
+    def __init__(self, db_path: Optional[str] = None):
+        self.db_path = db_path or os.getenv("MCP_OBJECT_INDEX_PATH", "object_index.db")
+        self._db: Optional[aiosqlite.Connection] = None
+        self._init_lock = asyncio.Lock()
+
+    async def _connection(self) -> aiosqlite.Connection:
+        if self._db is not None:
+            return self._db
+        async with self._init_lock:
+            if self._db is None:
+                db = await aiosqlite.connect(self.db_path)
+                await db.execute("PRAGMA journal_mode=WAL")
+                await db.execute("PRAGMA synchronous=NORMAL")
+                await db.execute("PRAGMA busy_timeout=5000")
+                await db.execute("""
+                    CREATE TABLE IF NOT EXISTS indexed_apps (
+                        owner TEXT NOT NULL,
+                        app_id TEXT NOT NULL,
+                        app_name TEXT,
+                        updated_at TEXT,
+                        indexed_at REAL NOT NULL,
+                        object_count INTEGER NOT NULL DEFAULT 0,
+                        error TEXT,
+                        PRIMARY KEY (owner, app_id)
+                    )
+                """)
+                await db.execute("""
+                    CREATE TABLE IF NOT EXISTS indexed_owners (
+                        owner TEXT PRIMARY KEY,
+                        seen_at REAL NOT NULL
+                    )
+                """)
+                await db.execute(f"""
+                    CREATE VIRTUAL TABLE IF NOT EXISTS indexed_objects USING fts5(
+                        owner UNINDEXED, app_id UNINDEXED, sheet_id UNINDEXED, object_id UNINDEXED,
+                        {", ".join(SEARCH_COLUMNS)},
+                        tokenize = 'unicode61 remove_diacritics 2'
+                    )
+                """)
+                await db.commit()
+                self._db = db
+        return self._db
+
+    async def app_markers(self, owner: str) -> Dict[str, Optional[str]]:
+        """app_id -> updatedAt recorded when the app was last indexed for this owner."""
+        db = await self._connection()
+        async with db.execute("SELECT app_id, updated_at FROM indexed_apps WHERE owner = ?", (owner,)) as cursor:
+            return {app_id: updated_at for app_id, updated_at in await cursor.fetchall()}
+
+    async def replace_app(self, owner: str, app_id: str, app_name: str, updated_at: Optional[str],
+                          objects: List[Dict[str, Any]], error: Optional[str] = None):
+        """Swap everything indexed for one app in a single transaction (searches never see half an app)."""
+        db = await self._connection()
+        await db.execute("DELETE FROM indexed_objects WHERE owner = ? AND app_id = ?", (owner, app_id))
+        await db.executemany(
+            f"INSERT INTO indexed_objects (owner, app_id, sheet_id, object_id, {', '.join(SEARCH_COLUMNS)}) "
+            f"VALUES (?, ?, ?, ?, {', '.join('?' for _ in SEARCH_COLUMNS)})",
+            [
+                (owner, app_id, o.get("sheet_id"), o["object_id"], o.get("object_type"), app_name,
+                 o.get("sheet_title"), o.get("title"), " | ".join(o.get("dimensions") or ()),
+                 " | ".join(o.get("measures") or ()))
+                for o in objects
+            ],
+        )
+        await db.execute(
+            "INSERT OR REPLACE INTO indexed_apps (owner, app_id, app_name, updated_at, indexed_at, object_count, error) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (owner, app_id, app_name, updated_at, time.time(), len(objects), error),
+        )
+        await db.commit()
+
+    async def remove_apps(self, owner: str, app_ids: List[str]):
+        """Forget apps the owner can no longer list (deleted, or access removed)."""
+        if not app_ids:
+            return
+        db = await self._connection()
+        for app_id in app_ids:
+            await db.execute("DELETE FROM indexed_objects WHERE owner = ? AND app_id = ?", (owner, app_id))
+            await db.execute("DELETE FROM indexed_apps WHERE owner = ? AND app_id = ?", (owner, app_id))
+        await db.commit()
+
+    async def touch_owner(self, owner: str):
+        """Record that the owner's index is in use (called on every crawl)."""
+        db = await self._connection()
+        await db.execute("INSERT OR REPLACE INTO indexed_owners (owner, seen_at) VALUES (?, ?)", (owner, time.time()))
+        await db.commit()
+
+    async def purge_owners(self, seen_before: float) -> int:
+        """Drop everything indexed for owners not crawled since seen_before (or never recorded); returns how many."""
+        db = await self._connection()
+        async with db.execute(
+            "SELECT DISTINCT owner FROM indexed_apps WHERE owner NOT IN "
+            "(SELECT owner FROM indexed_owners WHERE seen_at >= ?)",
+            (seen_before,),
+        ) as cursor:
+            owners = [row[0] for row in await cursor.fetchall()]
+        for owner in owners:
+            await db.execute("DELETE FROM indexed_objects WHERE owner = ?", (owner,))
+            await db.execute("DELETE FROM indexed_apps WHERE owner = ?", (owner,))
+        await db.execute("DELETE FROM indexed_owners WHERE seen_at < ?", (seen_before,))
+        await db.commit()
+        return len(owners)
+
+    async def search(self, owner: str, query: str, app_id: Optional[str] = None,
+                     object_type: Optional[str] = None, limit: int = 20) -> List[Dict[str, Any]]:
+        """Best matches first (bm25 over titles, dimension/measure labels, sheet and app names)."""
+        expression = match_expression(query)
+        if expression is None:
+            return []
+        sql = (
+            "SELECT app_id, app_name, sheet_id, sheet_title, object_id, object_type, title, dimensions, measures, "
+            f"bm25(indexed_objects, 0, 0, 0, 0, {', '.join(str(w) for w in SEARCH_WEIGHTS)}) AS rank "
+            "FROM indexed_objects WHERE indexed_objects MATCH ? AND owner = ?"
+        )
+        params: List[Any] = [expression, owner]
+        if app_id:
+            sql += " AND app_id = ?"
+            params.append(app_id)
+        if object_type:
+            sql += " AND object_type = ?"
+            params.append(object_type)
+        sql += " ORDER BY rank LIMIT ?"
+        params.append(limit)
+        db = await self._connection()
+        async with db.execute(sql, params) as cursor:
+            rows = await cursor.fetchall()
+        return [
+            {
+                "appId": row[0],
+                "appName": row[1],
+                "sheetId": row[2],
+                "sheetTitle": row[3],
+                "objectId": row[4],
+                "type": row[5],
+                "title": row[6],
+                "dimensions": row[7].split(" | ") if row[7] else [],
+                "measures": row[8].split(" | ") if row[8] else [],
+                "score": round(-row[9], 3),
+            }
+            for row in rows
+        ]
+
+    async def stats(self, owner: str) -> Dict[str, Any]:
+        db = await self._connection()
+        async with db.execute(
+            "SELECT COUNT(*), COALESCE(SUM(object_count), 0), MIN(indexed_at), MAX(indexed_at), "
+            "SUM(CASE WHEN error IS NULL THEN 0 ELSE 1 END) FROM indexed_apps WHERE owner = ?",
+            (owner,),
+        ) as cursor:
+            apps, objects, oldest, newest, failed = await cursor.fetchone()
+        return {
+            "apps": apps,
+            "objects": objects,
+            "failed_apps": failed or 0,
+            "oldest_seconds": round(time.time() - oldest, 1) if oldest else None,
+            "newest_seconds": round(time.time() - newest, 1) if newest else None,
+        }
+
+    async def close(self):
+        if self._db is not None:
+            await self._db.close()
+            self._db = None
+
+
+_object_index: Optional[ObjectIndex] = None
+
+
+def get_object_index() -> ObjectIndex:
+    """Process-wide ObjectIndex."""
+    global _object_index
+    if _object_index is None:
+        _object_index = ObjectIndex()
+    return _object_index
@@ -0,0 +1,162 @@
+import asyncio
+import logging
+import os
+from typing import Any, List, Optional, Sequence, Tuple
+from urllib.parse import unquote, urlsplit
+
+logger = logging.getLogger(__name__)
+
+
+class RedisError(Exception):
+    """Error reply from the server, or a protocol/connection failure."""
+
+
+# EVAL: apaga KEYS[1] só se ainda tem o valor ARGV[1] (GET + DEL atômicos no servidor)
+COMPARE_AND_DELETE_SCRIPT = (
+    'if redis.call("GET", KEYS[1]) == ARGV[1] then return redis.call("DEL", KEYS[1]) else return 0 end'
+)
+
+
+def parse_redis_url(url: str) -> Tuple[str, int, Optional[str], Optional[str], int]:
+    """redis://[user:password@]host[:port][/db] -> (host, port, username, password, db)."""
+    parts = urlsplit(url)
+    if parts.scheme not in ("redis", ""):
+        raise ValueError(f"Unsupported Redis URL scheme: {parts.scheme} (only redis:// is supported)")
+    db = int(parts.path.lstrip("/") or 0) if parts.path not in ("", "/") else 0
+    return (
+        parts.hostname or "localhost",
+        parts.port or 6379,
+        unquote(parts.username) if parts.username else None,
+        unquote(parts.password) if parts.password else None,
+        db,
+    )
+
+
+def _encode(args: Sequence[Any]) -> bytes:
+    out = [b"*%d\r\n" % len(args)]
+    for arg in args:
+        if isinstance(arg, bytes):
+            data = arg
+        elif isinstance(arg, float):
+            data = repr(arg).encode()
+        else:
+            data = str(arg).encode("utf-8")
+        out.append(b"$%d\r\n%s\r\n" % (len(data), data))
+    return b"".join(out)
+
+
+class _Connection:
+    def __init__(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self.reader = reader
+        self.writer = writer
+
+    async def _read_reply(self) -> Any:
+        line = await self.reader.readline()
+        if not line:
+            raise RedisError("connection closed by server")
+        kind, payload = line[:1], line[1:-2]
+        if kind == b"+":
+            return payload.decode("utf-8")
+        if kind == b"-":
+            return RedisError(payload.decode("utf-8"))
+        if kind == b":":
+            return int(payload)
+        if kind == b"$":
+            length = int(payload)
+            if length == -1:
+                return None
+            data = await self.reader.readexactly(length + 2)
+            return data[:-2].decode("utf-8")
+        if kind == b"*":
+            length = int(payload)
+            if length == -1:
+                return None
+            return [await self._read_reply() for _ in range(length)]
+        raise RedisError(f"unexpected reply type {kind!r}")
+
+    async def execute_many(self, commands: Sequence[Sequence[Any]]) -> List[Any]:
+        # Pipeline: todos os comandos num único write, depois as respostas na ordem
+        self.writer.write(b"".join(_encode(c) for c in commands))
+        await self.writer.drain()
+        return [await self._read_reply() for _ in commands]
+
+    def close(self):
+        self.writer.close()
+
+
+class RedisClient:
+    """
+    Minimal asyncio Redis client (RESP2) with a connection pool and pipelining.
+
+    Covers what the storage backends need (strings, sets, hashes, sorted sets);
+    replies are decoded as UTF-8 strings. Configured by MCP_REDIS_URL
+    (redis://[:password@]host:port/db) and MCP_REDIS_POOL_SIZE.
+    """
+
+    def __init__(self, url: Optional[str] = None, pool_size: Optional[int] = None, timeout: float = 5.0):
+        self.url = url or os.getenv("MCP_REDIS_URL", "redis://localhost:6379/0")
+        self.host, self.port, self.username, self.password, self.db = parse_redis_url(self.url)
+        self.pool_size = pool_size or int(os.getenv("MCP_REDIS_POOL_SIZE", "10"))
+        self.timeout = timeout
+        self._idle: List[_Connection] = []
+        self._slots = asyncio.Semaphore(self.pool_size)
+
+    async def _connect(self) -> _Connection:
+        reader, writer = await asyncio.wait_for(asyncio.open_connection(self.host, self.port), self.timeout)
+        conn = _Connection(reader, writer)
+        setup = []
+        if self.password:
+            setup.append(("AUTH", self.username, self.password) if self.username else ("AUTH", self.password))
+        if self.db:
+            setup.append(("SELECT", self.db))
+        if setup:
+            for reply in await conn.execute_many(setup):
+                if isinstance(reply, RedisError):
+                    conn.close()
+                    raise reply
+        return conn
+
+    async def pipeline(self, commands: Sequence[Sequence[Any]], raise_on_error: bool = True) -> List[Any]:
+        """Send several commands in one round trip; returns their replies in order."""
+        if not commands:
+            return []
+        async with self._slots:
+            conn = self._idle.pop() if self._idle else await self._connect()
+            try:
+                replies = await asyncio.wait_for(conn.execute_many(commands), self.timeout)
+            except BaseException:
+                # Estado do protocolo desconhecido (timeout/cancelamento no meio da leitura): descarta a conexão
+                conn.close()
+                raise
+            self._idle.append(conn)
+        if raise_on_error:
+            for reply in replies:
+                if isinstance(reply, RedisError):
+                    raise reply
+        return replies
+
+    async def execute(self, *args: Any) -> Any:
+        return (await self.pipeline([args]))[0]
+
+    async def close(self):
+        while self._idle:
+            self._idle.pop().close()
+
+
+_redis_client: Optional[RedisClient] = None
+
+
+def get_redis_client() -> RedisClient:
+    """Process-wide pooled client for MCP_REDIS_URL."""
+    global _redis_client
+    if _redis_client is None:
+        _redis_client = RedisClient()
+    return _redis_client
+
+
+def storage_backend() -> str:
+    """MCP_STORAGE_BACKEND: sqlite (default, local files) or redis (shared by every node)."""
+    backend = os.getenv("MCP_STORAGE_BACKEND", "sqlite").strip().lower()
+    if backend not in ("sqlite", "redis"):
+        raise ValueError(f"Unsupported MCP_STORAGE_BACKEND: {backend} (use sqlite or redis)")
+    return backend
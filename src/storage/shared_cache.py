@@ -0,0 +1,243 @@
+import aiosqlite
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import time
+from abc import ABC, abstractmethod
+from typing import Any, Optional
+from src.observability.metrics import CACHE_REQUESTS
+from src.storage.redis_client import RedisClient, get_redis_client, storage_backend
+
+logger = logging.getLogger(__name__)
+
+
+def cache_key(namespace: str, *parts: Any) -> str:
+    """Build a compact cache key: namespace + hash of the (JSON-serialisable) parts."""
+    digest = hashlib.sha256(json.dumps(parts, sort_keys=True, default=str).encode("utf-8")).hexdigest()[:32]
+    return f"{namespace}:{digest}"
+
+
+class BaseSharedCache(ABC):
+    """
+    Key/value cache shared between processes, with a TTL and an optional tag
+    per entry (MCP_CACHE_ENABLED=false turns it off). get_shared_cache() picks
+    the backend.
+    """
+
+    def __init__(self):
+        self.enabled = os.getenv("MCP_CACHE_ENABLED", "true").strip().lower() not in ("0", "false", "no", "off")
+
+    @abstractmethod
+    async def get(self, key: str) -> Optional[Any]:
+        pass
+
+    @abstractmethod
+    async def set(self, key: str, value: Any, ttl: float, tag: Optional[str] = None):
+        pass
+
+    @abstractmethod
+    async def delete_tag(self, tag: str) -> int:
+        """Drop every entry tagged with tag (e.g. all cached data of one app). Returns the number removed."""
+
+    async def purge_expired(self):
+        """Drop expired entries; a no-op for backends that expire them on their own."""
+
+    @abstractmethod
+    async def close(self):
+        pass
+
+
+class SharedCache(BaseSharedCache):
+    """
+    Cross-process key/value cache backed by a local SQLite file in WAL mode.
+
+    All uvicorn workers on the same host open the same file, so app catalogs,
+    item id -> resourceId resolution and hypercube results fetched by one worker
+    are reused by the others. Entries carry a TTL and an optional tag (the app id)
+    so everything derived from one app can be invalidated at once.
+
+    Cache failures never fail a request: errors are logged and treated as a miss.
+    """
+    PURGE_EVERY_WRITES = 500
+
+    def __init__(self, db_path: Optional[str] = None):
+        super().__init__()
+        self.db_path = db_path or os.getenv("MCP_CACHE_DB_PATH", "cache.db")
+        self._db: Optional[aiosqlite.Connection] = None
+        self._init_lock = asyncio.Lock()
+        self._writes = 0
+
+    async def _connection(self) -> aiosqlite.Connection:
+        if self._db is not None:
+            return self._db
+        async with self._init_lock:
+            if self._db is None:
+                db = await aiosqlite.connect(self.db_path)
+                # WAL: leitores de outros workers não bloqueiam a escrita
+                await db.execute("PRAGMA journal_mode=WAL")
+                await db.execute("PRAGMA synchronous=NORMAL")
+                await db.execute("PRAGMA busy_timeout=5000")
+                await db.execute("""
+                    CREATE TABLE IF NOT EXISTS cache_entries (
+                        key TEXT PRIMARY KEY,
+                        tag TEXT,
+                        value TEXT NOT NULL,
+                        expires_at REAL NOT NULL
+                    )
+                """)
+                await db.execute("CREATE INDEX IF NOT EXISTS idx_cache_entries_tag ON cache_entries(tag)")
+                await db.execute("CREATE INDEX IF NOT EXISTS idx_cache_entries_expires_at ON cache_entries(expires_at)")
+                await db.commit()
+                self._db = db
+        return self._db
+
+    async def get(self, key: str) -> Optional[Any]:
+        if not self.enabled:
+            return None
+        try:
+            db = await self._connection()
+            async with db.execute(
+                "SELECT value FROM cache_entries WHERE key = ? AND expires_at > ?", (key, time.time())
+            ) as cursor:
+                row = await cursor.fetchone()
+            CACHE_REQUESTS.inc(cache=key.split(":", 1)[0], result="hit" if row else "miss")
+            return json.loads(row[0]) if row else None
+        except Exception as e:
+            logger.warning("Shared cache read failed for %s: %s", key, e)
+            return None
+
+    async def set(self, key: str, value: Any, ttl: float, tag: Optional[str] = None):
+        if not self.enabled or ttl <= 0:
+            return
+        try:
+            db = await self._connection()
+            await db.execute(
+                "INSERT OR REPLACE INTO cache_entries (key, tag, value, expires_at) VALUES (?, ?, ?, ?)",
+                (key, tag, json.dumps(value, separators=(",", ":")), time.time() + ttl),
+            )
+            await db.commit()
+            self._writes += 1
+            if self._writes % self.PURGE_EVERY_WRITES == 0:
+                await self.purge_expired()
+        except Exception as e:
+            logger.warning("Shared cache write failed for %s: %s", key, e)
+
+    async def delete_tag(self, tag: str) -> int:
+        if not self.enabled:
+            return 0
+        try:
+            db = await self._connection()
+            cursor = await db.execute("DELETE FROM cache_entries WHERE tag = ?", (tag,))
+            await db.commit()
+            return cursor.rowcount
+        except Exception as e:
+            logger.warning("Shared cache invalidation failed for tag %s: %s", tag, e)
+            return 0
+
+    async def purge_expired(self):
+        db = await self._connection()
+        await db.execute("DELETE FROM cache_entries WHERE expires_at <= ?", (time.time(),))
+        await db.commit()
+
+    async def close(self):
+        if self._db is not None:
+            await self._db.close()
+            self._db = None
+
+
+class RedisSharedCache(BaseSharedCache):
+    """
+    SharedCache on Redis (MCP_STORAGE_BACKEND=redis): shared by every node behind
+    the load balancer, not only by the workers of one host.
+
+    Entries are strings with a TTL (SET ... PX); each tag is a set of the keys
+    carrying it, so delete_tag is one SMEMBERS plus one pipelined DEL. The tag
+    set's TTL follows its longest entry: PEXPIRE NX/GT on Redis >= 7 (checked
+    once with INFO), PTTL then PEXPIRE on older servers.
+    """
+    PREFIX = "mcp:cache:"
+
+    def __init__(self, client: Optional[RedisClient] = None):
+        super().__init__()
+        self.client = client or get_redis_client()
+        self._expire_flags: Optional[bool] = None
+
+    async def _supports_expire_flags(self) -> bool:
+        """Whether the server takes PEXPIRE NX/GT (Redis 7.0+)."""
+        if self._expire_flags is None:
+            try:
+                info = await self.client.execute("INFO", "server") or ""
+                version = next((line.split(":", 1)[1].strip() for line in info.splitlines() if line.startswith("redis_version:")), "")
+                self._expire_flags = int(version.split(".", 1)[0] or 0) >= 7
+            except Exception as e:
+                # INFO indisponível (ex.: bloqueado no Redis gerenciado): usa o caminho compatível
+                logger.info("Could not read the Redis version (%s); tracking tag TTLs without PEXPIRE NX/GT", e)
+                self._expire_flags = False
+            logger.info("Redis PEXPIRE NX/GT %s", "available" if self._expire_flags else "unavailable (Redis < 7)")
+        return self._expire_flags
+
+    def _tag_key(self, tag: str) -> str:
+        return f"{self.PREFIX}tag:{tag}"
+
+    async def get(self, key: str) -> Optional[Any]:
+        if not self.enabled:
+            return None
+        try:
+            value = await self.client.execute("GET", self.PREFIX + key)
+            CACHE_REQUESTS.inc(cache=key.split(":", 1)[0], result="hit" if value is not None else "miss")
+            return json.loads(value) if value is not None else None
+        except Exception as e:
+            logger.warning("Shared cache read failed for %s: %s", key, e)
+            return None
+
+    async def set(self, key: str, value: Any, ttl: float, tag: Optional[str] = None):
+        if not self.enabled or ttl <= 0:
+            return
+        ttl_ms = max(1, int(ttl * 1000))
+        commands = [("SET", self.PREFIX + key, json.dumps(value, separators=(",", ":")), "PX", ttl_ms)]
+        try:
+            if not tag:
+                await self.client.pipeline(commands)
+                return
+            tag_key = self._tag_key(tag)
+            # O set da tag vive pelo menos tanto quanto a entrada mais longa
+            if await self._supports_expire_flags():
+                # NX cria o TTL, GT só estende
+                await self.client.pipeline(commands + [
+                    ("SADD", tag_key, key), ("PEXPIRE", tag_key, ttl_ms, "NX"), ("PEXPIRE", tag_key, ttl_ms, "GT"),
+                ])
+                return
+            # Redis < 7: lê o TTL atual e só estende (-1 sem TTL / -2 inexistente também recebem)
+            replies = await self.client.pipeline(commands + [("SADD", tag_key, key), ("PTTL", tag_key)])
+            if replies[-1] < ttl_ms:
+                await self.client.execute("PEXPIRE", tag_key, ttl_ms)
+        except Exception as e:
+            logger.warning("Shared cache write failed for %s: %s", key, e)
+
+    async def delete_tag(self, tag: str) -> int:
+        if not self.enabled:
+            return 0
+        try:
+            tag_key = self._tag_key(tag)
+            members = await self.client.execute("SMEMBERS", tag_key) or []
+            replies = await self.client.pipeline([("DEL", *[self.PREFIX + m for m in members], tag_key)] if members else [("DEL", tag_key)])
+            return max(0, replies[0] - 1) if members else 0
+        except Exception as e:
+            logger.warning("Shared cache invalidation failed for tag %s: %s", tag, e)
+            return 0
+
+    async def close(self):
+        await self.client.close()
+
+
+_shared_cache: Optional[BaseSharedCache] = None
+
+
+def get_shared_cache() -> BaseSharedCache:
+    """Process-wide shared cache: SQLite (one connection per worker) or Redis, per MCP_STORAGE_BACKEND."""
+    global _shared_cache
+    if _shared_cache is None:
+        _shared_cache = RedisSharedCache() if storage_backend() == "redis" else SharedCache()
+    return _shared_cache
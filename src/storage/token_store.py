@@ -1,81 +1,328 @@
 import aiosqlite
+import asyncio
 import json
 import os
+import time
+import uuid
+from collections import OrderedDict
 from datetime import datetime, timedelta
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, List, Tuple
+from src.observability.metrics import CACHE_REQUESTS
+from src.storage.redis_client import COMPARE_AND_DELETE_SCRIPT, RedisClient, get_redis_client, storage_backend
+
+
+def _now() -> float:
+    # Mesma convenção dos registros já gravados (utcnow().timestamp())
+    return datetime.utcnow().timestamp()
+
 
 class TokenStore:
+    """
+    Qlik OAuth tokens per user, in SQLite.
+
+    One connection is kept open (WAL, synchronous=NORMAL) instead of opening the
+    file on every call, and hot users' tokens are served from an in-memory
+    write-through cache (TOKEN_CACHE_MAX_USERS entries). Cached entries are
+    re-read after TOKEN_CACHE_TTL_SECONDS so updates made by other workers on
+    the same file are picked up.
+
+    Persistence goes through _store/_load/_update/_expiring/_delete, so other
+    backends (RedisTokenStore) keep the same caching behaviour.
+    """
+
     def __init__(self):
         db_path = os.getenv("TOKEN_DB_PATH", "tokens.db")
         self.db_path = db_path
-    
+        self.cache_max_users = int(os.getenv("TOKEN_CACHE_MAX_USERS", "1000"))
+        self.cache_ttl = float(os.getenv("TOKEN_CACHE_TTL_SECONDS", "30"))
+        self._db: Optional[aiosqlite.Connection] = None
+        self._init_lock = asyncio.Lock()
+        # user_id -> (tokens ou None se não existe, lido em time.monotonic())
+        self._cache: "OrderedDict[str, Tuple[Optional[Dict[str, Any]], float]]" = OrderedDict()
+
+    async def _connection(self) -> aiosqlite.Connection:
+        if self._db is not None:
+            return self._db
+        async with self._init_lock:
+            if self._db is None:
+                db = await aiosqlite.connect(self.db_path)
+                db.row_factory = aiosqlite.Row
+                await db.execute("PRAGMA journal_mode=WAL")
+                await db.execute("PRAGMA synchronous=NORMAL")
+                await db.execute("PRAGMA busy_timeout=5000")
+                await db.execute("PRAGMA temp_store=MEMORY")
+                await db.execute("""
+                    CREATE TABLE IF NOT EXISTS qlik_tokens (
+                        user_id TEXT PRIMARY KEY,
+                        refresh_token TEXT NOT NULL,
+                        access_token TEXT,
+                        expires_at REAL,
+                        created_at REAL NOT NULL,
+                        updated_at REAL NOT NULL
+                    )
+                """)
+                await db.execute("CREATE INDEX IF NOT EXISTS idx_qlik_tokens_expires_at ON qlik_tokens(expires_at)")
+                await db.execute("""
+                    CREATE TABLE IF NOT EXISTS refresh_leases (
+                        user_id TEXT PRIMARY KEY,
+                        holder TEXT NOT NULL,
+                        expires_at REAL NOT NULL
+                    )
+                """)
+                await db.execute("""
+                    CREATE TABLE IF NOT EXISTS refresh_failures (
+                        user_id TEXT PRIMARY KEY,
+                        retry_at REAL NOT NULL
+                    )
+                """)
+                await db.commit()
+                self._db = db
+        return self._db
+
     async def initialize(self):
-        async with aiosqlite.connect(self.db_path) as db:
-            await db.execute("""
-                CREATE TABLE IF NOT EXISTS qlik_tokens (
-                    user_id TEXT PRIMARY KEY,
-                    refresh_token TEXT NOT NULL,
-                    access_token TEXT,
-                    expires_at REAL,
-                    created_at REAL NOT NULL,
-                    updated_at REAL NOT NULL
-                )
-            """)
-            await db.commit()
-    
+        await self._connection()
+
     async def close(self):
-        pass
-    
+        if self._db is not None:
+            await self._db.close()
+            self._db = None
+        self._cache.clear()
+
+    def _cache_put(self, user_id: str, tokens: Optional[Dict[str, Any]]):
+        self._cache[user_id] = (tokens, time.monotonic())
+        self._cache.move_to_end(user_id)
+        while len(self._cache) > self.cache_max_users:
+            self._cache.popitem(last=False)
+
     async def save_tokens(self, user_id: str, refresh_token: str, access_token: Optional[str] = None, expires_in: Optional[int] = None):
-        now = datetime.utcnow().timestamp()
+        now = _now()
         expires_at = None
         if expires_in:
             expires_at = (datetime.utcnow() + timedelta(seconds=expires_in)).timestamp()
-        
-        async with aiosqlite.connect(self.db_path) as db:
-            await db.execute("""
-                INSERT OR REPLACE INTO qlik_tokens 
-                (user_id, refresh_token, access_token, expires_at, created_at, updated_at)
-                VALUES (?, ?, ?, ?, ?, ?)
-            """, (user_id, refresh_token, access_token, expires_at, now, now))
-            await db.commit()
-    
-    async def get_tokens(self, user_id: str) -> Optional[Dict[str, Any]]:
-        async with aiosqlite.connect(self.db_path) as db:
-            db.row_factory = aiosqlite.Row
-            async with db.execute("""
-                SELECT refresh_token, access_token, expires_at 
-                FROM qlik_tokens 
-                WHERE user_id = ?
-            """, (user_id,)) as cursor:
-                row = await cursor.fetchone()
-                if row:
-                    return {
-                        "refresh_token": row["refresh_token"],
-                        "access_token": row["access_token"],
-                        "expires_at": row["expires_at"]
-                    }
-                return None
-    
+
+        await self._store(user_id, refresh_token, access_token, expires_at, now)
+        self._cache_put(user_id, {"refresh_token": refresh_token, "access_token": access_token, "expires_at": expires_at})
+
+    async def get_tokens(self, user_id: str, cached: bool = True) -> Optional[Dict[str, Any]]:
+        """The user's tokens; cached=False skips the in-memory cache (to see other workers' writes now)."""
+        entry = self._cache.get(user_id)
+        if cached and entry is not None and time.monotonic() - entry[1] < self.cache_ttl:
+            self._cache.move_to_end(user_id)
+            CACHE_REQUESTS.inc(cache="tokens", result="hit")
+            return dict(entry[0]) if entry[0] is not None else None
+        CACHE_REQUESTS.inc(cache="tokens", result="miss")
+
+        tokens = await self._load(user_id)
+        self._cache_put(user_id, tokens)
+        return dict(tokens) if tokens is not None else None
+
     async def update_access_token(self, user_id: str, access_token: str, expires_in: int):
-        now = datetime.utcnow().timestamp()
+        now = _now()
         expires_at = (datetime.utcnow() + timedelta(seconds=expires_in)).timestamp()
-        
-        async with aiosqlite.connect(self.db_path) as db:
-            await db.execute("""
-                UPDATE qlik_tokens 
-                SET access_token = ?, expires_at = ?, updated_at = ?
-                WHERE user_id = ?
-            """, (access_token, expires_at, now, user_id))
-            await db.commit()
-    
+
+        updated = await self._update(user_id, access_token, expires_at, now)
+        entry = self._cache.get(user_id)
+        if updated and entry is not None and entry[0] is not None:
+            self._cache_put(user_id, dict(entry[0], access_token=access_token, expires_at=expires_at))
+        else:
+            # Sem entrada completa em memória: a próxima leitura vem do banco
+            self._cache.pop(user_id, None)
+
+    async def get_expiring(self, before: float, limit: int = 100) -> List[str]:
+        """Users whose access token expires before the given timestamp (soonest first), minus deferred ones."""
+        return await self._expiring(before, limit)
+
+    async def defer_refresh(self, user_id: str, seconds: float):
+        """
+        Leave the user out of get_expiring for the given seconds (its refresh token
+        was rejected), for every worker/node. Saving or refreshing the user's
+        tokens ends the deferral.
+        """
+        await self._defer(user_id, _now() + seconds)
+
     async def delete_tokens(self, user_id: str):
-        async with aiosqlite.connect(self.db_path) as db:
-            await db.execute("DELETE FROM qlik_tokens WHERE user_id = ?", (user_id,))
-            await db.commit()
-    
+        await self._delete(user_id)
+        self._cache_put(user_id, None)
+
+    async def acquire_refresh_lease(self, user_id: str, ttl: float) -> Optional[str]:
+        """
+        Cross-process lock on refreshing one user's token: returns a lease id, or
+        None while another worker/node holds it. Expires after ttl seconds so a
+        crashed holder cannot block the user forever.
+        """
+        lease = uuid.uuid4().hex
+        if await self._lease(user_id, lease, ttl):
+            return lease
+        return None
+
+    async def release_refresh_lease(self, user_id: str, lease: str):
+        await self._release(user_id, lease)
+
     async def is_token_expired(self, user_id: str) -> bool:
         tokens = await self.get_tokens(user_id)
         if not tokens or not tokens.get("expires_at"):
             return True
-        return datetime.utcnow().timestamp() >= tokens["expires_at"]
+        return _now() >= tokens["expires_at"]
+
+    # Persistência (SQLite); RedisTokenStore sobrescreve estes métodos
+
+    async def _store(self, user_id: str, refresh_token: str, access_token: Optional[str], expires_at: Optional[float], now: float):
+        db = await self._connection()
+        await db.execute("""
+            INSERT OR REPLACE INTO qlik_tokens
+            (user_id, refresh_token, access_token, expires_at, created_at, updated_at)
+            VALUES (?, ?, ?, ?, ?, ?)
+        """, (user_id, refresh_token, access_token, expires_at, now, now))
+        await db.execute("DELETE FROM refresh_failures WHERE user_id = ?", (user_id,))
+        await db.commit()
+
+    async def _load(self, user_id: str) -> Optional[Dict[str, Any]]:
+        db = await self._connection()
+        async with db.execute("""
+            SELECT refresh_token, access_token, expires_at
+            FROM qlik_tokens
+            WHERE user_id = ?
+        """, (user_id,)) as cursor:
+            row = await cursor.fetchone()
+        if not row:
+            return None
+        return {
+            "refresh_token": row["refresh_token"],
+            "access_token": row["access_token"],
+            "expires_at": row["expires_at"]
+        }
+
+    async def _update(self, user_id: str, access_token: str, expires_at: float, now: float) -> bool:
+        db = await self._connection()
+        cursor = await db.execute("""
+            UPDATE qlik_tokens
+            SET access_token = ?, expires_at = ?, updated_at = ?
+            WHERE user_id = ?
+        """, (access_token, expires_at, now, user_id))
+        await db.execute("DELETE FROM refresh_failures WHERE user_id = ?", (user_id,))
+        await db.commit()
+        return bool(cursor.rowcount)
+
+    async def _expiring(self, before: float, limit: int) -> List[str]:
+        # idx_qlik_tokens_expires_at; usuários adiados saem na própria consulta (o LIMIT não é gasto com eles)
+        db = await self._connection()
+        async with db.execute("""
+            SELECT t.user_id FROM qlik_tokens t
+            LEFT JOIN refresh_failures f ON f.user_id = t.user_id
+            WHERE t.expires_at IS NOT NULL AND t.expires_at <= ? AND (f.retry_at IS NULL OR f.retry_at <= ?)
+            ORDER BY t.expires_at
+            LIMIT ?
+        """, (before, _now(), limit)) as cursor:
+            rows = await cursor.fetchall()
+        return [row["user_id"] for row in rows]
+
+    async def _delete(self, user_id: str):
+        db = await self._connection()
+        await db.execute("DELETE FROM qlik_tokens WHERE user_id = ?", (user_id,))
+        await db.execute("DELETE FROM refresh_failures WHERE user_id = ?", (user_id,))
+        await db.commit()
+
+    async def _defer(self, user_id: str, retry_at: float):
+        db = await self._connection()
+        await db.execute(
+            "INSERT OR REPLACE INTO refresh_failures (user_id, retry_at) VALUES (?, ?)", (user_id, retry_at)
+        )
+        await db.commit()
+
+    async def _lease(self, user_id: str, lease: str, ttl: float) -> bool:
+        # Só toma o lease se não existe ou já expirou; a escrita é atômica entre processos no mesmo arquivo
+        now = time.time()
+        db = await self._connection()
+        cursor = await db.execute("""
+            INSERT INTO refresh_leases (user_id, holder, expires_at) VALUES (?, ?, ?)
+            ON CONFLICT(user_id) DO UPDATE SET holder = excluded.holder, expires_at = excluded.expires_at
+            WHERE refresh_leases.expires_at <= ?
+        """, (user_id, lease, now + ttl, now))
+        await db.commit()
+        return bool(cursor.rowcount)
+
+    async def _release(self, user_id: str, lease: str):
+        db = await self._connection()
+        await db.execute("DELETE FROM refresh_leases WHERE user_id = ? AND holder = ?", (user_id, lease))
+        await db.commit()
+
+
+class RedisTokenStore(TokenStore):
+    """
+    TokenStore on Redis (MCP_STORAGE_BACKEND=redis), shared by every MCP node.
+
+    One hash per user (mcp:tokens:<user_id>) plus a sorted set of users by
+    expires_at (mcp:tokens:expires) for the refresh scheduler; writes touching
+    both go in one pipeline. A deferred user is re-scored in the sorted set to
+    its retry time. The in-memory write-through cache is the same.
+    """
+    PREFIX = "mcp:tokens:"
+    EXPIRES_KEY = "mcp:tokens:expires"
+    LEASE_PREFIX = "mcp:tokens-lease:"
+
+    def __init__(self, client: Optional[RedisClient] = None):
+        super().__init__()
+        self.client = client or get_redis_client()
+
+    async def initialize(self):
+        await self.client.execute("PING")
+
+    async def close(self):
+        await self.client.close()
+        self._cache.clear()
+
+    def _expires_command(self, user_id: str, expires_at: Optional[float]) -> Tuple[Any, ...]:
+        if expires_at is None:
+            return ("ZREM", self.EXPIRES_KEY, user_id)
+        return ("ZADD", self.EXPIRES_KEY, expires_at, user_id)
+
+    async def _store(self, user_id: str, refresh_token: str, access_token: Optional[str], expires_at: Optional[float], now: float):
+        key = self.PREFIX + user_id
+        await self.client.pipeline([
+            ("DEL", key),
+            ("HSET", key, "refresh_token", refresh_token, "access_token", access_token or "",
+             "expires_at", "" if expires_at is None else expires_at, "created_at", now, "updated_at", now),
+            self._expires_command(user_id, expires_at),
+        ])
+
+    async def _load(self, user_id: str) -> Optional[Dict[str, Any]]:
+        values = await self.client.execute("HMGET", self.PREFIX + user_id, "refresh_token", "access_token", "expires_at")
+        if not values or values[0] is None:
+            return None
+        return {
+            "refresh_token": values[0],
+            "access_token": values[1] or None,
+            "expires_at": float(values[2]) if values[2] else None,
+        }
+
+    async def _update(self, user_id: str, access_token: str, expires_at: float, now: float) -> bool:
+        key = self.PREFIX + user_id
+        if not await self.client.execute("EXISTS", key):
+            return False
+        await self.client.pipeline([
+            ("HSET", key, "access_token", access_token, "expires_at", expires_at, "updated_at", now),
+            self._expires_command(user_id, expires_at),
+        ])
+        return True
+
+    async def _expiring(self, before: float, limit: int) -> List[str]:
+        return await self.client.execute("ZRANGEBYSCORE", self.EXPIRES_KEY, "-inf", before, "LIMIT", 0, limit) or []
+
+    async def _delete(self, user_id: str):
+        await self.client.pipeline([("DEL", self.PREFIX + user_id), ("ZREM", self.EXPIRES_KEY, user_id)])
+
+    async def _defer(self, user_id: str, retry_at: float):
+        # O sorted set só serve ao scheduler: volta a aparecer em retry_at; gravar tokens restaura o expires_at
+        await self.client.execute("ZADD", self.EXPIRES_KEY, "XX", retry_at, user_id)
+
+    async def _lease(self, user_id: str, lease: str, ttl: float) -> bool:
+        return await self.client.execute("SET", self.LEASE_PREFIX + user_id, lease, "NX", "PX", int(ttl * 1000)) == "OK"
+
+    async def _release(self, user_id: str, lease: str):
+        # Só apaga o próprio lease (se expirou e outro nó pegou, não mexe), numa única operação no servidor
+        await self.client.execute("EVAL", COMPARE_AND_DELETE_SCRIPT, 1, self.LEASE_PREFIX + user_id, lease)
+
+
+def create_token_store() -> TokenStore:
+    """TokenStore for MCP_STORAGE_BACKEND: local SQLite file (default) or Redis."""
+    return RedisTokenStore() if storage_backend() == "redis" else TokenStore()
@@ -0,0 +1,64 @@
+import math
+
+from src.storage.columnar_cache import ColumnarTableBuilder
+from src.storage.exports import column_schema, unique_column_names
+
+
+def _table(columns, rows):
+    builder = ColumnarTableBuilder(columns)
+    builder.add_rows(rows)
+    return builder.build()
+
+
+COLUMNS = [
+    {"name": "Region", "type": "string", "kind": "dimension"},
+    {"name": "Sales", "type": "float64", "kind": "measure"},
+]
+
+
+def test_count_distinct_ignores_nan():
+    table = _table(COLUMNS, [["N", 1.0], ["N", None], ["N", None], ["S", 2.0], ["S", 2.0], ["S", None]])
+    result = table.query(group_by=["Region"], aggregates=[{"func": "count_distinct", "column": "Sales"}], sort=[{"column": "Region"}])
+    assert result["rows"] == [["N", 1], ["S", 1]]
+
+
+def test_count_distinct_all_null_group_is_zero():
+    table = _table(COLUMNS, [["N", None], ["S", 3.0]])
+    result = table.query(group_by=["Region"], aggregates=[{"func": "count_distinct", "column": "Sales"}], sort=[{"column": "Region"}])
+    assert result["rows"] == [["N", 0], ["S", 1]]
+
+
+def test_count_distinct_without_group_by():
+    table = _table(COLUMNS, [["N", 1.0], ["N", None], ["S", 1.0], ["S", 4.0]])
+    assert table.query(aggregates=[{"func": "count_distinct", "column": "Sales"}])["rows"] == [[2]]
+    assert table.query(aggregates=[{"func": "count_distinct", "column": "Region"}])["rows"] == [[2]]
+
+
+def test_column_schema_renames_duplicate_titles():
+    columns = column_schema({
+        "qDimensionInfo": [{"qFallbackTitle": "Year"}],
+        "qMeasureInfo": [{"qFallbackTitle": "Sales"}, {"qFallbackTitle": "Sales"}, {"qFallbackTitle": "Sales (2)"}],
+    })
+    assert [c["name"] for c in columns] == ["Year", "Sales", "Sales (2)", "Sales (2) (2)"]
+
+
+def test_unique_column_names_keeps_unique_columns():
+    assert unique_column_names(COLUMNS) == COLUMNS
+
+
+def test_builder_keeps_duplicate_titled_columns_apart():
+    columns = [
+        {"name": "Sales", "type": "float64", "kind": "measure"},
+        {"name": "Sales", "type": "float64", "kind": "measure"},
+    ]
+    table = _table(columns, [[1.0, 10.0], [2.0, 20.0]])
+    assert table.names == ["Sales", "Sales (2)"]
+    result = table.query(aggregates=[{"func": "sum", "column": "Sales"}, {"func": "sum", "column": "Sales (2)"}])
+    assert result["rows"] == [[3.0, 30.0]]
+
+
+def test_sum_and_avg_skip_nulls():
+    table = _table(COLUMNS, [["N", 1.0], ["N", None], ["N", 3.0]])
+    result = table.query(aggregates=[{"func": "sum", "column": "Sales"}, {"func": "avg", "column": "Sales"}, {"func": "count", "column": "Sales"}])
+    total, avg, count = result["rows"][0]
+    assert total == 4.0 and math.isclose(avg, 2.0) and count == 2